@@ -0,0 +1,39 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import Optional
+
+from app.database.database import engine
+from app.database.export import EXPORT_FORMATS, ExportFilters, export_stream
+
+router = APIRouter()
+
+@router.get("/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    format: str = "arrow",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    is_fraud: Optional[bool] = None,
+    min_risk: Optional[float] = None,
+    max_risk: Optional[float] = None
+):
+    """Stream transactions or fraud_alerts as Arrow IPC, Parquet or NDJSON
+
+    Covers hot and archived months. ``start``/``end`` bound the transaction
+    timestamp (alert created_at); ``min_risk``/``max_risk`` select a risk
+    band [min, max).
+    """
+    filters = ExportFilters(start, end, user_id, is_fraud, min_risk, max_risk)
+    try:
+        chunks = export_stream(engine, dataset, format, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    extension = "arrows" if format == "arrow" else format
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{extension}"'}
+    )
@@ -1,14 +1,59 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime
+import os
 
 from app.database.database import get_db
-from app.database.models import FraudAlert
-from app.models.schemas import FraudAlertResponse
+from app.database.queries import find_alert, list_alerts, update_alerts_status
+from app.models.schemas import AlertBulkUpdate, FraudAlertResponse
+from app.services.alert_counters import alert_counters
+from app.services.transaction_cache import transaction_cache
 
 router = APIRouter()
 
+VALID_STATUSES = ["pending", "reviewed", "resolved", "false_positive"]
+
+# Alerts updated (and cache entries dropped) per commit in a bulk status change
+ALERT_BULK_UPDATE_CHUNK = int(os.getenv("ALERT_BULK_UPDATE_CHUNK", "1000"))
+
+def _check_status(status: str):
+    if status not in VALID_STATUSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid status. Must be one of: {VALID_STATUSES}"
+        )
+
+async def _apply_status(
+    db: Session,
+    status: str,
+    alert_ids: Optional[List[int]] = None,
+    criteria: Optional[Dict] = None
+) -> int:
+    """Update in chunks, adjusting the pending counter and dropping cached transactions per chunk
+
+    Each chunk of ALERT_BULK_UPDATE_CHUNK alerts is its own commit, so
+    memory and the cache invalidation command stay bounded however many
+    alerts a filter matches.
+    """
+    reviewed_at = datetime.now() if status != "pending" else None
+    total = 0
+    while True:
+        updated, pending_delta, touched = await run_in_threadpool(
+            update_alerts_status, db, status, reviewed_at, alert_ids, criteria, ALERT_BULK_UPDATE_CHUNK
+        )
+        await alert_counters.add_pending(pending_delta)
+        if touched:
+            # Cached transaction responses must not outlive a review decision
+            await transaction_cache.invalidate_many(
+                [transaction_id for transaction_id, _ in touched],
+                sorted({user_id for _, user_id in touched})
+            )
+        total += updated
+        if updated < ALERT_BULK_UPDATE_CHUNK:
+            return total
+
 @router.get("/fraud-alerts", response_model=List[FraudAlertResponse])
 async def get_fraud_alerts(
     skip: int = 0,
@@ -16,25 +61,38 @@ async def get_fraud_alerts(
     status: str = None,
     db: Session = Depends(get_db)
 ):
-    """Retrieve fraud alerts"""
-    query = db.query(FraudAlert)
-    
-    if status:
-        query = query.filter(FraudAlert.status == status)
-    
-    alerts = query.order_by(FraudAlert.created_at.desc()).offset(skip).limit(limit).all()
-    return alerts
+    """Retrieve fraud alerts, including archived months"""
+    return list_alerts(db, skip, limit, status)
 
 @router.get("/fraud-alerts/{alert_id}", response_model=FraudAlertResponse)
 async def get_fraud_alert(alert_id: int, db: Session = Depends(get_db)):
     """Get a specific fraud alert by ID"""
-    alert = db.query(FraudAlert).filter(FraudAlert.id == alert_id).first()
+    alert = find_alert(db, alert_id)
     
     if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
     
     return alert
 
+@router.post("/fraud-alerts/bulk-status")
+async def bulk_update_alert_status(update: AlertBulkUpdate, db: Session = Depends(get_db)):
+    """Update the status of many alerts (by ID list and/or filter) in one statement
+
+    Only alerts still in the hot tables are updated; alerts already in the
+    target status are skipped and not counted. Large filters are applied in
+    commits of ALERT_BULK_UPDATE_CHUNK alerts, so a failure part-way leaves
+    the earlier chunks updated.
+    """
+    _check_status(update.status)
+    if update.filter_status is not None:
+        _check_status(update.filter_status)
+    updated = await _apply_status(db, update.status, update.alert_ids, update.criteria())
+    return {
+        "message": "Alert statuses updated",
+        "updated": updated,
+        "pending_alerts": await alert_counters.pending()
+    }
+
 @router.patch("/fraud-alerts/{alert_id}")
 async def update_alert_status(
     alert_id: int,
@@ -42,24 +100,12 @@ async def update_alert_status(
     db: Session = Depends(get_db)
 ):
     """Update fraud alert status"""
-    alert = db.query(FraudAlert).filter(FraudAlert.id == alert_id).first()
+    _check_status(status)
+    await _apply_status(db, status, alert_ids=[alert_id])
+    alert = find_alert(db, alert_id)
     
-    if not alert:
+    # Archived alerts are read-only
+    if not alert or alert['status'] != status:
         raise HTTPException(status_code=404, detail="Alert not found")
     
-    valid_statuses = ["pending", "reviewed", "resolved", "false_positive"]
-    if status not in valid_statuses:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid status. Must be one of: {valid_statuses}"
-        )
-    
-    alert.status = status
-    if status in ["reviewed", "resolved", "false_positive"]:
-        alert.reviewed_at = datetime.now()
-    
-    db.commit()
-    db.refresh(alert)
-    
     return {"message": "Alert status updated", "alert": alert}
-
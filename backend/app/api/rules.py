@@ -0,0 +1,23 @@
+from fastapi import APIRouter, HTTPException
+
+from app.api.transactions import fraud_detector
+
+router = APIRouter()
+
+@router.get("/rules/metrics")
+async def get_rule_metrics():
+    """Per-rule hit counters and rule evaluation timings"""
+    return fraud_detector.rule_engine.metrics()
+
+@router.post("/rules/reload")
+async def reload_rules():
+    """Reload the fraud rule file immediately"""
+    engine = fraud_detector.rule_engine
+    if not engine.reload():
+        raise HTTPException(status_code=400, detail=f"Rule file rejected: {engine.last_reload_error}")
+    return {"message": "Fraud rules reloaded", "rule_count": len(engine.rule_set.rules)}
+
+@router.get("/scoring/cascade")
+async def get_cascade_metrics():
+    """Rows run and skipped per scoring stage, with estimated stage costs"""
+    return fraud_detector.cascade.metrics()
@@ -1,33 +1,94 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from typing import Dict, List
 from datetime import datetime
+import time
+import orjson
 
 from app.database.database import get_db
-from app.database.models import Transaction, FraudAlert
+from app.database.queries import (
+    find_transaction,
+    insert_transaction,
+    list_transactions,
+    transaction_exists,
+    transaction_stats,
+)
 from app.models.schemas import TransactionCreate, TransactionResponse, FraudDetectionResult
-from app.services.fraud_detector import FraudDetector
+from app.services.alert_coalescer import alert_coalescer
+from app.services.alert_counters import alert_counters
+from app.services.admission_control import (
+    RETRY_AFTER_SECONDS,
+    DegradationLevel,
+    admission_controller,
+)
+from app.services.fraud_detector import FRAUD_THRESHOLD, FraudDetector
+from app.services.fraud_graph import fraud_graph
+from app.services.profile_updater import profile_updater
 from app.services.redis_client import redis_client
+from app.services.stream_analytics import stream_analytics
+from app.services.transaction_cache import HISTORY_CACHE_SIZE, transaction_cache
 from app.services.websocket_manager import manager
-from app.services.user_profile_service import update_user_profile
+from app.services.write_behind import write_behind_queue
 
 router = APIRouter()
 fraud_detector = FraudDetector()
 
+DEGRADATION_HEADER = "X-Degradation-Level"
+
+async def admit_transaction():
+    """Admission control for ingest; sheds load with 503 + Retry-After"""
+    level = admission_controller.admit()
+    if level >= DegradationLevel.SHED:
+        raise HTTPException(
+            status_code=503,
+            detail="Server overloaded, retry later",
+            headers={
+                "Retry-After": str(RETRY_AFTER_SECONDS),
+                DEGRADATION_HEADER: str(int(level)),
+            }
+        )
+    try:
+        yield level
+    finally:
+        admission_controller.release()
+
+def _json_ready(row: Dict) -> Dict:
+    """TransactionResponse payload of a freshly inserted row, in field order"""
+    payload = {field: row[field] for field in TransactionResponse.model_fields}
+    for field in ("timestamp", "created_at"):
+        if isinstance(payload[field], datetime):
+            payload[field] = payload[field].isoformat()
+    return payload
+
+def _to_response(transaction) -> dict:
+    """JSON-ready TransactionResponse payload (from a row or dict), as stored in the cache"""
+    return TransactionResponse.model_validate(transaction).model_dump(mode="json")
+
 @router.post("/transactions", response_model=TransactionResponse)
 async def create_transaction(
     transaction: TransactionCreate,
-    background_tasks: BackgroundTasks,
+    level: DegradationLevel = Depends(admit_transaction),
     db: Session = Depends(get_db)
 ):
-    """Ingest a new transaction and perform real-time fraud detection"""
-    
+    """Ingest a new transaction and perform real-time fraud detection
+
+    The X-Degradation-Level response header reports how much of the
+    pipeline ran (see app.services.admission_control), so degraded
+    decisions can be re-scored later.
+
+    The stored row comes back from INSERT ... RETURNING and the response is
+    encoded once with orjson; the same payload feeds the transaction cache
+    and the alert is encoded once for all WebSocket clients.
+    """
+    # The cascade deadline counts from here, not from when scoring starts
+    arrived = time.perf_counter()
+    headers = {DEGRADATION_HEADER: str(int(level))}
+
     # Check if transaction already exists
-    existing = db.query(Transaction).filter(
-        Transaction.transaction_id == transaction.transaction_id
-    ).first()
-    if existing:
+    async with admission_controller.stage("db"):
+        exists = await run_in_threadpool(transaction_exists, db, transaction.transaction_id)
+    if exists:
         raise HTTPException(status_code=400, detail="Transaction already exists")
 
     # Get user profile for behavioral analysis
@@ -42,45 +103,55 @@ async def create_transaction(
     if isinstance(transaction_dict.get('timestamp'), datetime):
         transaction_dict['timestamp'] = transaction_dict['timestamp'].isoformat()
 
-    # Perform fraud detection
-    fraud_result = await fraud_detector.detect_fraud(transaction_dict, user_profile)
+    # Link the user into the fraud-ring graph and read its component features
+    graph_features = fraud_graph.link(transaction_dict)
 
-    # Create transaction record
-    db_transaction = Transaction(
-        user_id=transaction.user_id,
-        transaction_id=transaction.transaction_id,
-        amount=transaction.amount,
-        merchant=transaction.merchant,
-        category=transaction.category,
-        location=transaction.location,
-        latitude=transaction.latitude,
-        longitude=transaction.longitude,
-        timestamp=transaction.timestamp or datetime.now(),
-        is_fraud=fraud_result['is_fraud'],
-        risk_score=fraud_result['risk_score'],
-        fraud_reason="; ".join(fraud_result['reasons']) if fraud_result['reasons'] else None
-    )
+    # Perform fraud detection (rules only when degraded)
+    async with admission_controller.stage("scoring"):
+        fraud_result = (await run_in_threadpool(
+            fraud_detector.score_batch,
+            [transaction_dict],
+            [user_profile],
+            rules_only=level >= DegradationLevel.RULES_ONLY,
+            graph_features=[graph_features],
+            started=arrived
+        ))[0]
+    # Only evidence other than the ring rules flags a user, so ring points
+    # cannot feed back into the ring's own fraud density
+    if fraud_result['risk_score'] - fraud_result['ring_points'] >= FRAUD_THRESHOLD:
+        fraud_graph.mark_fraud(transaction.user_id)
+    headers["X-Scoring-Stages"] = ",".join(fraud_result['stages_run'])
 
-    db.add(db_transaction)
-    db.commit()
-    db.refresh(db_transaction)
+    # Create transaction record
+    values = {
+        "user_id": transaction.user_id,
+        "transaction_id": transaction.transaction_id,
+        "amount": transaction.amount,
+        "merchant": transaction.merchant,
+        "category": transaction.category,
+        "location": transaction.location,
+        "latitude": transaction.latitude,
+        "longitude": transaction.longitude,
+        "timestamp": transaction.timestamp or datetime.now(),
+        "is_fraud": fraud_result['is_fraud'],
+        "risk_score": fraud_result['risk_score'],
+        "fraud_reason": "; ".join(fraud_result['reasons']) if fraud_result['reasons'] else None
+    }
 
     # Create fraud alert if detected (for high risk and fraud)
     # Lower threshold for demo: >= 50 for high risk alerts
+    alert_row = None
+    alert_message = None
     if fraud_result['is_fraud'] or fraud_result['risk_score'] >= 50:
-        alert = FraudAlert(
-            transaction_id=transaction.transaction_id,
-            user_id=transaction.user_id,
-            risk_score=fraud_result['risk_score'],
-            alert_type=fraud_result['alert_type'],
-            description="; ".join(fraud_result['reasons']),
-            status="pending"
-        )
-        db.add(alert)
-        db.commit()
-
-        # Broadcast alert via WebSocket
-        await manager.broadcast({
+        alert_row = {
+            "transaction_id": transaction.transaction_id,
+            "user_id": transaction.user_id,
+            "risk_score": fraud_result['risk_score'],
+            "alert_type": fraud_result['alert_type'],
+            "description": "; ".join(fraud_result['reasons']),
+            "status": "pending"
+        }
+        alert_message = {
             "type": "fraud_alert",
             "data": {
                 "transaction_id": transaction.transaction_id,
@@ -90,23 +161,52 @@ async def create_transaction(
                 "description": "; ".join(fraud_result['reasons']),
                 "timestamp": datetime.now().isoformat()
             }
-        })
+        }
 
-    # Update user profile in background
-    background_tasks.add_task(
-        update_user_profile,
-        transaction.user_id,
-        transaction_dict,
-        db
+    # Bursts for the same user within the coalescing window merge into the
+    # window's first alert, which is updated shortly and re-broadcast once at
+    # window end
+    if alert_row is not None and alert_coalescer.add(alert_row, transaction.merchant):
+        alert_row = None
+
+    # Under heavy load the alert insert and broadcast are deferred
+    deferred = (
+        alert_row is not None
+        and level >= DegradationLevel.DEFER_ALERTS
+        and write_behind_queue.enqueue_alert(alert_row, alert_message)
     )
+    alert = alert_row if alert_row is not None and not deferred else None
+
+    async with admission_controller.stage("db"):
+        row = await run_in_threadpool(insert_transaction, db, values, alert)
+    # Only a committed alert row can take coalesced members
+    if alert is not None:
+        alert_coalescer.open(alert, transaction.merchant)
 
-    # Cache transaction
-    await redis_client.cache_transaction(
-        transaction.transaction_id,
-        transaction_dict
+    stream_analytics.observe(
+        transaction.user_id,
+        transaction.merchant,
+        transaction.category,
+        transaction.amount,
+        fraud_result['risk_score']
     )
 
-    return db_transaction
+    # Broadcast alert via WebSocket
+    if alert is not None:
+        await alert_counters.add_pending(1)
+        async with admission_controller.stage("broadcast"):
+            await manager.broadcast_encoded(orjson.dumps(alert_message))
+
+    # Update user profile in the background (coalesced per user)
+    if level < DegradationLevel.SKIP_PROFILE_UPDATE:
+        profile_updater.enqueue(transaction.user_id, transaction_dict)
+
+    # Cache the full response (including the scoring result)
+    payload = _json_ready(row)
+    body = orjson.dumps(payload)
+    await transaction_cache.record_transaction(payload, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("/transactions", response_model=List[TransactionResponse])
 async def get_transactions(
@@ -115,46 +215,50 @@ async def get_transactions(
     user_id: str = None,
     db: Session = Depends(get_db)
 ):
-    """Retrieve transaction history"""
-    query = db.query(Transaction)
-    
-    if user_id:
-        query = query.filter(Transaction.user_id == user_id)
-    
-    transactions = query.order_by(Transaction.timestamp.desc()).offset(skip).limit(limit).all()
-    return transactions
+    """Retrieve transaction history, including archived months
+
+    Per-user history reads through the transaction cache when the page
+    falls within the newest HISTORY_CACHE_SIZE transactions.
+    """
+    if user_id and transaction_cache.history_cacheable(skip, limit):
+        cached = await transaction_cache.get_history(user_id, skip, limit)
+        if cached is not None:
+            return cached
+        generation = await transaction_cache.history_generation(user_id)
+        recent = [_to_response(t) for t in list_transactions(db, 0, HISTORY_CACHE_SIZE, user_id)]
+        await transaction_cache.store_history(user_id, recent, generation)
+        return recent[skip:skip + limit]
+
+    return list_transactions(db, skip, limit, user_id)
 
 @router.get("/transactions/stats")
 async def get_transaction_stats(db: Session = Depends(get_db)):
-    """Get real-time transaction statistics"""
-    total_count = db.query(func.count(Transaction.id)).scalar() or 0
-    total_amount = db.query(func.sum(Transaction.amount)).scalar() or 0
-    
-    fraud_count = db.query(func.count(Transaction.id)).filter(Transaction.is_fraud == True).scalar() or 0
-    high_risk_count = db.query(func.count(Transaction.id)).filter(Transaction.risk_score >= 70).scalar() or 0
-    
-    avg_risk = db.query(func.avg(Transaction.risk_score)).scalar()
-    avg_risk = float(avg_risk) if avg_risk else 0.0
-    
-    pending_alerts = db.query(func.count(FraudAlert.id)).filter(FraudAlert.status == 'pending').scalar() or 0
-    
-    return {
-        "total_transactions": total_count,
-        "total_amount": float(total_amount),
-        "fraud_count": fraud_count,
-        "high_risk_count": high_risk_count,
-        "avg_risk_score": round(avg_risk, 2),
-        "pending_alerts": pending_alerts
-    }
+    """Get real-time transaction statistics (hot and archived)
+
+    pending_alerts comes from the maintained counter when it is available.
+    ``streaming`` holds approximate distinct users/merchants and risk score
+    and amount percentiles over the last 5m, 1h and 24h, overall and by
+    category (see app.services.stream_analytics).
+    """
+    stats = transaction_stats(db, await alert_counters.pending())
+    stats["streaming"] = stream_analytics.summary()
+    return stats
 
 @router.get("/transactions/{transaction_id}", response_model=TransactionResponse)
 async def get_transaction(transaction_id: str, db: Session = Depends(get_db)):
-    """Get a specific transaction by ID"""
-    transaction = db.query(Transaction).filter(
-        Transaction.transaction_id == transaction_id
-    ).first()
+    """Get a specific transaction by ID (read-through cached, including misses)"""
+    hit, cached = await transaction_cache.get(transaction_id)
+    if hit:
+        if cached is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        return cached
+
+    transaction = find_transaction(db, transaction_id)
     
     if not transaction:
+        await transaction_cache.store_missing(transaction_id)
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    return transaction
+    response = _to_response(transaction)
+    await transaction_cache.store(response)
+    return response
@@ -0,0 +1,255 @@
+"""
+Parquet archive of cold transaction and alert partitions
+
+Layout: ARCHIVE_DIR/<table>/<YYYY-MM>/part-<unix ms>.parquet, zstd
+compressed. Rows are sorted by user_id then time so row-group statistics let
+per-user reads skip most of each file. Timestamps are stored as naive UTC.
+
+Archived files are immutable, so per-file aggregates are computed once and
+cached by path and modification time.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, Table
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_ROW_GROUP_SIZE = int(os.getenv("ARCHIVE_ROW_GROUP_SIZE", "65536"))
+
+_stats_cache: Dict[Tuple[str, float], Dict] = {}
+_max_cache: Dict[Tuple[str, float, str], object] = {}
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow is required for the Parquet archive")
+    return pyarrow
+
+
+def naive_utc(value):
+    """Timestamps in the archive and in comparisons against it are naive UTC"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def arrow_schema(table: Table):
+    """Arrow schema matching a table's columns"""
+    pa = require_pyarrow()
+    fields = []
+    for c in table.columns:
+        if isinstance(c.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(c.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(c.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(c.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(c.name, arrow_type, nullable=True))
+    return pa.schema(fields)
+
+
+def archive_files(table_name: str, archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    root = os.path.join(archive_dir, table_name)
+    if not os.path.isdir(root):
+        return []
+    files = []
+    for month in sorted(os.listdir(root)):
+        month_dir = os.path.join(root, month)
+        files.extend(
+            os.path.join(month_dir, name)
+            for name in sorted(os.listdir(month_dir))
+            if name.endswith(".parquet")
+        )
+    return files
+
+
+def write_archive(
+    table: Table,
+    month: datetime,
+    batches: Iterable[List[Dict]],
+    archive_dir: str = ARCHIVE_DIR
+) -> Tuple[str, int]:
+    """Write row batches (already in user_id, time order) to a new part file
+
+    Written under a temporary name and renamed once complete; returns the
+    path and the number of rows written.
+    """
+    pa = require_pyarrow()
+    schema = arrow_schema(table)
+    month_dir = os.path.join(archive_dir, table.name, f"{month:%Y-%m}")
+    os.makedirs(month_dir, exist_ok=True)
+    path = os.path.join(month_dir, f"part-{int(time.time() * 1000)}.parquet")
+    tmp_path = f"{path}.tmp"
+
+    writer = None
+    rows = 0
+    try:
+        for batch in batches:
+            if not batch:
+                continue
+            for row in batch:
+                for key, value in row.items():
+                    row[key] = naive_utc(value)
+            if writer is None:
+                writer = pa.parquet.ParquetWriter(tmp_path, schema, compression="zstd")
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema), row_group_size=ARCHIVE_ROW_GROUP_SIZE)
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        return "", 0
+    if pa.parquet.read_metadata(tmp_path).num_rows != rows:
+        os.remove(tmp_path)
+        raise RuntimeError(f"Archive row count mismatch for {path}")
+    os.replace(tmp_path, path)
+    return path, rows
+
+
+def _filter_expression(pa, filters: Optional[List[Tuple[str, str, object]]]):
+    expression = None
+    for column, op, value in filters or []:
+        field = pa.dataset.field(column)
+        value = naive_utc(value)
+        condition = {
+            "==": field == value,
+            ">=": field >= value,
+            "<=": field <= value,
+            ">": field > value,
+            "<": field < value,
+        }[op]
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _file_max(path: str, column: str):
+    """Largest value of ``column`` in a file from its row-group statistics (None if unknown)"""
+    key = (path, os.path.getmtime(path), column)
+    if key not in _max_cache:
+        pa = require_pyarrow()
+        metadata = pa.parquet.read_metadata(path)
+        names = metadata.schema.names
+        largest = None
+        if column in names and metadata.num_row_groups:
+            index = names.index(column)
+            for i in range(metadata.num_row_groups):
+                stats = metadata.row_group(i).column(index).statistics
+                if stats is None or not stats.has_min_max:
+                    largest = None
+                    break
+                largest = stats.max if largest is None else max(largest, stats.max)
+        _max_cache[key] = largest
+    return _max_cache[key]
+
+
+def _newest_rows(pa, schema, files: List[str], expression, order_by: str, limit: int):
+    """Top ``limit`` rows by ``order_by`` without loading every match
+
+    Files are visited newest first by their largest ``order_by`` value and
+    scanned batch by batch, keeping only the current top rows. Once there
+    are ``limit`` rows, later files are read only for rows at least as new
+    as the last of them, and the scan stops at the first file whose largest
+    value is older.
+    """
+    # Files without statistics come first so they are always read
+    ordered = sorted(
+        ((_file_max(path, order_by), path) for path in files),
+        key=lambda item: (item[0] is None, item[0]),
+        reverse=True,
+    )
+
+    top = None
+    cutoff = None
+    for largest, path in ordered:
+        file_filter = expression
+        if cutoff is not None:
+            if largest is not None and naive_utc(largest) < cutoff:
+                break
+            bound = pa.dataset.field(order_by) >= cutoff
+            file_filter = bound if file_filter is None else file_filter & bound
+        scanner = pa.dataset.dataset(path, format="parquet", schema=schema).scanner(filter=file_filter)
+        for batch in scanner.to_batches():
+            if not batch.num_rows:
+                continue
+            batch_table = pa.Table.from_batches([batch])
+            top = batch_table if top is None else pa.concat_tables([top, batch_table])
+            top = top.sort_by([(order_by, "descending")]).slice(0, limit)
+        if top is not None and top.num_rows >= limit:
+            cutoff = top.column(order_by)[limit - 1].as_py()
+    return top.to_pylist() if top is not None else []
+
+
+def read_archive(
+    table_name: str,
+    filters: Optional[List[Tuple[str, str, object]]] = None,
+    order_by: Optional[str] = None,
+    limit: Optional[int] = None,
+    archive_dir: str = ARCHIVE_DIR
+) -> List[Dict]:
+    """Archived rows matching ``filters`` ([(column, op, value)], ANDed)
+
+    With ``order_by`` the rows come back newest first on that column and at
+    most ``limit`` of them; memory is bounded by ``limit`` plus one scan
+    batch. Without ``order_by``, ``limit`` returns the first matches found.
+    """
+    files = archive_files(table_name, archive_dir)
+    if not files:
+        return []
+    pa = require_pyarrow()
+    # Files written before a column was added read it as null
+    from app.database.partitions import PARTITIONED_TABLES
+    schema = arrow_schema(PARTITIONED_TABLES[table_name])
+    expression = _filter_expression(pa, filters)
+
+    if order_by and limit is not None:
+        return _newest_rows(pa, schema, files, expression, order_by, limit)
+
+    dataset = pa.dataset.dataset(files, format="parquet", schema=schema)
+    if limit is not None:
+        return dataset.head(limit, filter=expression).to_pylist()
+    table = dataset.to_table(filter=expression)
+    if order_by:
+        table = table.sort_by([(order_by, "descending")])
+    return table.to_pylist()
+
+
+def _file_stats(path: str) -> Dict:
+    key = (path, os.path.getmtime(path))
+    stats = _stats_cache.get(key)
+    if stats is None:
+        pa = require_pyarrow()
+        pc = pa.compute
+        table = pa.parquet.read_table(path, columns=["amount", "is_fraud", "risk_score"])
+        risk = table.column("risk_score")
+        stats = {
+            "count": table.num_rows,
+            "amount": pc.sum(table.column("amount")).as_py() or 0.0,
+            "fraud": pc.sum(pc.cast(table.column("is_fraud"), pa.int64())).as_py() or 0,
+            "high_risk": pc.sum(pc.cast(pc.greater_equal(risk, 70), pa.int64())).as_py() or 0,
+            "risk_sum": pc.sum(risk).as_py() or 0.0,
+            "risk_count": pc.count(risk).as_py(),
+        }
+        _stats_cache[key] = stats
+    return stats
+
+
+def archived_transaction_stats(archive_dir: str = ARCHIVE_DIR) -> Dict:
+    """Totals over all archived transactions (same fields as _file_stats)"""
+    totals = {"count": 0, "amount": 0.0, "fraud": 0, "high_risk": 0, "risk_sum": 0.0, "risk_count": 0}
+    for path in archive_files("transactions", archive_dir):
+        for key, value in _file_stats(path).items():
+            totals[key] += value
+    return totals
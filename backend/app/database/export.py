@@ -0,0 +1,222 @@
+"""
+Streaming bulk export of transactions and fraud alerts
+
+Rows are read with Core selects (no ORM objects or Pydantic models) in
+chunks of EXPORT_CHUNK_SIZE: PostgreSQL streams each table through a
+server-side cursor, SQLite pages by primary key. Archived months are scanned
+batch by batch from Parquet. Every chunk is converted to an Arrow record
+batch and encoded immediately, so memory stays bounded by the chunk size
+whatever the result size.
+
+Formats: ``arrow`` (Arrow IPC stream), ``parquet`` and ``ndjson``. Rows are
+in primary-key order within each table; hot rows come before archived ones.
+"""
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from app.database.archive import archive_files, arrow_schema, naive_utc, require_pyarrow
+from app.database.partitions import PARTITIONED_TABLES, hot_tables
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "ndjson": "application/x-ndjson",
+}
+
+# Column the time range filter applies to
+TIME_COLUMNS = {"transactions": "timestamp", "fraud_alerts": "created_at"}
+
+
+@dataclass
+class ExportFilters:
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    user_id: Optional[str] = None
+    is_fraud: Optional[bool] = None
+    min_risk: Optional[float] = None
+    max_risk: Optional[float] = None
+
+    def clauses(self, table, dataset: str) -> List:
+        time_column = table.c[TIME_COLUMNS[dataset]]
+        clauses = []
+        if self.start is not None:
+            clauses.append(time_column >= self.start)
+        if self.end is not None:
+            clauses.append(time_column < self.end)
+        if self.user_id is not None:
+            clauses.append(table.c.user_id == self.user_id)
+        if self.is_fraud is not None:
+            clauses.append(table.c.is_fraud == self.is_fraud)
+        if self.min_risk is not None:
+            clauses.append(table.c.risk_score >= self.min_risk)
+        if self.max_risk is not None:
+            clauses.append(table.c.risk_score < self.max_risk)
+        return clauses
+
+    def expression(self, dataset: str):
+        """The same filters as a pyarrow dataset expression, or None"""
+        pa = require_pyarrow()
+        time_field = pa.dataset.field(TIME_COLUMNS[dataset])
+        conditions = []
+        if self.start is not None:
+            conditions.append(time_field >= naive_utc(self.start))
+        if self.end is not None:
+            conditions.append(time_field < naive_utc(self.end))
+        if self.user_id is not None:
+            conditions.append(pa.dataset.field("user_id") == self.user_id)
+        if self.is_fraud is not None:
+            conditions.append(pa.dataset.field("is_fraud") == self.is_fraud)
+        if self.min_risk is not None:
+            conditions.append(pa.dataset.field("risk_score") >= self.min_risk)
+        if self.max_risk is not None:
+            conditions.append(pa.dataset.field("risk_score") < self.max_risk)
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+
+def validate_filters(dataset: str, filters: ExportFilters):
+    if dataset not in PARTITIONED_TABLES:
+        raise ValueError(f"Unknown dataset '{dataset}' (expected one of {list(PARTITIONED_TABLES)})")
+    if dataset == "fraud_alerts" and filters.is_fraud is not None:
+        raise ValueError("is_fraud only applies to transactions")
+
+
+def _row_chunks(engine: Engine, table, clauses: List, chunk_size: int) -> Iterator[List[tuple]]:
+    if engine.dialect.name == "sqlite":
+        # SQLite cannot keep a read cursor open while ingest writes, so page by id
+        last_id = None
+        while True:
+            stmt = select(table).where(*clauses)
+            if last_id is not None:
+                stmt = stmt.where(table.c.id > last_id)
+            with engine.connect() as conn:
+                rows = conn.execute(stmt.order_by(table.c.id).limit(chunk_size)).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
+    else:
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+                select(table).where(*clauses).order_by(table.c.id)
+            )
+            for rows in result.partitions():
+                yield rows
+
+
+def iter_record_batches(
+    engine: Engine,
+    dataset: str,
+    filters: ExportFilters,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator:
+    """Arrow record batches for every matching hot and archived row"""
+    pa = require_pyarrow()
+    schema = arrow_schema(PARTITIONED_TABLES[dataset])
+
+    with engine.connect() as conn:
+        tables = hot_tables(conn, dataset)
+    for table in tables:
+        for rows in _row_chunks(engine, table, filters.clauses(table, dataset), chunk_size):
+            columns = list(zip(*rows))
+            arrays = []
+            for field, values in zip(schema, columns):
+                if pa.types.is_timestamp(field.type):
+                    values = [naive_utc(v) for v in values]
+                arrays.append(pa.array(values, type=field.type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    files = archive_files(dataset)
+    if files:
+        archive = pa.dataset.dataset(files, format="parquet", schema=schema)
+        for batch in archive.to_batches(filter=filters.expression(dataset), batch_size=chunk_size):
+            if batch.num_rows:
+                yield batch
+
+
+class _ChunkSink:
+    """Write-only file object whose contents are drained after each batch"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _ndjson_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_batches(batches: Iterator, dataset: str, fmt: str) -> Iterator[bytes]:
+    """Encode record batches to ``fmt``, yielding bytes as each batch is done"""
+    pa = require_pyarrow()
+    schema = arrow_schema(PARTITIONED_TABLES[dataset])
+
+    if fmt == "ndjson":
+        for batch in batches:
+            lines = [json.dumps(row, default=_ndjson_default) for row in batch.to_pylist()]
+            yield ("\n".join(lines) + "\n").encode()
+        return
+
+    sink = _ChunkSink()
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+    elif fmt == "parquet":
+        writer = pa.parquet.ParquetWriter(sink, schema, compression="zstd")
+        write = writer.write_batch
+    else:
+        raise ValueError(f"Unknown export format '{fmt}' (expected one of {list(EXPORT_FORMATS)})")
+
+    for batch in batches:
+        write(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(
+    engine: Engine,
+    dataset: str,
+    fmt: str,
+    filters: ExportFilters,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    validate_filters(dataset, filters)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}' (expected one of {list(EXPORT_FORMATS)})")
+    return encode_batches(iter_record_batches(engine, dataset, filters, chunk_size), dataset, fmt)
@@ -1,9 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, Index
 from sqlalchemy.sql import func
 from app.database.database import Base
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    # Ids must never be reused once rows move to monthly partitions
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, index=True, nullable=False)
@@ -22,6 +24,11 @@ class Transaction(Base):
 
 class FraudAlert(Base):
     __tablename__ = "fraud_alerts"
+    __table_args__ = (
+        # Review queue: WHERE status = ? ORDER BY created_at DESC
+        Index("ix_fraud_alerts_status_created_at", "status", "created_at"),
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     transaction_id = Column(String, index=True, nullable=False)
@@ -30,6 +37,10 @@ class FraudAlert(Base):
     alert_type = Column(String, nullable=False)  # 'anomaly', 'behavioral', 'pattern'
     description = Column(Text, nullable=False)
     status = Column(String, default="pending", nullable=False)  # 'pending', 'reviewed', 'resolved', 'false_positive'
+    # Coalesced bursts: JSON list of member transaction ids, their count and highest risk
+    member_transaction_ids = Column(Text, nullable=True)
+    transaction_count = Column(Integer, server_default="1", nullable=True)
+    max_risk_score = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     reviewed_at = Column(DateTime(timezone=True), nullable=True)
 
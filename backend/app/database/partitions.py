@@ -0,0 +1,206 @@
+"""
+Monthly time partitioning of the transactions and fraud_alerts tables
+
+Rows are partitioned on created_at, which the database assigns, so a month
+stops receiving writes once it is over and can be archived safely.
+
+PostgreSQL: the tables are native RANGE partitioned parents with one child
+per month (``transactions_p2024_06``) plus a DEFAULT partition as a safety
+net; the ORM keeps writing to the parent. SQLite: the ORM table holds the
+current month and ``roll_partitions`` moves older rows into per-month tables
+with the same names.
+
+HOT_PARTITIONS months (including the current one) stay in the database; the
+retention job (app.jobs.retention) archives older months to Parquet. Enable
+with PARTITIONING_ENABLED=true; it only applies to tables it creates, so an
+existing unpartitioned PostgreSQL table keeps working as before.
+"""
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Index, MetaData, PrimaryKeyConstraint, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.database.models import FraudAlert, Transaction
+
+PARTITIONING_ENABLED = os.getenv("PARTITIONING_ENABLED", "false").lower() == "true"
+HOT_PARTITIONS = int(os.getenv("HOT_PARTITIONS", "3"))
+
+PARTITIONED_TABLES: Dict[str, Table] = {
+    "transactions": Transaction.__table__,
+    "fraud_alerts": FraudAlert.__table__,
+}
+
+_PARTITION_RE = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table_name: str, month: datetime) -> str:
+    return f"{table_name}_p{month.year:04d}_{month.month:02d}"
+
+
+def parse_partition_name(name: str) -> Optional[tuple]:
+    """(table name, month) for a partition table name, else None"""
+    match = _PARTITION_RE.match(name)
+    if not match:
+        return None
+    return match.group("table"), datetime(int(match.group("year")), int(match.group("month")), 1)
+
+
+def hot_cutoff(now: Optional[datetime] = None, hot_partitions: int = HOT_PARTITIONS) -> datetime:
+    """Start of the oldest month that stays in the database"""
+    return add_months(month_start(now or datetime.utcnow()), -(hot_partitions - 1))
+
+
+def partition_table(table_name: str, month: datetime) -> Table:
+    """Table object for one month's partition (same columns as the ORM table)"""
+    source = PARTITIONED_TABLES[table_name]
+    name = partition_name(table_name, month)
+    table = Table(
+        name, MetaData(),
+        *[Column(c.name, c.type, nullable=c.nullable, primary_key=c.primary_key) for c in source.columns]
+    )
+    for index in source.indexes:
+        if len(index.columns) > 1:
+            Index(index.name.replace(table_name, name, 1), *[table.c[c.name] for c in index.columns])
+    return table
+
+
+def list_partitions(connection: Connection, table_name: str) -> List[datetime]:
+    """Months that have their own partition table, oldest first"""
+    months = []
+    for name in inspect(connection).get_table_names():
+        parsed = parse_partition_name(name)
+        if parsed and parsed[0] == table_name:
+            months.append(parsed[1])
+    return sorted(months)
+
+
+def is_partitioned(connection: Connection, table_name: str) -> bool:
+    if not PARTITIONING_ENABLED:
+        return False
+    if connection.dialect.name == "postgresql":
+        return connection.execute(
+            text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                 "WHERE c.relname = :name"),
+            {"name": table_name}
+        ).first() is not None
+    return connection.dialect.name == "sqlite"
+
+
+def _create_postgres_parent(connection: Connection, table: Table):
+    """Partitioned parent: created_at joins the primary key, as PostgreSQL requires"""
+    metadata = MetaData()
+    columns = []
+    for c in table.columns:
+        column = Column(
+            c.name, c.type,
+            nullable=False if c.name == "created_at" else c.nullable,
+            server_default=c.server_default.arg if c.server_default is not None else None,
+            autoincrement=True if c.name == "id" else False,
+        )
+        columns.append(column)
+    parent = Table(
+        table.name, metadata, *columns,
+        PrimaryKeyConstraint("id", "created_at"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    # Unique indexes must include the partition key, so transaction_id is a
+    # plain index here; ingest already checks for duplicates before inserting
+    for c in table.columns:
+        if c.index or c.unique:
+            Index(f"ix_{table.name}_{c.name}", parent.c[c.name])
+    for index in table.indexes:
+        if len(index.columns) > 1:
+            Index(index.name, *[parent.c[c.name] for c in index.columns])
+    metadata.create_all(connection)
+    print(f"Created partitioned table {table.name}")
+
+
+def create_partitioned_tables(engine: Engine):
+    """Create partitioned PostgreSQL parents before Base.metadata.create_all"""
+    if not PARTITIONING_ENABLED or engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        existing = set(inspect(connection).get_table_names())
+        for table_name, table in PARTITIONED_TABLES.items():
+            if table_name not in existing:
+                _create_postgres_parent(connection, table)
+
+
+def ensure_partitions(engine: Engine, now: Optional[datetime] = None):
+    """Create partitions for the hot months and the next month
+
+    On SQLite this also rolls rows from past months out of the ORM tables.
+    """
+    if not PARTITIONING_ENABLED:
+        return
+    current = month_start(now or datetime.utcnow())
+    months = [add_months(hot_cutoff(current), i) for i in range(HOT_PARTITIONS + 1)]
+
+    with engine.begin() as connection:
+        for table_name in PARTITIONED_TABLES:
+            if not is_partitioned(connection, table_name):
+                continue
+            if connection.dialect.name == "postgresql":
+                for month in months:
+                    connection.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {partition_name(table_name, month)} "
+                        f"PARTITION OF {table_name} FOR VALUES FROM ('{month:%Y-%m-%d}') "
+                        f"TO ('{add_months(month, 1):%Y-%m-%d}')"
+                    ))
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {table_name}_default PARTITION OF {table_name} DEFAULT"
+                ))
+            else:
+                roll_partitions(connection, table_name, current)
+
+
+def roll_partitions(connection: Connection, table_name: str, current: datetime) -> int:
+    """SQLite: move rows created before ``current`` into per-month tables"""
+    source = PARTITIONED_TABLES[table_name]
+    old_months = connection.execute(
+        text(f"SELECT DISTINCT strftime('%Y-%m', created_at) FROM {table_name} WHERE created_at < :current"),
+        {"current": current}
+    ).scalars().all()
+
+    moved = 0
+    column_list = ", ".join(c.name for c in source.columns)
+    for value in old_months:
+        month = datetime.strptime(value, "%Y-%m")
+        target = partition_table(table_name, month)
+        target.create(connection, checkfirst=True)
+        bounds = {"start": month, "end": add_months(month, 1)}
+        moved += connection.execute(text(
+            f"INSERT INTO {target.name} ({column_list}) SELECT {column_list} FROM {table_name} "
+            f"WHERE created_at >= :start AND created_at < :end"
+        ), bounds).rowcount
+        connection.execute(text(
+            f"DELETE FROM {table_name} WHERE created_at >= :start AND created_at < :end"
+        ), bounds)
+    if moved:
+        print(f"Moved {moved} rows from {table_name} into monthly partitions")
+    return moved
+
+
+def hot_tables(connection: Connection, table_name: str) -> List[Table]:
+    """Tables holding the hot rows of ``table_name``, newest first
+
+    PostgreSQL partition pruning happens inside the parent, so only SQLite
+    returns more than one table.
+    """
+    source = PARTITIONED_TABLES[table_name]
+    if not PARTITIONING_ENABLED or connection.dialect.name != "sqlite":
+        return [source]
+    months = list_partitions(connection, table_name)
+    return [source] + [partition_table(table_name, month) for month in reversed(months)]
@@ -0,0 +1,273 @@
+"""
+Query layer spanning hot (database) and archived (Parquet) rows
+
+The list, lookup and analytics endpoints go through here so they see one
+logical table regardless of partitioning. Results are plain dicts.
+
+Newest-first pages are answered from the hot tables first; the archive is
+only read for rows at least as new as the last hot row on the page (row-group
+statistics skip the rest). When the hot rows run out, archive files are read
+newest first and only until the page is filled.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, union_all, update
+from sqlalchemy.orm import Session
+
+from app.database.archive import archived_transaction_stats, naive_utc, read_archive
+from app.database.partitions import PARTITIONED_TABLES, hot_tables
+
+HIGH_RISK_SCORE = 70
+
+
+def _hot_rows(db: Session, table_name: str, where, order_column: str, limit: Optional[int]) -> List[Dict]:
+    """Rows across the hot tables; ``where`` maps a table to its filter clauses"""
+    tables = hot_tables(db.connection(), table_name)
+    selects = [select(t).where(*where(t)) for t in tables]
+    if len(selects) == 1:
+        stmt = selects[0].order_by(tables[0].c[order_column].desc())
+    else:
+        combined = union_all(*selects).subquery()
+        stmt = select(combined).order_by(combined.c[order_column].desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [dict(row._mapping) for row in db.execute(stmt)]
+
+
+def _newest_first(
+    db: Session,
+    table_name: str,
+    where,
+    filters: List[tuple],
+    order_column: str,
+    skip: int,
+    limit: int
+) -> List[Dict]:
+    wanted = skip + limit
+    rows = _hot_rows(db, table_name, where, order_column, wanted)
+
+    archive_filters = list(filters)
+    if len(rows) == wanted:
+        archive_filters.append((order_column, ">=", rows[-1][order_column]))
+    archived = read_archive(table_name, archive_filters, order_by=order_column, limit=wanted)
+    if archived:
+        rows = sorted(rows + archived, key=lambda r: naive_utc(r[order_column]), reverse=True)
+    return rows[skip:wanted]
+
+
+def list_transactions(db: Session, skip: int = 0, limit: int = 100, user_id: Optional[str] = None) -> List[Dict]:
+    """Transactions newest first by timestamp, optionally for one user"""
+    def where(t):
+        return [t.c.user_id == user_id] if user_id else []
+
+    filters = [("user_id", "==", user_id)] if user_id else []
+    return _newest_first(db, "transactions", where, filters, "timestamp", skip, limit)
+
+
+def find_transaction(db: Session, transaction_id: str) -> Optional[Dict]:
+    rows = _hot_rows(db, "transactions", lambda t: [t.c.transaction_id == transaction_id], "id", 1)
+    if rows:
+        return rows[0]
+    archived = read_archive("transactions", [("transaction_id", "==", transaction_id)], limit=1)
+    return archived[0] if archived else None
+
+
+def transaction_exists(db: Session, transaction_id: str) -> bool:
+    """Duplicate check for ingest, across the hot tables and the archive
+
+    Transaction ids are unique regardless of user, so the archive is
+    matched on the id alone.
+    """
+    for t in hot_tables(db.connection(), "transactions"):
+        if db.execute(select(t.c.id).where(t.c.transaction_id == transaction_id).limit(1)).first():
+            return True
+    return bool(read_archive("transactions", [("transaction_id", "==", transaction_id)], limit=1))
+
+
+def insert_transaction(db: Session, values: Dict, alert: Optional[Dict] = None) -> Dict:
+    """Insert a transaction and its alert (if any) in a single commit
+
+    The server-generated columns (id, timestamp, created_at) come back from
+    INSERT ... RETURNING and are merged into ``values``, so the stored row
+    is returned without reading it back; dialects without RETURNING fall
+    back to a SELECT.
+    """
+    t = PARTITIONED_TABLES["transactions"]
+    generated = (t.c.id, t.c.timestamp, t.c.created_at)
+    if db.get_bind().dialect.insert_returning:
+        row = db.execute(insert(t).values(**values).returning(*generated)).one()
+    else:
+        db.execute(insert(t).values(**values))
+        row = db.execute(select(*generated).where(t.c.transaction_id == values["transaction_id"])).one()
+    if alert is not None:
+        db.execute(insert(PARTITIONED_TABLES["fraud_alerts"]).values(**alert))
+    db.commit()
+    return {**values, **row._asdict()}
+
+
+def count_pending_alerts(db: Session) -> int:
+    """Pending alerts, counted on the (status, created_at) index
+
+    Alert partitions are only archived once nothing in them is pending, so
+    the hot tables hold every pending alert.
+    """
+    return sum(
+        db.execute(select(func.count()).select_from(a).where(a.c.status == "pending")).scalar() or 0
+        for a in hot_tables(db.connection(), "fraud_alerts")
+    )
+
+
+def transaction_stats(db: Session, pending_alerts: Optional[int] = None) -> Dict:
+    """Dashboard totals over hot and archived transactions
+
+    ``pending_alerts`` may be passed in from the maintained counter to skip
+    the count.
+    """
+    totals = archived_transaction_stats()
+    for t in hot_tables(db.connection(), "transactions"):
+        row = db.execute(select(
+            func.count(t.c.id),
+            func.coalesce(func.sum(t.c.amount), 0),
+            func.count(t.c.id).filter(t.c.is_fraud == True),
+            func.count(t.c.id).filter(t.c.risk_score >= HIGH_RISK_SCORE),
+            func.coalesce(func.sum(t.c.risk_score), 0),
+            func.count(t.c.risk_score),
+        )).one()
+        for key, value in zip(("count", "amount", "fraud", "high_risk", "risk_sum", "risk_count"), row):
+            totals[key] += value
+
+    if pending_alerts is None:
+        pending_alerts = count_pending_alerts(db)
+    avg_risk = totals["risk_sum"] / totals["risk_count"] if totals["risk_count"] else 0.0
+    return {
+        "total_transactions": totals["count"],
+        "total_amount": float(totals["amount"]),
+        "fraud_count": totals["fraud"],
+        "high_risk_count": totals["high_risk"],
+        "avg_risk_score": round(float(avg_risk), 2),
+        "pending_alerts": pending_alerts,
+    }
+
+
+def list_alerts(db: Session, skip: int = 0, limit: int = 100, status: Optional[str] = None) -> List[Dict]:
+    """Fraud alerts newest first by created_at, optionally by status"""
+    def where(t):
+        return [t.c.status == status] if status else []
+
+    filters = [("status", "==", status)] if status else []
+    return _newest_first(db, "fraud_alerts", where, filters, "created_at", skip, limit)
+
+
+def find_alert(db: Session, alert_id: int) -> Optional[Dict]:
+    rows = _hot_rows(db, "fraud_alerts", lambda t: [t.c.id == alert_id], "id", 1)
+    if rows:
+        return rows[0]
+    archived = read_archive("fraud_alerts", [("id", "==", alert_id)], limit=1)
+    return archived[0] if archived else None
+
+
+def _alert_clauses(t, alert_ids: Optional[List[int]], criteria: Dict) -> List:
+    clauses = []
+    if alert_ids is not None:
+        clauses.append(t.c.id.in_(alert_ids))
+    if criteria.get("status") is not None:
+        clauses.append(t.c.status == criteria["status"])
+    if criteria.get("user_id") is not None:
+        clauses.append(t.c.user_id == criteria["user_id"])
+    if criteria.get("alert_type") is not None:
+        clauses.append(t.c.alert_type == criteria["alert_type"])
+    if criteria.get("created_from") is not None:
+        clauses.append(t.c.created_at >= criteria["created_from"])
+    if criteria.get("created_to") is not None:
+        clauses.append(t.c.created_at < criteria["created_to"])
+    if criteria.get("min_risk") is not None:
+        clauses.append(t.c.risk_score >= criteria["min_risk"])
+    return clauses
+
+
+def update_alerts_status(
+    db: Session,
+    status: str,
+    reviewed_at: Optional[datetime],
+    alert_ids: Optional[List[int]] = None,
+    criteria: Optional[Dict] = None,
+    limit: Optional[int] = None
+) -> Tuple[int, int, List[Tuple[str, str]]]:
+    """Set the status of hot alerts matching ``alert_ids`` and/or ``criteria``
+
+    Updates at most ``limit`` alerts (all when None) in one commit: their
+    ids are selected on the filter, then updated by primary key. Alerts
+    already in ``status`` no longer match, so calling again until fewer
+    than ``limit`` come back walks a large filter in bounded chunks.
+    ``criteria`` may hold status, user_id, alert_type, created_from,
+    created_to and min_risk. Returns (updated, change in pending count,
+    [(transaction_id, user_id)] of the updated alerts).
+    """
+    criteria = criteria or {}
+    values = {"status": status}
+    if reviewed_at is not None:
+        values["reviewed_at"] = reviewed_at
+
+    updated, pending_delta, touched = 0, 0, []
+    for t in hot_tables(db.connection(), "fraud_alerts"):
+        remaining = None if limit is None else limit - updated
+        if remaining is not None and remaining <= 0:
+            break
+        clauses = _alert_clauses(t, alert_ids, criteria) + [t.c.status != status]
+        # Row locks (where supported) keep the pending count exact under concurrent reviews
+        stmt = select(t.c.id, t.c.transaction_id, t.c.user_id, t.c.status).where(*clauses).with_for_update()
+        if remaining is not None:
+            stmt = stmt.order_by(t.c.id).limit(remaining)
+        rows = db.execute(stmt).all()
+        if not rows:
+            continue
+        db.execute(
+            update(t).where(t.c.id.in_([row.id for row in rows]), t.c.status != status).values(**values)
+        )
+        updated += len(rows)
+        if status == "pending":
+            pending_delta += len(rows)
+        else:
+            pending_delta -= sum(1 for row in rows if row.status == "pending")
+        touched.extend((row.transaction_id, row.user_id) for row in rows)
+    db.commit()
+    return updated, pending_delta, touched
+
+
+def update_alert_groups(db: Session, groups: List[Dict]) -> List[str]:
+    """Write coalesced members onto their alerts, found by the first member's transaction_id
+
+    Each group dict has transaction_id, user_id, member_transaction_ids
+    (JSON text), transaction_count, max_risk_score, and the risk_score and
+    alert_type of the highest-scoring member. Only pending alerts take
+    members; returns the transaction ids of groups whose alert matched no
+    pending row (already reviewed, or gone).
+    """
+    tables = hot_tables(db.connection(), "fraud_alerts")
+    stale = []
+    for g in groups:
+        matched = 0
+        for t in tables:
+            result = db.execute(
+                update(t)
+                .where(
+                    t.c.transaction_id == g["transaction_id"],
+                    t.c.user_id == g["user_id"],
+                    t.c.status == "pending",
+                )
+                .values(
+                    member_transaction_ids=g["member_transaction_ids"],
+                    transaction_count=g["transaction_count"],
+                    max_risk_score=g["max_risk_score"],
+                    risk_score=g["risk_score"],
+                    alert_type=g["alert_type"],
+                )
+            )
+            matched += result.rowcount
+            if matched:
+                break
+        if not matched:
+            stale.append(g["transaction_id"])
+    db.commit()
+    return stale
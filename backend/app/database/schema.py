@@ -0,0 +1,43 @@
+"""
+Additive schema upgrades for existing databases
+
+Base.metadata.create_all only creates missing tables. Columns added to the
+models later are added here with ALTER TABLE, to the ORM tables and to any
+SQLite per-month partition tables (PostgreSQL partitions inherit them from
+their parent). Only nullable columns can be added this way. Missing
+multi-column indexes are created the same way.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import DefaultClause
+
+from app.database.partitions import PARTITIONED_TABLES, parse_partition_name, partition_table
+
+
+def upgrade_schema(engine: Engine):
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        tables = {}
+        for name in inspector.get_table_names():
+            parsed = parse_partition_name(name)
+            if name in PARTITIONED_TABLES:
+                tables[name] = PARTITIONED_TABLES[name]
+            elif parsed and connection.dialect.name == "sqlite" and parsed[0] in PARTITIONED_TABLES:
+                tables[name] = partition_table(*parsed)
+
+        for name, model_table in tables.items():
+            existing = {c["name"] for c in inspector.get_columns(name)}
+            for column in model_table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                ddl = f"ALTER TABLE {name} ADD COLUMN {column.name} {column.type.compile(connection.dialect)}"
+                if isinstance(column.server_default, DefaultClause):
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                connection.execute(text(ddl))
+                print(f"Added column {name}.{column.name}")
+
+            existing_indexes = {i["name"] for i in inspector.get_indexes(name)}
+            for index in model_table.indexes:
+                if len(index.columns) > 1 and index.name not in existing_indexes:
+                    index.create(connection)
+                    print(f"Created index {index.name}")
@@ -0,0 +1,231 @@
+"""
+Bulk import of historical transactions from CSV or Parquet files
+
+Loads files straight into the transactions table in chunks: PostgreSQL uses
+COPY, SQLite a batched executemany, one commit per chunk. Transaction ids
+that already exist (or repeat within the input) are skipped, so an
+interrupted import can simply be re-run.
+
+With --score each chunk is scored before loading by the batch scorer with
+point-in-time profiles (as the rescore job does), and alerts are written for
+the rows that cross the alert threshold; files should then be in time order.
+Without it, is_fraud/risk_score/fraud_reason are taken from the input when
+present.
+
+Afterwards every imported user's profile is rebuilt from their most recent
+transactions in a vectorized pass and written to the profile store in
+pipelined batches. With STORE_BACKEND=embedded, run this while the API is
+stopped, since the API loads the embedded snapshot only at startup.
+
+Input columns: user_id, transaction_id, amount, merchant, category, and
+optionally location, latitude, longitude, timestamp, is_fraud, risk_score,
+fraud_reason.
+
+Usage (from backend/):
+  python -m app.jobs.bulk_import history.parquet more.csv [--score]
+                                 [--chunk-size 10000] [--skip-profiles]
+                                 [--database-url sqlite:///fraud.db]
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Set
+
+import pandas as pd
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.engine import Engine
+
+from app.database.models import FraudAlert, Transaction
+from app.database.partitions import hot_tables
+from app.jobs.rescore import build_alerts, load_history, score_chunk
+from app.services.user_profile_service import build_profiles, recent_history
+
+REQUIRED_COLUMNS = ["user_id", "transaction_id", "amount", "merchant", "category"]
+OPTIONAL_COLUMNS = ["location", "latitude", "longitude", "timestamp", "is_fraud", "risk_score", "fraud_reason"]
+LOAD_COLUMNS = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+ALERT_COLUMNS = ["transaction_id", "user_id", "risk_score", "alert_type", "description", "status"]
+
+# Users per profile-build query and pipelined store write
+PROFILE_BATCH_SIZE = 5000
+
+transactions_table = Transaction.__table__
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif path.endswith(".csv"):
+        yield from pd.read_csv(path, chunksize=chunk_size)
+    else:
+        raise ValueError(f"Unsupported input file {path} (expected .csv or .parquet)")
+
+
+def normalize(frame: pd.DataFrame) -> List[Dict]:
+    """Input rows as dicts with every load column, NaN mapped to None"""
+    missing = [c for c in REQUIRED_COLUMNS if c not in frame.columns]
+    if missing:
+        raise ValueError(f"Input is missing required columns: {missing}")
+    for column in OPTIONAL_COLUMNS:
+        if column not in frame.columns:
+            frame[column] = None
+    frame = frame[LOAD_COLUMNS].copy()
+    frame['transaction_id'] = frame['transaction_id'].astype(str)
+    frame['user_id'] = frame['user_id'].astype(str)
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+    frame['is_fraud'] = frame['is_fraud'].fillna(False).astype(bool)
+
+    rows = frame.astype(object).where(frame.notna(), None).to_dict('records')
+    now = datetime.now()
+    for row in rows:
+        timestamp = row['timestamp']
+        row['timestamp'] = timestamp.to_pydatetime() if timestamp is not None else now
+    return rows
+
+
+def existing_ids(engine: Engine, transaction_ids: List[str]) -> Set[str]:
+    found = set()
+    with engine.connect() as conn:
+        for table in hot_tables(conn, "transactions"):
+            found.update(conn.execute(
+                select(table.c.transaction_id).where(table.c.transaction_id.in_(transaction_ids))
+            ).scalars())
+    return found
+
+
+def _copy(cursor, table_name: str, columns: List[str], rows: List[Dict]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+
+def load_rows(engine: Engine, rows: List[Dict], alerts: List[Dict]):
+    """Insert one chunk of transactions (and alerts) in a single commit"""
+    if engine.dialect.name == "postgresql":
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            _copy(cursor, "transactions", LOAD_COLUMNS, rows)
+            if alerts:
+                _copy(cursor, "fraud_alerts", ALERT_COLUMNS, alerts)
+            connection.commit()
+        finally:
+            connection.close()
+    else:
+        with engine.begin() as conn:
+            conn.execute(insert(transactions_table), rows)
+            if alerts:
+                conn.execute(insert(FraudAlert.__table__), alerts)
+
+
+def score_rows(engine: Engine, rows: List[Dict]) -> List[Dict]:
+    """Score a chunk before loading; returns the alerts to write"""
+    for row in rows:
+        row['id'] = None
+    scored = score_chunk(rows, load_history(engine, rows))
+    for row, result in zip(rows, scored):
+        del row['id']
+        row['is_fraud'] = result['is_fraud']
+        row['risk_score'] = result['risk_score']
+        row['fraud_reason'] = result['fraud_reason']
+    return build_alerts(scored)
+
+
+def import_files(
+    engine: Engine,
+    paths: List[str],
+    chunk_size: int = 10000,
+    score: bool = False
+) -> Dict:
+    """Load every file; returns counts and the set of imported user ids"""
+    stats = {'rows': 0, 'skipped': 0, 'alerts': 0, 'users': set()}
+    seen: Set[str] = set()
+    started = time.perf_counter()
+
+    for path in paths:
+        for frame in read_chunks(path, chunk_size):
+            rows = normalize(frame)
+            present = existing_ids(engine, [r['transaction_id'] for r in rows])
+            fresh = []
+            for row in rows:
+                if row['transaction_id'] in present or row['transaction_id'] in seen:
+                    continue
+                seen.add(row['transaction_id'])
+                fresh.append(row)
+            stats['skipped'] += len(rows) - len(fresh)
+            if not fresh:
+                continue
+
+            alerts = score_rows(engine, fresh) if score else []
+            load_rows(engine, fresh, alerts)
+
+            stats['rows'] += len(fresh)
+            stats['alerts'] += len(alerts)
+            stats['users'].update(r['user_id'] for r in fresh)
+            elapsed = time.perf_counter() - started
+            rate = stats['rows'] / elapsed if elapsed > 0 else 0.0
+            print(f"{os.path.basename(path)}: loaded {stats['rows']} rows "
+                  f"({rate:.0f} rows/s), skipped {stats['skipped']}")
+    return stats
+
+
+async def build_and_store_profiles(engine: Engine, user_ids: Set[str]) -> int:
+    from app.services.redis_client import redis_client
+
+    await redis_client.connect()
+    started = time.perf_counter()
+    written = 0
+    try:
+        users = sorted(user_ids)
+        for i in range(0, len(users), PROFILE_BATCH_SIZE):
+            with engine.connect() as conn:
+                history = recent_history(conn, users[i:i + PROFILE_BATCH_SIZE])
+            profiles = build_profiles(history)
+            await redis_client.update_user_profiles(profiles)
+            written += len(profiles)
+            elapsed = time.perf_counter() - started
+            rate = written / elapsed if elapsed > 0 else 0.0
+            print(f"Profiles: {written}/{len(users)} written ({rate:.0f} users/s)")
+    finally:
+        await redis_client.disconnect()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import historical transactions")
+    parser.add_argument("paths", nargs="+", help="CSV or Parquet files")
+    parser.add_argument("--database-url", default=None, help="Defaults to DATABASE_URL")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--score", action="store_true", help="Score rows with the batch scorer while loading")
+    parser.add_argument("--skip-profiles", action="store_true", help="Do not rebuild user profiles afterwards")
+    args = parser.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url, pool_pre_ping=True)
+    else:
+        from app.database.database import engine
+    Transaction.metadata.create_all(bind=engine)
+
+    started = time.perf_counter()
+    stats = import_files(engine, args.paths, args.chunk_size, args.score)
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {stats['rows']} rows, skipped {stats['skipped']}, {stats['alerts']} alerts "
+          f"({elapsed:.1f}s, {stats['rows'] / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+
+    if not args.skip_profiles and stats['users']:
+        written = asyncio.run(build_and_store_profiles(engine, stats['users']))
+        print(f"Rebuilt {written} user profiles ({time.perf_counter() - started:.1f}s total)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Export transactions or fraud alerts to a file
+
+Streams rows in chunks (server-side cursor on PostgreSQL) straight into the
+output file, so memory stays constant regardless of result size. Same
+filters as GET /api/export/{dataset}.
+
+Usage (from backend/):
+  python -m app.jobs.export transactions --format parquet --output transactions.parquet
+                            [--start 2024-01-01] [--end 2024-02-01] [--user-id user_1]
+                            [--is-fraud true] [--min-risk 70] [--max-risk 100]
+                            [--chunk-size 10000] [--database-url sqlite:///fraud.db]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+from app.database.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, ExportFilters, export_stream
+
+
+def _bool(value: str) -> bool:
+    return value.lower() in ("1", "true", "yes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export transactions or fraud alerts")
+    parser.add_argument("dataset", choices=["transactions", "fraud_alerts"])
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="parquet")
+    parser.add_argument("--output", default="-", help="Output file ('-' for stdout)")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument("--is-fraud", type=_bool, default=None)
+    parser.add_argument("--min-risk", type=float, default=None)
+    parser.add_argument("--max-risk", type=float, default=None)
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--database-url", default=None, help="Defaults to DATABASE_URL")
+    args = parser.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url, pool_pre_ping=True)
+    else:
+        from app.database.database import engine
+
+    filters = ExportFilters(args.start, args.end, args.user_id, args.is_fraud, args.min_risk, args.max_risk)
+    try:
+        chunks = export_stream(engine, args.dataset, args.format, filters, args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+
+    started = time.perf_counter()
+    written = 0
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    elapsed = time.perf_counter() - started
+    print(f"Exported {args.dataset} ({written} bytes, {elapsed:.1f}s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
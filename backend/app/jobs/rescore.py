@@ -0,0 +1,417 @@
+"""
+Rescore historical transactions after a model or rule change
+
+Streams the hot transactions tables (every partition still in the database)
+in primary-key order, rebuilds each user's
+profile as it was just before every transaction, scores chunks in a process
+pool with the batch scorer and bulk-writes risk_score, is_fraud and
+fraud_reason, reconciling fraud_alerts rows in place. After every committed
+chunk the cached transactions and histories of its users are invalidated (so
+readers never see pre-rescore scores) and progress is checkpointed, so an
+interrupted run can be resumed.
+
+Usage (from backend/):
+  python -m app.jobs.rescore [--chunk-size 5000] [--workers 4]
+                             [--checkpoint rescore_checkpoint.json] [--reset]
+                             [--skip-cache]
+                             [--database-url sqlite:///fraud.db]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import bindparam, create_engine, delete, func, insert, select, union_all, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.database.partitions import PARTITIONED_TABLES, hot_tables
+from app.services.user_profile_service import PROFILE_HISTORY_SIZE, build_profile
+
+ROW_COLUMNS = [
+    "id",
+    "user_id",
+    "transaction_id",
+    "amount",
+    "merchant",
+    "category",
+    "latitude",
+    "longitude",
+    "timestamp",
+]
+
+# Matches the alert threshold used by POST /api/transactions
+ALERT_RISK_THRESHOLD = 50
+
+_detector = None
+
+
+def _init_worker():
+    """Load the models once per worker process"""
+    global _detector
+    from app.services.fraud_detector import FraudDetector
+    _detector = FraudDetector()
+
+
+def score_chunk(rows: List[Dict], history: List[Dict]) -> List[Dict]:
+    """Score one chunk with point-in-time profiles
+
+    ``history`` holds each user's most recent transactions before the chunk,
+    in ascending id order. Rows inside the chunk are folded into the history
+    as they are visited, so every profile only sees earlier transactions.
+    """
+    if _detector is None:
+        _init_worker()
+
+    recent = defaultdict(lambda: deque(maxlen=PROFILE_HISTORY_SIZE))
+    for row in history:
+        recent[row['user_id']].append(SimpleNamespace(**row))
+
+    transactions, profiles = [], []
+    for row in rows:
+        past = recent[row['user_id']]
+        profiles.append(build_profile(row['user_id'], list(past), now=row['timestamp']))
+        transactions.append({
+            'user_id': row['user_id'],
+            'transaction_id': row['transaction_id'],
+            'amount': row['amount'],
+            'merchant': row['merchant'],
+            'category': row['category'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'timestamp': row['timestamp'],
+        })
+        past.append(SimpleNamespace(**row))
+
+    results = _detector.score_batch(transactions, profiles)
+
+    scored = []
+    for row, result in zip(rows, results):
+        scored.append({
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'transaction_id': row['transaction_id'],
+            'is_fraud': result['is_fraud'],
+            'risk_score': result['risk_score'],
+            'fraud_reason': "; ".join(result['reasons']) if result['reasons'] else None,
+            'alert_type': result['alert_type'],
+        })
+    return scored
+
+
+def hot_transactions(conn: Connection, where):
+    """ROW_COLUMNS of every hot transactions table as one subquery
+
+    ``where`` maps a table to its filter clauses. Ids stay unique across
+    partitions, since rows keep their id when they are rolled.
+    """
+    selects = [
+        select(*[t.c[name] for name in ROW_COLUMNS]).where(*where(t))
+        for t in hot_tables(conn, "transactions")
+    ]
+    if len(selects) == 1:
+        return selects[0].subquery()
+    return union_all(*selects).subquery()
+
+
+def iter_chunks(engine: Engine, after_id: int, chunk_size: int, end_id: Optional[int] = None) -> Iterator[List[Dict]]:
+    """Yield transactions in ascending primary-key chunks
+
+    PostgreSQL streams through a single server-side cursor. SQLite cannot
+    hold a read cursor open while the same file is being written, so there
+    each chunk is fetched with its own keyset query instead.
+    """
+    def query(conn: Connection, lower: int):
+        def where(t):
+            clauses = [t.c.id > lower]
+            if end_id is not None:
+                clauses.append(t.c.id <= end_id)
+            return clauses
+        rows = hot_transactions(conn, where)
+        return select(rows).order_by(rows.c.id)
+
+    if engine.dialect.name == "sqlite":
+        last_id = after_id
+        while True:
+            with engine.connect() as conn:
+                rows = [r._asdict() for r in conn.execute(query(conn, last_id).limit(chunk_size))]
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]['id']
+    else:
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query(conn, after_id))
+            for partition in result.partitions():
+                yield [r._asdict() for r in partition]
+
+
+def load_history(engine: Engine, rows: List[Dict]) -> List[Dict]:
+    """Most recent transactions before the chunk for every user in it
+
+    Rows without an id (not inserted yet, as in a bulk import) get each
+    user's most recent stored transactions.
+    """
+    user_ids = list({r['user_id'] for r in rows})
+    first_id = rows[0].get('id')
+
+    def where(t):
+        clauses = [t.c.user_id.in_(user_ids)]
+        if first_id is not None:
+            clauses.append(t.c.id < first_id)
+        return clauses
+
+    with engine.connect() as conn:
+        source = hot_transactions(conn, where)
+        ranked = select(
+            source,
+            func.row_number().over(
+                partition_by=source.c.user_id,
+                order_by=source.c.id.desc()
+            ).label('rn')
+        ).subquery()
+        stmt = select(*[ranked.c[name] for name in ROW_COLUMNS]).where(
+            ranked.c.rn <= PROFILE_HISTORY_SIZE
+        ).order_by(ranked.c.id)
+        return [r._asdict() for r in conn.execute(stmt)]
+
+
+def build_alerts(scored: List[Dict]) -> List[Dict]:
+    """fraud_alerts rows for the scored transactions that cross the alert threshold"""
+    return [
+        {
+            'transaction_id': s['transaction_id'],
+            'user_id': s['user_id'],
+            'risk_score': s['risk_score'],
+            'alert_type': s['alert_type'],
+            'description': s['fraud_reason'] or "",
+            'status': "pending",
+        }
+        for s in scored
+        if s['is_fraud'] or s['risk_score'] >= ALERT_RISK_THRESHOLD
+    ]
+
+
+def _alerts_for(session: Session, scored: List[Dict]):
+    """Existing alerts for the chunk's transactions, and member ids of coalesced alerts
+
+    Returns ({transaction_id: (alert table, alert id, status,
+    transaction_count)}, set of transaction ids already covered as later
+    members of a coalesced alert), over every hot fraud_alerts table.
+    """
+    transaction_ids = [s['transaction_id'] for s in scored]
+    user_ids = list({s['user_id'] for s in scored})
+    existing, covered = {}, set()
+    for t in hot_tables(session.connection(), "fraud_alerts"):
+        for row in session.execute(
+            select(t.c.id, t.c.transaction_id, t.c.status, t.c.transaction_count)
+            .where(t.c.transaction_id.in_(transaction_ids))
+        ):
+            existing.setdefault(row.transaction_id, (t, row.id, row.status, row.transaction_count or 1))
+        coalesced = session.execute(
+            select(t.c.member_transaction_ids).where(t.c.user_id.in_(user_ids), t.c.transaction_count > 1)
+        )
+        for (members,) in coalesced:
+            covered.update(json.loads(members or "[]"))
+    return existing, covered
+
+
+def write_results(engine: Engine, scored: List[Dict]):
+    """Bulk-update scores and reconcile alerts for one chunk
+
+    Existing alerts are updated in place (score, type, description), so
+    analyst decisions and coalesced membership survive. Alerts are inserted
+    only for transactions without one, and only pending single-transaction
+    alerts that no longer meet the threshold are deleted.
+    """
+    alerting = {a['transaction_id']: a for a in build_alerts(scored)}
+
+    with Session(engine) as session:
+        # A row lives in exactly one hot table; updating by id in the others is a no-op
+        for t in hot_tables(session.connection(), "transactions"):
+            session.execute(
+                update(t).where(t.c.id == bindparam('b_id')).values(
+                    is_fraud=bindparam('is_fraud'),
+                    risk_score=bindparam('risk_score'),
+                    fraud_reason=bindparam('fraud_reason'),
+                ),
+                [
+                    {
+                        'b_id': s['id'],
+                        'is_fraud': s['is_fraud'],
+                        'risk_score': s['risk_score'],
+                        'fraud_reason': s['fraud_reason'],
+                    }
+                    for s in scored
+                ],
+            )
+
+        existing, covered = _alerts_for(session, scored)
+        updates, stale = defaultdict(list), defaultdict(list)
+        for s in scored:
+            found = existing.get(s['transaction_id'])
+            if found is None:
+                continue
+            table, alert_id, status, transaction_count = found
+            if s['transaction_id'] not in alerting and status == "pending" and transaction_count <= 1:
+                stale[table].append(alert_id)
+            else:
+                updates[table].append({
+                    'b_id': alert_id,
+                    'risk_score': s['risk_score'],
+                    'alert_type': s['alert_type'],
+                    'description': s['fraud_reason'] or "",
+                })
+        inserts = [
+            alert for transaction_id, alert in alerting.items()
+            if transaction_id not in existing and transaction_id not in covered
+        ]
+
+        for t, rows in updates.items():
+            session.execute(
+                update(t).where(t.c.id == bindparam('b_id')).values(
+                    risk_score=bindparam('risk_score'),
+                    alert_type=bindparam('alert_type'),
+                    description=bindparam('description'),
+                ),
+                rows,
+            )
+        for t, ids in stale.items():
+            session.execute(delete(t).where(t.c.id.in_(ids)))
+        if inserts:
+            session.execute(insert(PARTITIONED_TABLES["fraud_alerts"]), inserts)
+        session.commit()
+
+
+class CacheInvalidator:
+    """Drops the transaction cache entries of committed chunks from this sync job
+
+    Bumps each user's history generation like the API does, so a history read
+    that started before the chunk was committed is not cached.
+    """
+
+    def __init__(self):
+        from app.services.redis_client import redis_client
+        self.redis = redis_client
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.redis.connect())
+
+    def __call__(self, scored: List[Dict]):
+        self.loop.run_until_complete(self.redis.invalidate_transactions(
+            [s['transaction_id'] for s in scored],
+            list({s['user_id'] for s in scored}),
+        ))
+
+    def close(self):
+        try:
+            self.loop.run_until_complete(self.redis.disconnect())
+        finally:
+            self.loop.close()
+
+
+def read_checkpoint(path: str) -> Dict:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'last_id': 0, 'rows': 0}
+
+
+def write_checkpoint(path: str, checkpoint: Dict):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def rescore(
+    engine: Engine,
+    chunk_size: int = 5000,
+    workers: int = 0,
+    checkpoint_path: Optional[str] = None,
+    end_id: Optional[int] = None,
+    invalidate: Optional[Callable[[List[Dict]], None]] = None,
+) -> Dict:
+    """Rescore every transaction after the checkpoint; returns the final checkpoint
+
+    ``invalidate`` is called with each committed chunk before its checkpoint
+    is written, so a crash in between re-invalidates it on resume.
+    """
+    checkpoint = read_checkpoint(checkpoint_path)
+    start_rows = checkpoint['rows']
+    started = time.perf_counter()
+
+    def commit(scored: List[Dict]):
+        write_results(engine, scored)
+        if invalidate is not None:
+            invalidate(scored)
+        checkpoint['last_id'] = scored[-1]['id']
+        checkpoint['rows'] += len(scored)
+        write_checkpoint(checkpoint_path, checkpoint)
+
+        done = checkpoint['rows'] - start_rows
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"Rescored {done} rows ({rate:.0f} rows/s), checkpoint id={checkpoint['last_id']}")
+
+    chunks = iter_chunks(engine, checkpoint['last_id'], chunk_size, end_id)
+
+    if workers <= 0:
+        for rows in chunks:
+            commit(score_chunk(rows, load_history(engine, rows)))
+        return checkpoint
+
+    # Keep a bounded number of chunks in flight and commit them in id order,
+    # so the checkpoint never skips over an unwritten chunk
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for rows in chunks:
+            pending.append(pool.submit(score_chunk, rows, load_history(engine, rows)))
+            if len(pending) >= workers * 2:
+                commit(pending.popleft().result())
+        while pending:
+            commit(pending.popleft().result())
+
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore historical transactions")
+    parser.add_argument("--database-url", default=None, help="Defaults to DATABASE_URL")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Scoring processes (0 scores in-process)")
+    parser.add_argument("--checkpoint", default="rescore_checkpoint.json")
+    parser.add_argument("--reset", action="store_true", help="Ignore any existing checkpoint")
+    parser.add_argument("--end-id", type=int, default=None, help="Last transaction id to rescore")
+    parser.add_argument("--skip-cache", action="store_true",
+                        help="Do not invalidate cached transactions (no store running)")
+    args = parser.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url, pool_pre_ping=True)
+    else:
+        from app.database.database import engine
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    invalidator = None if args.skip_cache else CacheInvalidator()
+    started = time.perf_counter()
+    try:
+        checkpoint = rescore(engine, args.chunk_size, args.workers, args.checkpoint, args.end_id, invalidator)
+    finally:
+        if invalidator is not None:
+            invalidator.close()
+    elapsed = time.perf_counter() - started
+    print(f"Done: {checkpoint['rows']} rows rescored, last id {checkpoint['last_id']} ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Archive cold monthly partitions to Parquet
+
+Keeps HOT_PARTITIONS months (including the current one) in the database.
+Every older transactions/fraud_alerts partition is streamed out in
+(user_id, time) order to a zstd Parquet part file under ARCHIVE_DIR, the
+file's row count is verified, and only then is the partition detached and
+dropped. A fraud_alerts month is left in place while any of its alerts are
+still pending. Safe to re-run; run it daily (it also creates upcoming
+partitions and, on SQLite, rolls finished months out of the live tables).
+
+Requires PARTITIONING_ENABLED=true.
+
+Usage (from backend/):
+  python -m app.jobs.retention [--hot-partitions 3] [--archive-dir archive]
+                               [--dry-run] [--database-url sqlite:///fraud.db]
+"""
+import argparse
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.engine import Engine
+
+from app.database.archive import ARCHIVE_DIR, write_archive
+from app.database.partitions import (
+    HOT_PARTITIONS,
+    PARTITIONED_TABLES,
+    PARTITIONING_ENABLED,
+    ensure_partitions,
+    hot_cutoff,
+    is_partitioned,
+    list_partitions,
+    partition_name,
+    partition_table,
+)
+
+ARCHIVE_BATCH_SIZE = 50000
+
+# Column the archive is time-ordered by within each user
+ORDER_COLUMNS = {"transactions": "timestamp", "fraud_alerts": "created_at"}
+
+
+def _stream_rows(engine: Engine, partition, order_column: str) -> Iterator[List[Dict]]:
+    stmt = select(partition).order_by(partition.c.user_id, partition.c[order_column])
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=ARCHIVE_BATCH_SIZE).execute(stmt)
+        for batch in result.partitions():
+            yield [dict(row._mapping) for row in batch]
+
+
+def archive_partition(engine: Engine, table_name: str, month: datetime, archive_dir: str) -> int:
+    partition = partition_table(table_name, month)
+    if table_name == "fraud_alerts":
+        with engine.connect() as conn:
+            pending = conn.execute(
+                select(func.count()).select_from(partition).where(partition.c.status == "pending")
+            ).scalar()
+        if pending:
+            print(f"Skipping {partition.name}: {pending} alerts still pending")
+            return 0
+
+    path, rows = write_archive(
+        PARTITIONED_TABLES[table_name], month,
+        _stream_rows(engine, partition, ORDER_COLUMNS[table_name]),
+        archive_dir
+    )
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {partition.name}"))
+        conn.execute(text(f"DROP TABLE {partition.name}"))
+    print(f"Archived {partition.name}: {rows} rows -> {path or '(empty, dropped)'}")
+    return rows
+
+
+def run_retention(
+    engine: Engine,
+    hot_partitions: int = HOT_PARTITIONS,
+    archive_dir: str = ARCHIVE_DIR,
+    now: Optional[datetime] = None,
+    dry_run: bool = False
+) -> Dict[str, int]:
+    """Archive every partition older than the hot window; returns rows per table"""
+    ensure_partitions(engine, now)
+    cutoff = hot_cutoff(now, hot_partitions)
+    archived = {}
+    for table_name in PARTITIONED_TABLES:
+        with engine.connect() as conn:
+            if not is_partitioned(conn, table_name):
+                print(f"{table_name} is not partitioned; skipping")
+                continue
+            cold = [m for m in list_partitions(conn, table_name) if m < cutoff]
+        archived[table_name] = 0
+        for month in cold:
+            if dry_run:
+                print(f"Would archive {partition_name(table_name, month)}")
+                continue
+            archived[table_name] += archive_partition(engine, table_name, month, archive_dir)
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive cold partitions to Parquet")
+    parser.add_argument("--database-url", default=None, help="Defaults to DATABASE_URL")
+    parser.add_argument("--hot-partitions", type=int, default=HOT_PARTITIONS,
+                        help="Months kept in the database, including the current one")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="List partitions that would be archived")
+    args = parser.parse_args()
+
+    if not PARTITIONING_ENABLED:
+        parser.error("set PARTITIONING_ENABLED=true to use partitioned storage")
+
+    if args.database_url:
+        engine = create_engine(args.database_url, pool_pre_ping=True)
+    else:
+        from app.database.database import engine
+
+    started = time.perf_counter()
+    archived = run_retention(engine, args.hot_partitions, args.archive_dir, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - started
+    print(f"Done: {archived} ({elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,20 +5,48 @@ import uvicorn
 import json
 from contextlib import asynccontextmanager
 
-from app.api import transactions, fraud_alerts
+from app.api import transactions, fraud_alerts, rules, export
 from app.database.database import engine, Base
+from app.database.partitions import create_partitioned_tables, ensure_partitions
+from app.database.schema import upgrade_schema
 from app.services.redis_client import redis_client
+from app.services.transaction_cache import transaction_cache
 from app.services.websocket_manager import manager
+from app.services.admission_control import admission_controller
+from app.services.alert_coalescer import alert_coalescer
+from app.services.alert_counters import alert_counters
+from app.services.fraud_graph import fraud_graph
+from app.services.profile_updater import profile_updater
+from app.services.stream_analytics import stream_analytics
+from app.services.traffic_capture import TrafficCaptureMiddleware, traffic_recorder
+from app.services.write_behind import write_behind_queue
 
 # Create database tables
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    create_partitioned_tables(engine)
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    ensure_partitions(engine)
     await redis_client.connect()
+    await alert_counters.start()
+    await write_behind_queue.start()
+    await profile_updater.start()
+    await alert_coalescer.start()
+    await stream_analytics.start()
+    await fraud_graph.start()
     yield
     # Shutdown
+    await fraud_graph.stop()
+    await stream_analytics.stop()
+    # Deferred alert inserts land before the coalescer's final update
+    await write_behind_queue.stop()
+    await alert_coalescer.stop()
+    await profile_updater.stop()
+    await alert_counters.stop()
     await redis_client.disconnect()
+    traffic_recorder.close()
 
 app = FastAPI(
     title="Real-Time Fraud Detection API",
@@ -36,9 +64,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Records API traffic for scripts/replay_traffic.py when TRAFFIC_CAPTURE_PATH is set
+app.add_middleware(TrafficCaptureMiddleware, recorder=traffic_recorder)
+
 # Include routers
 app.include_router(transactions.router, prefix="/api", tags=["transactions"])
 app.include_router(fraud_alerts.router, prefix="/api", tags=["fraud-alerts"])
+app.include_router(rules.router, prefix="/api", tags=["rules"])
+app.include_router(export.router, prefix="/api", tags=["export"])
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -64,7 +97,19 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "fraud-detection-api"}
+    return {
+        "status": "healthy",
+        "service": "fraud-detection-api",
+        "admission": admission_controller.status(),
+        "write_behind": write_behind_queue.status(),
+        "profile_updates": profile_updater.status(),
+        "transaction_cache": transaction_cache.status(),
+        "alert_coalescing": alert_coalescer.status(),
+        "alert_counters": alert_counters.status(),
+        "stream_analytics": stream_analytics.status(),
+        "fraud_graph": fraud_graph.status(),
+        "traffic_capture": traffic_recorder.status()
+    }
 
 if __name__ == "__main__":
     import os
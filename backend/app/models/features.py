@@ -0,0 +1,239 @@
+"""
+Shared feature pipeline for training, online scoring and offline rescoring.
+
+Features are declared once in FEATURE_SPEC and compiled into a single
+vectorized NumPy transform over columnar batches (a mapping of column name
+to 1-D array), so every caller produces identical feature matrices.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from app.services.geo_index import LocationModel, nearest_known_km, travel_from_last
+
+# Raw columns every batch must provide
+INPUT_COLUMNS = [
+    'amount', 'hour', 'weekday', 'latitude', 'longitude',
+    'avg_amount', 'transaction_count', 'unique_merchants', 'unique_locations',
+]
+
+# Profile and velocity context used by the rule engine; NaN where unknown so
+# that every comparison against a missing value is false
+CONTEXT_COLUMNS = [
+    'amount_deviation_ratio', 'profile_min_hour', 'profile_max_hour', 'profile_hour_range',
+    'nearest_location_km', 'travel_distance_km', 'travel_speed_kmh',
+    'typical_merchant_count', 'merchant_known', 'has_merchant',
+    'seconds_since_last_transaction', 'transactions_last_hour',
+    'ring_size', 'ring_fraud_density', 'ring_growth',
+]
+
+# Fraud-ring component features (see app.services.fraud_graph)
+GRAPH_COLUMNS = ['ring_size', 'ring_fraud_density', 'ring_growth']
+
+VELOCITY_WINDOW_SECONDS = 3600
+
+
+@dataclass(frozen=True)
+class Feature:
+    """Declarative feature definition.
+
+    ``value`` features read ``column``, clip it to ``[lower, upper]`` and
+    divide by ``scale``. ``deviation`` features compute
+    ``|column - ref| / ref`` (0 where ``ref <= 0``) before clipping.
+    """
+    name: str
+    column: str
+    kind: str = "value"
+    ref: Optional[str] = None
+    lower: Optional[float] = None
+    upper: Optional[float] = None
+    scale: float = 1.0
+
+
+FEATURE_SPEC = [
+    Feature("amount", "amount", upper=50000, scale=1000),
+    Feature("hour", "hour"),
+    Feature("weekday", "weekday"),
+    Feature("latitude", "latitude", scale=100),
+    Feature("longitude", "longitude", scale=100),
+    Feature("avg_amount", "avg_amount", upper=50000, scale=1000),
+    Feature("transaction_count", "transaction_count", upper=1000, scale=100),
+    Feature("unique_merchants", "unique_merchants", upper=100, scale=10),
+    Feature("unique_locations", "unique_locations", upper=50, scale=10),
+    Feature("amount_deviation", "amount", kind="deviation", ref="avg_amount", upper=5.0),
+]
+
+FEATURE_NAMES = [f.name for f in FEATURE_SPEC]
+
+
+class FeaturePipeline:
+    """Compiled form of a feature spec"""
+
+    def __init__(self, spec: Sequence[Feature] = FEATURE_SPEC):
+        self.spec = list(spec)
+        self.names = [f.name for f in self.spec]
+        self._steps = [self._compile(f) for f in self.spec]
+
+    @staticmethod
+    def _compile(feature: Feature):
+        if feature.kind not in ("value", "deviation"):
+            raise ValueError(f"Unknown feature kind: {feature.kind}")
+
+        def step(columns: Mapping, out: np.ndarray):
+            values = np.asarray(columns[feature.column], dtype=np.float64)
+            if feature.kind == "deviation":
+                ref = np.asarray(columns[feature.ref], dtype=np.float64)
+                safe_ref = np.where(ref > 0, ref, 1.0)
+                values = np.where(ref > 0, np.abs(values - ref) / safe_ref, 0.0)
+            if feature.lower is not None or feature.upper is not None:
+                values = np.clip(values, feature.lower, feature.upper)
+            np.divide(values, feature.scale, out=out)
+
+        return step
+
+    def transform(self, columns: Mapping) -> np.ndarray:
+        """Transform a columnar batch into an (n_rows, n_features) matrix"""
+        n_rows = len(columns[self.spec[0].column])
+        matrix = np.empty((len(self.spec), n_rows), dtype=np.float64)
+        for i, step in enumerate(self._steps):
+            step(columns, matrix[i])
+        return matrix.T
+
+    def transform_one(self, transaction: Dict, user_profile: Optional[Dict]) -> np.ndarray:
+        """Feature vector for a single transaction"""
+        return self.transform(build_columns([transaction], [user_profile]))[0]
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value
+
+
+def _count(value, default: float = 1) -> float:
+    """Profile counters may be stored either as numbers or as collections"""
+    if value is None:
+        return default
+    if isinstance(value, (list, tuple, set, dict)):
+        return len(value)
+    return value
+
+
+def transaction_columns(transactions: Sequence[Dict]) -> Dict[str, np.ndarray]:
+    """Allocate a batch and fill its transaction-side columns
+
+    Profile columns are left for the caller; ``seen_at`` holds each
+    transaction's epoch time (NaN when it has no timestamp).
+    """
+    n = len(transactions)
+    columns = {name: np.empty(n, dtype=np.float64) for name in INPUT_COLUMNS}
+    for name in CONTEXT_COLUMNS:
+        columns[name] = np.full(n, np.nan)
+    columns['has_profile'] = np.zeros(n, dtype=bool)
+    columns['seen_at'] = np.full(n, np.nan)
+
+    for i, transaction in enumerate(transactions):
+        columns['amount'][i] = transaction['amount']
+
+        dt = parse_timestamp(transaction.get('timestamp'))
+        if dt is not None:
+            columns['hour'][i] = dt.hour
+            columns['weekday'][i] = dt.weekday()
+            columns['seen_at'][i] = dt.timestamp()
+        else:
+            columns['hour'][i] = 12
+            columns['weekday'][i] = 0
+
+        columns['latitude'][i] = transaction.get('latitude') or 0.0
+        columns['longitude'][i] = transaction.get('longitude') or 0.0
+        columns['has_merchant'][i] = 1.0 if transaction.get('merchant') else 0.0
+
+    return columns
+
+
+def add_location_columns(columns: Dict[str, np.ndarray], location_models: List[Optional[LocationModel]]):
+    """Location familiarity and travel speed for the whole batch at once"""
+    if not any(model is not None for model in location_models):
+        return
+    columns['nearest_location_km'] = nearest_known_km(
+        columns['latitude'], columns['longitude'], location_models
+    )
+    columns['travel_distance_km'], columns['travel_speed_kmh'] = travel_from_last(
+        columns['latitude'], columns['longitude'], columns['seen_at'], location_models
+    )
+
+
+def add_graph_columns(columns: Dict[str, np.ndarray], graph_features: Sequence[Optional[Dict]]):
+    """Fill the fraud-ring columns from per-row component features (None leaves NaN)"""
+    for i, features in enumerate(graph_features):
+        if features:
+            for name in GRAPH_COLUMNS:
+                columns[name][i] = features[name]
+
+
+def build_columns(
+    transactions: Sequence[Dict],
+    user_profiles: Sequence[Optional[Dict]]
+) -> Dict[str, np.ndarray]:
+    """Convert transaction/profile dicts into the columnar input of the pipeline
+
+    Transactions without a profile fall back to the same defaults used for
+    new users: their own amount as the average and counts of one. The batch
+    also carries the CONTEXT_COLUMNS consumed by the rule engine.
+    """
+    columns = transaction_columns(transactions)
+    location_models = [None] * len(transactions)
+
+    for i, (transaction, profile) in enumerate(zip(transactions, user_profiles)):
+        if profile:
+            columns['has_profile'][i] = True
+            columns['avg_amount'][i] = profile.get('avg_amount', transaction['amount'])
+            columns['transaction_count'][i] = _count(profile.get('transaction_count'))
+            columns['unique_merchants'][i] = _count(profile.get('unique_merchants'))
+            columns['unique_locations'][i] = _count(profile.get('unique_locations'))
+            _fill_context(columns, i, transaction, profile)
+            if profile.get('locations'):
+                location_models[i] = LocationModel.from_dict(profile['locations'])
+        else:
+            columns['avg_amount'][i] = transaction['amount']
+            columns['transaction_count'][i] = 1
+            columns['unique_merchants'][i] = 1
+            columns['unique_locations'][i] = 1
+
+    add_location_columns(columns, location_models)
+    return columns
+
+
+def _fill_context(columns: Dict[str, np.ndarray], i: int, transaction: Dict, profile: Dict):
+    """Profile and velocity context for row ``i``"""
+    avg_amount = profile.get('avg_amount', 0) or 0
+    if avg_amount > 0:
+        columns['amount_deviation_ratio'][i] = abs(transaction['amount'] - avg_amount) / avg_amount
+
+    typical_hours = profile.get('typical_hours') or []
+    if typical_hours:
+        columns['profile_min_hour'][i] = min(typical_hours)
+        columns['profile_max_hour'][i] = max(typical_hours)
+        columns['profile_hour_range'][i] = max(typical_hours) - min(typical_hours)
+
+    typical_merchants = profile.get('typical_merchants') or []
+    columns['typical_merchant_count'][i] = len(typical_merchants)
+    columns['merchant_known'][i] = 1.0 if transaction.get('merchant') in typical_merchants else 0.0
+
+    now = columns['seen_at'][i]
+    if not np.isnan(now):
+        last_seen = parse_timestamp(profile.get('last_transaction_at'))
+        if last_seen is not None:
+            columns['seconds_since_last_transaction'][i] = now - last_seen.timestamp()
+        recent = profile.get('recent_transaction_times')
+        if recent is not None:
+            columns['transactions_last_hour'][i] = sum(
+                1 for t in recent if 0 <= now - t <= VELOCITY_WINDOW_SECONDS
+            )
+
+
+default_pipeline = FeaturePipeline()
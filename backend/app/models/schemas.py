@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+import json
 
 class TransactionCreate(BaseModel):
     user_id: str
@@ -42,13 +43,60 @@ class FraudAlertResponse(BaseModel):
     status: str
     created_at: datetime
     reviewed_at: Optional[datetime]
+    member_transaction_ids: List[str] = []
+    transaction_count: int = 1
+    max_risk_score: Optional[float] = None
+
+    @field_validator('member_transaction_ids', mode='before')
+    @classmethod
+    def decode_members(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    @field_validator('transaction_count', mode='before')
+    @classmethod
+    def default_count(cls, value):
+        return 1 if value is None else value
 
     class Config:
         from_attributes = True
 
+class AlertBulkUpdate(BaseModel):
+    """Bulk status change by alert ids and/or filter (at least one is required)"""
+    status: str
+    alert_ids: Optional[List[int]] = Field(default=None, max_length=10000)
+    filter_status: Optional[str] = None
+    user_id: Optional[str] = None
+    alert_type: Optional[str] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    min_risk: Optional[float] = None
+
+    @model_validator(mode='after')
+    def require_selection(self):
+        criteria = self.criteria()
+        if not self.alert_ids and not criteria:
+            raise ValueError("Provide alert_ids or at least one filter")
+        return self
+
+    def criteria(self) -> dict:
+        criteria = {
+            'status': self.filter_status,
+            'user_id': self.user_id,
+            'alert_type': self.alert_type,
+            'created_from': self.created_from,
+            'created_to': self.created_to,
+            'min_risk': self.min_risk,
+        }
+        return {k: v for k, v in criteria.items() if v is not None}
+
 class FraudDetectionResult(BaseModel):
     is_fraud: bool
     risk_score: float
     reasons: list[str]
     alert_type: str
+    stages_run: list[str] = []
 
@@ -12,6 +12,8 @@ import os
 from datetime import datetime, timedelta
 import random
 
+from app.models.features import default_pipeline, FEATURE_NAMES
+
 def generate_synthetic_transactions(n_samples=10000, fraud_ratio=0.05):
     """Generate synthetic transaction data for training"""
     np.random.seed(42)
@@ -38,7 +40,6 @@ def generate_synthetic_transactions(n_samples=10000, fraud_ratio=0.05):
             'transaction_count': np.random.randint(10, 100),
             'unique_merchants': np.random.randint(5, 20),
             'unique_locations': np.random.randint(3, 10),
-            'amount_deviation': abs(amount - amount * np.random.uniform(0.8, 1.2)),
             'is_fraud': 0
         })
     
@@ -60,21 +61,40 @@ def generate_synthetic_transactions(n_samples=10000, fraud_ratio=0.05):
             'transaction_count': np.random.randint(1, 20),  # Newer users more likely
             'unique_merchants': np.random.randint(1, 5),
             'unique_locations': np.random.randint(1, 3),
-            'amount_deviation': abs(amount - amount * np.random.uniform(0.3, 0.7)),
             'is_fraud': 1
         })
     
     df = pd.DataFrame(transactions)
     return df
 
+def to_transaction_records(df):
+    """Rebuild API-style transaction and profile dicts from a synthetic frame"""
+    # 2024-01-01 is a Monday, so weekday offsets map directly onto dates
+    monday = datetime(2024, 1, 1)
+    transactions, profiles = [], []
+    for i, row in enumerate(df.itertuples(index=False)):
+        ts = monday + timedelta(days=int(row.weekday), hours=int(row.hour))
+        transactions.append({
+            'user_id': f"user_{i}",
+            'transaction_id': f"txn_{i}",
+            'amount': row.amount,
+            'merchant': 'Amazon',
+            'category': 'Retail',
+            'latitude': row.latitude,
+            'longitude': row.longitude,
+            'timestamp': ts.isoformat(),
+        })
+        profiles.append({
+            'avg_amount': row.avg_amount,
+            'transaction_count': row.transaction_count,
+            'unique_merchants': row.unique_merchants,
+            'unique_locations': row.unique_locations,
+        })
+    return transactions, profiles
+
 def extract_features(df):
-    """Extract features for ML models"""
-    features = [
-        'amount', 'hour', 'weekday', 'latitude', 'longitude',
-        'avg_amount', 'transaction_count', 'unique_merchants',
-        'unique_locations', 'amount_deviation'
-    ]
-    X = df[features].values
+    """Extract features for ML models using the shared serving pipeline"""
+    X = default_pipeline.transform(df)
     y = df['is_fraud'].values
     return X, y
 
@@ -140,9 +160,7 @@ def main():
     print(f"XGBoost - Accuracy: {xgboost_model.score(X_scaled, y):.4f}")
     
     # Feature importance
-    feature_names = ['amount', 'hour', 'weekday', 'latitude', 'longitude',
-                     'avg_amount', 'transaction_count', 'unique_merchants',
-                     'unique_locations', 'amount_deviation']
+    feature_names = FEATURE_NAMES
     importances = xgboost_model.feature_importances_
     print("\nTop 5 Important Features:")
     for idx in np.argsort(importances)[-5:][::-1]:
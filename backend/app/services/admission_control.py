@@ -0,0 +1,94 @@
+"""
+Admission control and graceful degradation for transaction ingest
+
+Tracks requests in flight and the depth of the scoring, DB and broadcast
+stages. As load crosses configurable thresholds, ingest degrades in steps
+instead of queueing until clients time out:
+
+    0 NORMAL              full pipeline
+    1 SKIP_PROFILE_UPDATE no background profile refresh
+    2 RULES_ONLY          rules and profile checks only, no ML models
+    3 DEFER_ALERTS        alert inserts and broadcasts go to the write-behind queue
+    4 SHED                reject with 503 and Retry-After
+"""
+import os
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict
+
+
+class DegradationLevel(IntEnum):
+    NORMAL = 0
+    SKIP_PROFILE_UPDATE = 1
+    RULES_ONLY = 2
+    DEFER_ALERTS = 3
+    SHED = 4
+
+
+def _env_levels(name: str, default: str):
+    return [int(v) for v in os.getenv(name, default).split(",")]
+
+
+# In-flight request counts at which levels 1-4 start
+INFLIGHT_THRESHOLDS = _env_levels("ADMISSION_INFLIGHT_LEVELS", "64,128,256,512")
+
+# Stage depth limits and the level each stage's overload forces
+STAGE_LIMITS = {
+    "scoring": (int(os.getenv("ADMISSION_SCORING_DEPTH", "32")), DegradationLevel.RULES_ONLY),
+    "db": (int(os.getenv("ADMISSION_DB_DEPTH", "32")), DegradationLevel.DEFER_ALERTS),
+    "broadcast": (int(os.getenv("ADMISSION_BROADCAST_DEPTH", "64")), DegradationLevel.DEFER_ALERTS),
+}
+
+RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+
+class AdmissionController:
+    def __init__(self, inflight_thresholds=INFLIGHT_THRESHOLDS, stage_limits=STAGE_LIMITS):
+        if len(inflight_thresholds) != 4:
+            raise ValueError("Expected four in-flight thresholds (levels 1-4)")
+        self.inflight_thresholds = inflight_thresholds
+        self.stage_limits = stage_limits
+        self.in_flight = 0
+        self.stage_depths: Dict[str, int] = {name: 0 for name in stage_limits}
+        self.admitted_by_level: Dict[int, int] = {int(level): 0 for level in DegradationLevel}
+
+    def current_level(self) -> DegradationLevel:
+        level = DegradationLevel.NORMAL
+        for i, threshold in enumerate(self.inflight_thresholds, start=1):
+            if self.in_flight >= threshold:
+                level = DegradationLevel(i)
+        for name, (limit, stage_level) in self.stage_limits.items():
+            if self.stage_depths.get(name, 0) >= limit:
+                level = max(level, stage_level)
+        return level
+
+    def admit(self) -> DegradationLevel:
+        """Decide the level for a new request; admitted requests must call release()"""
+        level = self.current_level()
+        self.admitted_by_level[int(level)] += 1
+        if level < DegradationLevel.SHED:
+            self.in_flight += 1
+        return level
+
+    def release(self):
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Count the caller as queued in or running through ``name``"""
+        self.stage_depths[name] = self.stage_depths.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            self.stage_depths[name] -= 1
+
+    def status(self) -> Dict:
+        return {
+            "level": int(self.current_level()),
+            "in_flight": self.in_flight,
+            "stage_depths": dict(self.stage_depths),
+            "requests_by_level": dict(self.admitted_by_level),
+        }
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,270 @@
+"""
+Coalescing of fraud alert bursts
+
+A compromised card produces bursts of high-risk transactions. The first
+alert for a key (user, or user and merchant) is inserted and broadcast as
+usual; once its row is committed it opens a window of ALERT_COALESCE_WINDOW
+seconds. Later alerts for the same key inside the window are not inserted:
+they are merged into the window's alert row (member transaction ids, count,
+and the highest risk score and its alert type). Merged members are written
+to the row every ALERT_COALESCE_FLUSH_INTERVAL seconds, so a crash loses at
+most that much membership. When the window closes a single coalesced
+``fraud_alert`` message is broadcast.
+
+Only pending alerts take members. If the window's alert was reviewed in the
+meantime, the window closes and its unwritten members are inserted as a new
+pending alert, which opens a fresh window.
+
+Alerts whose insert is deferred (see app.services.write_behind) do not open
+a window, since their row may not exist yet when members would be written.
+
+State is per process; set ALERT_COALESCE_WINDOW=0 to disable.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.database.database import SessionLocal
+from app.database.queries import update_alert_groups
+from app.services.alert_counters import alert_counters
+from app.services.websocket_manager import manager
+from app.services.write_behind import insert_alerts
+
+ALERT_COALESCE_WINDOW = float(os.getenv("ALERT_COALESCE_WINDOW", "60"))
+ALERT_COALESCE_BY_MERCHANT = os.getenv("ALERT_COALESCE_BY_MERCHANT", "false").lower() == "true"
+ALERT_COALESCE_FLUSH_INTERVAL = float(os.getenv("ALERT_COALESCE_FLUSH_INTERVAL", "1"))
+
+
+class AlertGroup:
+    __slots__ = ("transaction_id", "user_id", "merchant", "alert_type", "opened_at", "members", "max_risk",
+                 "unwritten")
+
+    def __init__(self, alert_row: Dict, merchant: Optional[str], opened_at: float):
+        self.transaction_id = alert_row['transaction_id']
+        self.user_id = alert_row['user_id']
+        self.merchant = merchant
+        self.alert_type = alert_row['alert_type']
+        self.opened_at = opened_at
+        self.members = [alert_row['transaction_id']]
+        self.max_risk = alert_row['risk_score']
+        # Member alert rows merged since the last successful write
+        self.unwritten: List[Dict] = []
+
+    def row(self) -> Dict:
+        return {
+            'transaction_id': self.transaction_id,
+            'user_id': self.user_id,
+            'member_transaction_ids': json.dumps(self.members),
+            'transaction_count': len(self.members),
+            'max_risk_score': self.max_risk,
+            'risk_score': self.max_risk,
+            'alert_type': self.alert_type,
+        }
+
+
+def _replacement(members: List[Dict]) -> Dict:
+    """A new pending alert carrying members that the reviewed alert could not take"""
+    top = max(members, key=lambda m: m['risk_score'])
+    row = dict(members[0])
+    row.update({
+        'member_transaction_ids': json.dumps([m['transaction_id'] for m in members]),
+        'transaction_count': len(members),
+        'max_risk_score': top['risk_score'],
+        'risk_score': top['risk_score'],
+        'alert_type': top['alert_type'],
+        'status': 'pending',
+    })
+    return row
+
+
+def _write_groups(groups: List[Dict], members: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+    """Update the groups' alerts; insert replacements for those no longer pending"""
+    db = SessionLocal()
+    try:
+        stale = update_alert_groups(db, groups)
+    finally:
+        db.close()
+    replacements = {t: _replacement(members[t]) for t in stale}
+    if replacements:
+        insert_alerts(list(replacements.values()))
+    return replacements
+
+
+class AlertCoalescer:
+    def __init__(
+        self,
+        window: float = ALERT_COALESCE_WINDOW,
+        by_merchant: bool = ALERT_COALESCE_BY_MERCHANT,
+        flush_interval: float = ALERT_COALESCE_FLUSH_INTERVAL
+    ):
+        self.window = window
+        self.by_merchant = by_merchant
+        self.flush_interval = flush_interval
+        self._groups: Dict[Tuple, AlertGroup] = {}
+        self._closed: List[AlertGroup] = []
+        self._task: Optional[asyncio.Task] = None
+        self.opened = 0
+        self.merged = 0
+        self.flushed = 0
+        self.failed = 0
+
+    def _key(self, user_id: str, merchant: Optional[str]):
+        return (user_id, merchant) if self.by_merchant else user_id
+
+    def add(self, alert_row: Dict, merchant: Optional[str] = None) -> bool:
+        """Merge into an open window (True); False means the caller inserts the alert
+
+        The row is annotated with its own membership fields either way. After
+        inserting, the caller calls ``open`` to start a window for it.
+        """
+        alert_row['member_transaction_ids'] = json.dumps([alert_row['transaction_id']])
+        alert_row['transaction_count'] = 1
+        alert_row['max_risk_score'] = alert_row['risk_score']
+        if self.window <= 0:
+            return False
+
+        group = self._groups.get(self._key(alert_row['user_id'], merchant))
+        if group is None or time.monotonic() - group.opened_at >= self.window:
+            return False
+        group.members.append(alert_row['transaction_id'])
+        if alert_row['risk_score'] > group.max_risk:
+            group.max_risk = alert_row['risk_score']
+            group.alert_type = alert_row['alert_type']
+        group.unwritten.append(alert_row)
+        self.merged += 1
+        return True
+
+    def open(self, alert_row: Dict, merchant: Optional[str] = None):
+        """Start a window for an alert whose row has been committed"""
+        if self.window <= 0:
+            return
+        key = self._key(alert_row['user_id'], merchant)
+        previous = self._groups.get(key)
+        if previous is not None:
+            self._closed.append(previous)
+        self._groups[key] = AlertGroup(alert_row, merchant, time.monotonic())
+        self.opened += 1
+
+    async def start(self):
+        if self.window > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(force=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(min(self.window / 4, self.flush_interval))
+            await self.flush()
+
+    async def flush(self, force: bool = False):
+        """Write new members of every window, then broadcast the closed ones
+
+        All windows close when forced. A failed write leaves its groups
+        pending for the next flush. A window whose alert is no longer pending
+        closes without a broadcast; its members go to a new alert.
+        """
+        now = time.monotonic()
+        for key, group in list(self._groups.items()):
+            if force or now - group.opened_at >= self.window:
+                self._closed.append(self._groups.pop(key))
+
+        closed, self._closed = self._closed, []
+        pending = [g for g in list(self._groups.values()) + closed if g.unwritten]
+        replacements: Dict[str, Dict] = {}
+        if pending:
+            rows = [g.row() for g in pending]
+            # Members merged while the write runs stay for the next flush
+            written = [len(g.unwritten) for g in pending]
+            members = {g.transaction_id: g.unwritten[:n] for g, n in zip(pending, written)}
+            try:
+                replacements = await run_in_threadpool(_write_groups, rows, members)
+                self.flushed += len(rows)
+            except Exception as e:
+                self._closed.extend(closed)
+                self.failed += len(rows)
+                print(f"Error writing coalesced alerts: {e}")
+                return
+            for g, n in zip(pending, written):
+                del g.unwritten[:n]
+
+        if replacements:
+            await self._reopen(replacements)
+            await alert_counters.add_pending(len(replacements))
+
+        # Single-member windows were already broadcast on arrival
+        for g in closed:
+            if len(g.members) < 2 or g.transaction_id in replacements:
+                continue
+            await manager.broadcast({
+                "type": "fraud_alert",
+                "data": {
+                    "coalesced": True,
+                    "transaction_id": g.transaction_id,
+                    "user_id": g.user_id,
+                    "merchant": g.merchant,
+                    "alert_type": g.alert_type,
+                    "risk_score": g.max_risk,
+                    "transaction_count": len(g.members),
+                    "member_transaction_ids": g.members,
+                    "timestamp": datetime.now().isoformat()
+                }
+            })
+
+    async def _reopen(self, replacements: Dict[str, Dict]):
+        """Swap stale windows for windows on their replacement alerts and broadcast those"""
+        for key, group in list(self._groups.items()):
+            row = replacements.get(group.transaction_id)
+            if row is None:
+                continue
+            fresh = AlertGroup(row, group.merchant, time.monotonic())
+            fresh.members = json.loads(row['member_transaction_ids'])
+            fresh.max_risk = row['max_risk_score']
+            # Members that arrived during the write move to the new window
+            for leftover in group.unwritten:
+                fresh.members.append(leftover['transaction_id'])
+                if leftover['risk_score'] > fresh.max_risk:
+                    fresh.max_risk = leftover['risk_score']
+                    fresh.alert_type = leftover['alert_type']
+            fresh.unwritten = group.unwritten
+            self._groups[key] = fresh
+            self.opened += 1
+
+        for row in replacements.values():
+            await manager.broadcast({
+                "type": "fraud_alert",
+                "data": {
+                    "transaction_id": row['transaction_id'],
+                    "user_id": row['user_id'],
+                    "risk_score": row['risk_score'],
+                    "alert_type": row['alert_type'],
+                    "description": row['description'],
+                    "transaction_count": row['transaction_count'],
+                    "member_transaction_ids": json.loads(row['member_transaction_ids']),
+                    "timestamp": datetime.now().isoformat()
+                }
+            })
+
+    def status(self) -> Dict:
+        return {
+            'open_windows': len(self._groups),
+            'opened': self.opened,
+            'merged': self.merged,
+            'flushed': self.flushed,
+            'failed': self.failed,
+        }
+
+
+alert_coalescer = AlertCoalescer()
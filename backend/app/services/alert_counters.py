@@ -0,0 +1,86 @@
+"""
+Incrementally maintained pending-alert counter
+
+Kept in the shared store (redis_client) so every worker sees one value.
+Writers adjust it by the number of alerts entering or leaving 'pending';
+a recount against the (status, created_at) index runs at startup and every
+ALERT_COUNTER_RECONCILE_INTERVAL seconds to correct any drift, e.g. from
+offline jobs that rewrite alerts.
+"""
+import asyncio
+import os
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.database.database import SessionLocal
+from app.database.queries import count_pending_alerts
+from app.services.redis_client import redis_client
+
+ALERT_COUNTER_RECONCILE_INTERVAL = float(os.getenv("ALERT_COUNTER_RECONCILE_INTERVAL", "300"))
+
+PENDING_COUNTER = "pending_alerts"
+
+
+def _recount() -> int:
+    db = SessionLocal()
+    try:
+        return count_pending_alerts(db)
+    finally:
+        db.close()
+
+
+class AlertCounters:
+    def __init__(self, reconcile_interval: float = ALERT_COUNTER_RECONCILE_INTERVAL):
+        self.reconcile_interval = reconcile_interval
+        self._task: Optional[asyncio.Task] = None
+        self.errors = 0
+
+    async def start(self):
+        await self.reconcile()
+        if self.reconcile_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            await self.reconcile()
+
+    async def reconcile(self) -> Optional[int]:
+        try:
+            pending = await run_in_threadpool(_recount)
+            await redis_client.set_counter(PENDING_COUNTER, pending)
+            return pending
+        except Exception as e:
+            self.errors += 1
+            print(f"Error reconciling alert counters: {e}")
+            return None
+
+    async def add_pending(self, amount: int):
+        if not amount:
+            return
+        try:
+            await redis_client.incr_counter(PENDING_COUNTER, amount)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error updating alert counters: {e}")
+
+    async def pending(self) -> Optional[int]:
+        """Current pending count, or None when the counter is unavailable"""
+        try:
+            return await redis_client.get_counter(PENDING_COUNTER)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error reading alert counters: {e}")
+            return None
+
+    def status(self) -> Dict:
+        return {'errors': self.errors}
+
+
+alert_counters = AlertCounters()
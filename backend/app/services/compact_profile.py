@@ -0,0 +1,330 @@
+"""
+Compact in-memory user profile store
+
+Profiles are held in one structured NumPy array, one fixed-width record per
+user, instead of JSON dicts of Python lists. Merchants and categories are
+interned to integer ids, typical hours become a 24-bit mask and categories
+a 64-bit mask. Location cells of all users share one pooled array; each
+record points at its segment.
+
+``CompactProfileStore.build_columns`` produces the same batch as
+``app.models.features.build_columns`` with vectorized gathers over the
+records; profile fields of a contiguous range of rows are exposed as
+zero-copy views.
+
+The records trade precision for size (float32 amounts, whole-second recent
+times, only the first 64 interned categories in the mask), so the store is a
+measurement aid for scripts/benchmark_compact_profiles.py; scoring reads the
+dict profiles.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.models.features import (
+    VELOCITY_WINDOW_SECONDS,
+    add_location_columns,
+    parse_timestamp,
+    transaction_columns,
+)
+from app.services.geo_index import LocationModel
+
+MAX_TYPICAL_MERCHANTS = 10
+MAX_RECENT_TIMES = 20
+MAX_CATEGORY_IDS = 64
+
+# Numeric statistics: 40 bytes per user
+STATS_FIELDS = [
+    ('avg_amount', 'f4'),
+    ('max_amount', 'f4'),
+    ('min_amount', 'f4'),
+    ('transaction_count', 'u4'),
+    ('unique_merchants', 'u2'),
+    ('unique_locations', 'u2'),
+    ('hour_mask', 'u4'),
+    ('last_transaction_at', 'f8'),
+    ('category_mask', 'u8'),
+]
+
+PROFILE_DTYPE = np.dtype(STATS_FIELDS + [
+    ('merchant_count', 'u1'),
+    ('merchants', 'u4', (MAX_TYPICAL_MERCHANTS,)),
+    ('recent_count', 'u1'),
+    ('recent_times', 'u4', (MAX_RECENT_TIMES,)),
+    ('last_latitude', 'f8'),
+    ('last_longitude', 'f8'),
+    ('last_location_seen', 'f8'),
+    ('cell_offset', 'u4'),
+    ('cell_count', 'u2'),
+    ('cell_capacity', 'u2'),
+])
+
+STATS_BYTES = np.dtype(STATS_FIELDS).itemsize
+
+
+class Interner:
+    """Bidirectional string <-> dense integer id mapping"""
+
+    __slots__ = ("ids", "values")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def intern(self, value: str) -> int:
+        existing = self.ids.get(value)
+        if existing is not None:
+            return existing
+        new_id = len(self.values)
+        self.ids[value] = new_id
+        self.values.append(value)
+        return new_id
+
+    def lookup(self, value: Optional[str]) -> int:
+        """Id of an already interned value, or -1"""
+        return self.ids.get(value, -1)
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _lowest_bit(masks: np.ndarray) -> np.ndarray:
+    masks = masks.astype(np.int64)
+    return np.log2(masks & -masks).astype(np.float64)
+
+
+def _highest_bit(masks: np.ndarray) -> np.ndarray:
+    return np.floor(np.log2(masks.astype(np.float64)))
+
+
+class CompactProfileStore:
+    """Fixed-width, array-backed profiles keyed by user id"""
+
+    def __init__(self, capacity: int = 1024):
+        self.records = np.zeros(capacity, dtype=PROFILE_DTYPE)
+        self.size = 0
+        self.index: Dict[str, int] = {}
+        self.merchants = Interner()
+        self.categories = Interner()
+        self.cell_pool = np.zeros(capacity, dtype=np.int64)
+        self.cell_counts = np.zeros(capacity, dtype=np.uint32)
+        self.pool_size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, user_id: str) -> int:
+        row = self.index.get(user_id)
+        if row is not None:
+            return row
+        if self.size == len(self.records):
+            grown = np.zeros(len(self.records) * 2, dtype=PROFILE_DTYPE)
+            grown[:self.size] = self.records[:self.size]
+            self.records = grown
+        row = self.size
+        self.size += 1
+        self.index[user_id] = row
+        return row
+
+    def put(self, user_id: str, profile: Dict):
+        """Store a profile in the dict form produced by build_profile"""
+        row = self._allocate(user_id)
+        record = self.records[row]
+        record['avg_amount'] = profile.get('avg_amount', 0) or 0
+        record['max_amount'] = profile.get('max_amount', 0) or 0
+        record['min_amount'] = profile.get('min_amount', 0) or 0
+        record['transaction_count'] = profile.get('transaction_count', 0) or 0
+        record['unique_merchants'] = profile.get('unique_merchants', 0) or 0
+        record['unique_locations'] = profile.get('unique_locations', 0) or 0
+
+        hour_mask = 0
+        for hour in profile.get('typical_hours') or []:
+            hour_mask |= 1 << int(hour)
+        record['hour_mask'] = hour_mask
+
+        category_mask = 0
+        for category in profile.get('typical_categories') or []:
+            category_id = self.categories.intern(category)
+            if category_id < MAX_CATEGORY_IDS:
+                category_mask |= 1 << category_id
+        record['category_mask'] = category_mask
+
+        last_seen = parse_timestamp(profile.get('last_transaction_at'))
+        record['last_transaction_at'] = last_seen.timestamp() if last_seen else 0.0
+
+        merchants = [self.merchants.intern(m) for m in (profile.get('typical_merchants') or [])]
+        merchants = merchants[:MAX_TYPICAL_MERCHANTS]
+        record['merchant_count'] = len(merchants)
+        record['merchants'][:] = 0
+        record['merchants'][:len(merchants)] = merchants
+
+        recent = (profile.get('recent_transaction_times') or [])[-MAX_RECENT_TIMES:]
+        record['recent_count'] = len(recent)
+        record['recent_times'][:] = 0
+        record['recent_times'][:len(recent)] = recent
+
+        self._put_locations(record, profile.get('locations'))
+
+    def _put_locations(self, record, locations: Optional[Dict]):
+        locations = locations or {}
+        cells = locations.get('cells') or []
+        counts = locations.get('counts') or []
+        k = len(cells)
+
+        # Reuse the record's segment when it fits; otherwise append a new one
+        # (the old segment is left unused)
+        if k > record['cell_capacity']:
+            capacity = min(max(k, 2 * int(record['cell_capacity'])), np.iinfo(np.uint16).max)
+            if self.pool_size + capacity > len(self.cell_pool):
+                size = max(len(self.cell_pool) * 2, self.pool_size + capacity)
+                self.cell_pool = np.resize(self.cell_pool, size)
+                self.cell_counts = np.resize(self.cell_counts, size)
+            record['cell_offset'] = self.pool_size
+            record['cell_capacity'] = capacity
+            self.pool_size += capacity
+
+        offset = int(record['cell_offset'])
+        self.cell_pool[offset:offset + k] = cells
+        self.cell_counts[offset:offset + k] = counts
+        record['cell_count'] = k
+
+        last_latitude = locations.get('last_latitude')
+        last_seen = locations.get('last_seen')
+        record['last_latitude'] = last_latitude if last_latitude is not None else np.nan
+        record['last_longitude'] = locations.get('last_longitude') if last_latitude is not None else np.nan
+        record['last_location_seen'] = last_seen if last_seen is not None else np.nan
+
+    def _location_models(self, records: np.ndarray, present: np.ndarray) -> List[Optional[LocationModel]]:
+        """LocationModels for a gathered batch of records (None where absent)"""
+        offsets = records['cell_offset'].tolist()
+        counts = records['cell_count'].tolist()
+        last_lat = records['last_latitude'].tolist()
+        last_lon = records['last_longitude'].tolist()
+        last_seen = records['last_location_seen'].tolist()
+        pool = self.cell_pool
+        pool_counts = self.cell_counts
+
+        models = []
+        for i, is_present in enumerate(present.tolist()):
+            k = counts[i]
+            if not is_present or (not k and last_lat[i] != last_lat[i]):
+                models.append(None)
+                continue
+            model = LocationModel()
+            offset = offsets[i]
+            model.counts = dict(zip(
+                pool[offset:offset + k].tolist(), pool_counts[offset:offset + k].tolist()
+            ))
+            # NaN != NaN marks an unknown last position
+            if last_lat[i] == last_lat[i]:
+                model.last_latitude = last_lat[i]
+                model.last_longitude = last_lon[i]
+            if last_seen[i] == last_seen[i]:
+                model.last_seen = last_seen[i]
+            models.append(model)
+        return models
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        """Expand a stored profile back into the dict form"""
+        row = self.index.get(user_id)
+        if row is None:
+            return None
+        record = self.records[row]
+        hour_mask = int(record['hour_mask'])
+        category_mask = int(record['category_mask'])
+        last_seen = float(record['last_transaction_at'])
+        location_model = self._location_models(self.records[row:row + 1], np.ones(1, dtype=bool))[0]
+        return {
+            'user_id': user_id,
+            'transaction_count': int(record['transaction_count']),
+            'avg_amount': float(record['avg_amount']),
+            'max_amount': float(record['max_amount']),
+            'min_amount': float(record['min_amount']),
+            'unique_merchants': int(record['unique_merchants']),
+            'typical_merchants': [
+                self.merchants.values[m] for m in record['merchants'][:record['merchant_count']]
+            ],
+            'typical_categories': [
+                self.categories.values[c] for c in range(min(len(self.categories), MAX_CATEGORY_IDS))
+                if category_mask >> c & 1
+            ],
+            'unique_locations': int(record['unique_locations']),
+            'locations': location_model.to_dict() if location_model else None,
+            'typical_hours': [h for h in range(24) if hour_mask >> h & 1],
+            'last_transaction_at': datetime.fromtimestamp(last_seen).isoformat() if last_seen else None,
+            'recent_transaction_times': [
+                float(t) for t in record['recent_times'][:record['recent_count']]
+            ],
+        }
+
+    def has_merchant(self, user_id: str, merchant: str) -> bool:
+        row = self.index.get(user_id)
+        merchant_id = self.merchants.lookup(merchant)
+        if row is None or merchant_id < 0:
+            return False
+        count = int(self.records['merchant_count'][row])
+        return merchant_id in self.records['merchants'][row, :count].tolist()
+
+    def profile_columns(self, rows: Union[slice, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Profile fields for ``rows``; views without copying when ``rows`` is a slice"""
+        records = self.records[:self.size][rows]
+        return {name: records[name] for name in PROFILE_DTYPE.names}
+
+    def build_columns(self, transactions: Sequence[Dict]) -> Dict[str, np.ndarray]:
+        """Columnar batch for ``transactions`` using the stored profiles"""
+        columns = transaction_columns(transactions)
+        n = len(transactions)
+        rows = np.fromiter(
+            (self.index.get(t['user_id'], -1) for t in transactions), dtype=np.int64, count=n
+        )
+        has_profile = rows >= 0
+        columns['has_profile'] = has_profile
+        amount = columns['amount']
+
+        records = self.records[np.where(has_profile, rows, 0)]
+
+        columns['avg_amount'] = np.where(has_profile, records['avg_amount'], amount)
+        columns['transaction_count'] = np.where(has_profile, records['transaction_count'], 1.0)
+        columns['unique_merchants'] = np.where(has_profile, records['unique_merchants'], 1.0)
+        columns['unique_locations'] = np.where(has_profile, records['unique_locations'], 1.0)
+
+        avg_amount = records['avg_amount'].astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns['amount_deviation_ratio'] = np.where(
+                has_profile & (avg_amount > 0), np.abs(amount - avg_amount) / avg_amount, np.nan
+            )
+
+            hour_mask = records['hour_mask']
+            has_hours = has_profile & (hour_mask > 0)
+            safe_mask = np.where(has_hours, hour_mask, 1)
+            min_hour = np.where(has_hours, _lowest_bit(safe_mask), np.nan)
+            max_hour = np.where(has_hours, _highest_bit(safe_mask), np.nan)
+        columns['profile_min_hour'] = min_hour
+        columns['profile_max_hour'] = max_hour
+        columns['profile_hour_range'] = max_hour - min_hour
+
+        merchant_ids = np.fromiter(
+            (self.merchants.lookup(t.get('merchant')) for t in transactions), dtype=np.int64, count=n
+        )
+        merchant_count = records['merchant_count'].astype(np.int64)
+        slots = np.arange(MAX_TYPICAL_MERCHANTS) < merchant_count[:, None]
+        known = ((records['merchants'] == merchant_ids[:, None]) & slots).any(axis=1)
+        columns['typical_merchant_count'] = np.where(has_profile, merchant_count, np.nan)
+        columns['merchant_known'] = np.where(has_profile, known.astype(np.float64), np.nan)
+
+        seen_at = columns['seen_at']
+        last_seen = records['last_transaction_at']
+        columns['seconds_since_last_transaction'] = np.where(
+            has_profile & (last_seen > 0), seen_at - last_seen, np.nan
+        )
+        recent_slots = np.arange(MAX_RECENT_TIMES) < records['recent_count'][:, None]
+        gaps = seen_at[:, None] - records['recent_times']
+        in_window = recent_slots & (gaps >= 0) & (gaps <= VELOCITY_WINDOW_SECONDS)
+        columns['transactions_last_hour'] = np.where(
+            has_profile & ~np.isnan(seen_at), in_window.sum(axis=1), np.nan
+        )
+
+        add_location_columns(columns, self._location_models(records, has_profile))
+        return columns
+
@@ -1,18 +1,59 @@
 import joblib
+import hashlib
 import numpy as np
 import pandas as pd
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 import os
 import random
+import time
 
+from app.models.features import add_graph_columns, build_columns, default_pipeline
 from app.services.redis_client import redis_client
+from app.services.rule_engine import RuleEngine
+from app.services.scoring_cascade import RULES_STAGE, ScoringCascade
+
+# Source of the demo risk noise: "random" (process-wide RNG), "seeded" (one RNG
+# per transaction seeded from SCORING_SEED and its transaction_id, so a
+# transaction always scores the same) or "fixed" (no noise: every draw is the
+# midpoint of its range)
+SCORING_MODE = os.getenv("SCORING_MODE", "random")
+SCORING_SEED = os.getenv("SCORING_SEED", "0")
+SCORING_MODES = ("random", "seeded", "fixed")
+
+# Risk score at or above which a transaction is flagged as fraud
+FRAUD_THRESHOLD = 70
+
+class FixedRandom:
+    """Stand-in for ``random`` that always returns the middle of the range"""
+
+    def random(self) -> float:
+        return 0.5
+
+    def uniform(self, a: float, b: float) -> float:
+        return (a + b) / 2
+
+_fixed_random = FixedRandom()
+
+def transaction_random(transaction_id: Optional[str], mode: str = SCORING_MODE, seed: str = SCORING_SEED):
+    """The random source used for one transaction's score"""
+    if mode == "fixed":
+        return _fixed_random
+    if mode == "seeded" and transaction_id is not None:
+        digest = hashlib.blake2b(f"{seed}:{transaction_id}".encode(), digest_size=8).digest()
+        return random.Random(int.from_bytes(digest, "big"))
+    return random
 
 class FraudDetector:
-    def __init__(self):
+    def __init__(self, scoring_mode: str = SCORING_MODE):
+        if scoring_mode not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode '{scoring_mode}' (expected one of {SCORING_MODES})")
+        self.scoring_mode = scoring_mode
         self.isolation_forest = None
         self.xgboost_model = None
         self.feature_scaler = None
+        self.rule_engine = RuleEngine()
+        self.cascade = ScoringCascade()
         self.load_models()
 
     def load_models(self):
@@ -31,7 +72,8 @@ class FraudDetector:
     async def detect_fraud(
         self,
         transaction: Dict,
-        user_profile: Optional[Dict] = None
+        user_profile: Optional[Dict] = None,
+        deadline_ms: Optional[float] = None
     ) -> Dict:
         """
         Detect fraud in a transaction using ML models and behavioral analytics
@@ -43,106 +85,224 @@ class FraudDetector:
                 'is_fraud': bool,
                 'risk_score': float (0-100),
                 'reasons': List[str],
-                'alert_type': str
+                'alert_type': str,
+                'stages_run': List[str],
+                'ring_points': float (points from fraud-ring rules)
             }
         """
-        reasons = []
-        risk_score = 0.0
-        alert_type = "normal"
-
         # Get user profile from Redis if not provided
         if user_profile is None:
             user_profile = await redis_client.get_user_profile(transaction['user_id'])
 
-        # Extract features
-        features = self._extract_features(transaction, user_profile)
-
-        # Base risk score - balanced distribution for demo
-        # 60% low risk, 20% medium, 12% high, 5% critical, 3% fraud
-        rand = random.random()
-        if rand < 0.60:  # 60% low risk
-            base_risk = random.uniform(5, 30)
-        elif rand < 0.80:  # 20% medium risk
-            base_risk = random.uniform(30, 50)
-        elif rand < 0.92:  # 12% high risk
-            base_risk = random.uniform(50, 70)
-        elif rand < 0.97:  # 5% critical risk
-            base_risk = random.uniform(70, 85)
-        else:  # 3% fraud
-            base_risk = random.uniform(75, 95)
-        risk_score = base_risk
-
-        # Anomaly detection using Isolation Forest (only adds significant risk if truly anomalous)
+        return self.score_batch([transaction], [user_profile], deadline_ms=deadline_ms)[0]
+
+    async def detect_fraud_batch(
+        self,
+        transactions: List[Dict],
+        user_profiles: Optional[List[Optional[Dict]]] = None,
+        deadline_ms: Optional[float] = None
+    ) -> List[Dict]:
+        """Detect fraud for a batch of transactions with one model call per stage"""
+        if user_profiles is None:
+            user_profiles = [
+                await redis_client.get_user_profile(t['user_id']) for t in transactions
+            ]
+        return self.score_batch(transactions, user_profiles, deadline_ms=deadline_ms)
+
+    def score_batch(
+        self,
+        transactions: List[Dict],
+        user_profiles: List[Optional[Dict]],
+        deadline_ms: Optional[float] = None,
+        rules_only: bool = False,
+        graph_features: Optional[List[Optional[Dict]]] = None,
+        started: Optional[float] = None
+    ) -> List[Dict]:
+        """Score already-resolved transactions and profiles (no I/O)
+
+        Runs the scoring cascade: rules and profile checks for every row,
+        then each model stage only for rows whose running score is inside
+        that stage's uncertainty band and while the deadline has room.
+        ``rules_only`` skips the model stages entirely. ``graph_features``
+        are per-row fraud-ring features from app.services.fraud_graph.
+        ``started`` is the perf_counter time the request arrived, so the
+        deadline covers the time spent before scoring (default: now).
+        """
+        if not transactions:
+            return []
+        started = time.perf_counter() if started is None else started
+        columns = build_columns(transactions, user_profiles)
+        if graph_features is not None:
+            add_graph_columns(columns, graph_features)
+        return self.score_columns(columns, deadline_ms, rules_only, started, self._randoms(transactions))
+
+    def _randoms(self, transactions: Sequence[Dict]) -> List:
+        return [transaction_random(t.get('transaction_id'), self.scoring_mode) for t in transactions]
+
+    def score_columns(
+        self,
+        columns: Dict[str, np.ndarray],
+        deadline_ms: Optional[float] = None,
+        rules_only: bool = False,
+        started: Optional[float] = None,
+        randoms: Optional[List] = None
+    ) -> List[Dict]:
+        """Run the cascade over an already built columnar batch
+
+        ``randoms`` holds each row's random source (see transaction_random);
+        rows share the process-wide RNG when it is omitted. Rows draw in a
+        fixed order, so a seeded row scores the same alone or in a batch as
+        long as the same stages run (a cascade deadline can still skip them).
+        """
+        started = time.perf_counter() if started is None else started
+        n = len(columns['amount'])
+        randoms = [random] * n if randoms is None else randoms
+        risk_scores, reasons, ring_points = self._rules_stage(columns, randoms)
+        stages_run = [[RULES_STAGE] for _ in range(n)]
+
+        if not rules_only:
+            features = None
+            for stage in self.cascade.config.stages:
+                apply_stage = self._model_stages().get(stage.name)
+                if apply_stage is None:
+                    continue
+                mask = self.cascade.select(stage, risk_scores, started, deadline_ms)
+                rows = np.flatnonzero(mask)
+                if not len(rows):
+                    continue
+                if features is None:
+                    features = self._extract_features(columns)
+                    if self.feature_scaler is not None:
+                        features = self.feature_scaler.transform(features)
+
+                stage_started = time.perf_counter()
+                apply_stage(features[rows], rows, risk_scores, reasons, randoms)
+                self.cascade.costs.record(stage.name, len(rows), time.perf_counter() - stage_started)
+                for row in rows:
+                    stages_run[row].append(stage.name)
+
+        return [
+            self._finalize(risk_scores[i], reasons[i], stages_run[i], randoms[i], ring_points[i])
+            for i in range(n)
+        ]
+
+    def _model_stages(self) -> Dict:
+        stages = {}
         if self.isolation_forest is not None:
-            try:
-                anomaly_score = self.isolation_forest.decision_function([features])[0]
-                anomaly_prediction = self.isolation_forest.predict([features])[0]
-                
-                # Isolation Forest: -1 = anomaly, 1 = normal
-                # Add risk if anomalous
-                if anomaly_prediction == -1:
-                    # Convert anomaly score to risk (anomaly_score is typically negative for anomalies)
-                    # More negative = more anomalous
-                    anomaly_risk = min(40, max(20, abs(anomaly_score) * 12))
-                    risk_score += anomaly_risk
-                    reasons.append("Transaction pattern deviates from normal behavior")
-                    alert_type = "anomaly"
-                elif anomaly_score < -0.3:  # Somewhat anomalous but not flagged
-                    risk_score += random.uniform(10, 20)
-                    if risk_score > 40:
-                        reasons.append("Unusual transaction pattern detected")
-            except Exception as e:
-                print(f"Error in Isolation Forest: {e}")
-
-        # Behavioral pattern analysis (more sensitive for demo)
-        if user_profile:
-            behavioral_risk = self._check_behavioral_patterns(transaction, user_profile)
-            risk_score += behavioral_risk['score']
-            reasons.extend(behavioral_risk['reasons'])
-            if behavioral_risk['score'] > 15:
-                alert_type = "behavioral"
-        else:
-            # New user - moderate increase
-            new_user_risk = random.uniform(8, 18)
-            risk_score += new_user_risk
-            if risk_score > 25:
-                reasons.append("New user - limited transaction history")
-
-        # Rule-based checks (conservative scoring)
-        rule_checks = self._rule_based_checks(transaction, user_profile)
-        risk_score += rule_checks['score']
-        reasons.extend(rule_checks['reasons'])
-
-        # XGBoost model prediction (if available) - weighted appropriately
+            stages["isolation_forest"] = self._isolation_forest_stage
         if self.xgboost_model is not None and self.feature_scaler is not None:
-            try:
-                scaled_features = self.feature_scaler.transform([features])
-                xgb_prediction = self.xgboost_model.predict_proba(scaled_features)[0]
-                fraud_probability = xgb_prediction[1] if len(xgb_prediction) > 1 else xgb_prediction[0]
-                
-                # Only add significant risk if model is confident (>0.6)
-                if fraud_probability > 0.6:
-                    # Scale the contribution - don't let it dominate
-                    ml_contribution = (fraud_probability - 0.6) * 25  # Max 10 points if prob=1.0
-                    risk_score += ml_contribution
-                    if fraud_probability > 0.75:
-                        reasons.append("ML model indicates elevated fraud probability")
-                        alert_type = "pattern"
-            except Exception as e:
-                print(f"Error in XGBoost prediction: {e}")
+            stages["xgboost"] = self._xgboost_stage
+        return stages
 
+    def _rules_stage(self, columns: Dict[str, np.ndarray], randoms: List):
+        """Base risk plus the rule engine's behavioral and rule-based scores
+
+        Also returns each row's points from fraud-ring rules, so callers can
+        tell whether a row would be fraud without them.
+        """
+        rules = self.rule_engine.evaluate(columns)
+        has_profile = columns['has_profile']
+        risk_scores = np.empty(len(has_profile))
+        ring_points = rules.graph_scores['rules'] + np.where(has_profile, rules.graph_scores['behavioral'], 0.0)
+        reasons = []
+
+        for i in range(len(has_profile)):
+            row_reasons = []
+            rng = randoms[i]
+
+            # Base risk score - balanced distribution for demo
+            # 60% low risk, 20% medium, 12% high, 5% critical, 3% fraud
+            rand = rng.random()
+            if rand < 0.60:  # 60% low risk
+                base_risk = rng.uniform(5, 30)
+            elif rand < 0.80:  # 20% medium risk
+                base_risk = rng.uniform(30, 50)
+            elif rand < 0.92:  # 12% high risk
+                base_risk = rng.uniform(50, 70)
+            elif rand < 0.97:  # 5% critical risk
+                base_risk = rng.uniform(70, 85)
+            else:  # 3% fraud
+                base_risk = rng.uniform(75, 95)
+            risk_score = base_risk
+
+            # Behavioral pattern analysis (more sensitive for demo)
+            if has_profile[i]:
+                risk_score += rules.scores['behavioral'][i]
+                row_reasons.extend(rules.reasons['behavioral'][i])
+            else:
+                # New user - moderate increase
+                new_user_risk = rng.uniform(8, 18)
+                risk_score += new_user_risk
+                if risk_score > 25:
+                    row_reasons.append("New user - limited transaction history")
+
+            # Rule-based checks (conservative scoring)
+            risk_score += rules.scores['rules'][i]
+            row_reasons.extend(rules.reasons['rules'][i])
+
+            risk_scores[i] = risk_score
+            reasons.append(row_reasons)
+
+        return risk_scores, reasons, ring_points
+
+    def _isolation_forest_stage(self, features: np.ndarray, rows: np.ndarray,
+                                risk_scores: np.ndarray, reasons: List[List[str]], randoms: List):
+        """Anomaly detection (only adds significant risk if truly anomalous)"""
+        try:
+            anomaly_scores = self.isolation_forest.decision_function(features)
+            anomaly_predictions = self.isolation_forest.predict(features)
+        except Exception as e:
+            print(f"Error in Isolation Forest: {e}")
+            return
+
+        for row, anomaly_score, anomaly_prediction in zip(rows, anomaly_scores, anomaly_predictions):
+            # Isolation Forest: -1 = anomaly, 1 = normal
+            # Add risk if anomalous
+            if anomaly_prediction == -1:
+                # Convert anomaly score to risk (anomaly_score is typically negative for anomalies)
+                # More negative = more anomalous
+                anomaly_risk = min(40, max(20, abs(anomaly_score) * 12))
+                risk_scores[row] += anomaly_risk
+                reasons[row].append("Transaction pattern deviates from normal behavior")
+            elif anomaly_score < -0.3:  # Somewhat anomalous but not flagged
+                risk_scores[row] += randoms[row].uniform(10, 20)
+                if risk_scores[row] > 40:
+                    reasons[row].append("Unusual transaction pattern detected")
+
+    def _xgboost_stage(self, features: np.ndarray, rows: np.ndarray,
+                       risk_scores: np.ndarray, reasons: List[List[str]], randoms: List):
+        """XGBoost model prediction - weighted appropriately"""
+        try:
+            probabilities = self.xgboost_model.predict_proba(features)
+        except Exception as e:
+            print(f"Error in XGBoost prediction: {e}")
+            return
+        fraud_probabilities = probabilities[:, 1] if probabilities.shape[1] > 1 else probabilities[:, 0]
+
+        for row, fraud_probability in zip(rows, fraud_probabilities):
+            # Only add significant risk if model is confident (>0.6)
+            if fraud_probability > 0.6:
+                # Scale the contribution - don't let it dominate
+                ml_contribution = (fraud_probability - 0.6) * 25  # Max 10 points if prob=1.0
+                risk_scores[row] += ml_contribution
+                if fraud_probability > 0.75:
+                    reasons[row].append("ML model indicates elevated fraud probability")
+
+    def _finalize(self, risk_score: float, reasons: List[str], stages_run: List[str], rng=random,
+                  ring_points: float = 0.0) -> Dict:
+        """Turn the accumulated risk into the final decision"""
         # Add some realistic variance to avoid all scores being the same
-        risk_score += random.uniform(-3, 3)
+        risk_score += rng.uniform(-3, 3)
 
         # Normalize risk score to 0-100
         risk_score = min(100, max(0, risk_score))
 
         # Fraud threshold - balanced for demo (3-5% fraud rate)
         # Lower threshold to show some frauds for hackathon demo
-        is_fraud = risk_score >= 70  # Flag as fraud if risk >= 70
+        is_fraud = risk_score >= FRAUD_THRESHOLD
 
         # Determine alert type based on risk score
-        if risk_score >= 70:
+        if risk_score >= FRAUD_THRESHOLD:
             alert_type = "critical"
         elif risk_score >= 50:
             alert_type = "high_risk"
@@ -154,146 +314,18 @@ class FraudDetector:
         # Add reasons for medium+ risk transactions
         if risk_score < 30 and not reasons:
             # For low risk, add a generic reason occasionally
-            if random.random() < 0.1:  # 10% chance
+            if rng.random() < 0.1:  # 10% chance
                 reasons = ["Transaction appears normal"]
         
         return {
-            'is_fraud': is_fraud,
-            'risk_score': round(risk_score, 2),
+            'is_fraud': bool(is_fraud),
+            'risk_score': round(float(risk_score), 2),
             'reasons': reasons if risk_score >= 30 else [],  # Show reasons for medium+ risk
-            'alert_type': alert_type
+            'alert_type': alert_type,
+            'stages_run': stages_run,
+            'ring_points': float(ring_points)
         }
 
-    def _extract_features(self, transaction: Dict, user_profile: Optional[Dict]) -> np.ndarray:
-        """Extract features for ML models"""
-        features = []
-
-        # Transaction amount (normalized)
-        features.append(min(transaction['amount'], 50000) / 1000)  # Normalize to 0-50 range
-
-        # Time-based features
-        if transaction.get('timestamp'):
-            if isinstance(transaction['timestamp'], str):
-                dt = datetime.fromisoformat(transaction['timestamp'].replace('Z', '+00:00'))
-            else:
-                dt = transaction['timestamp']
-            features.append(dt.hour)
-            features.append(dt.weekday())
-        else:
-            features.extend([12, 0])  # Default values
-
-        # Location features (normalized)
-        features.append((transaction.get('latitude', 0.0) or 0.0) / 100)
-        features.append((transaction.get('longitude', 0.0) or 0.0) / 100)
-
-        # User profile features
-        if user_profile:
-            avg_amount = user_profile.get('avg_amount', transaction['amount'])
-            features.append(min(avg_amount, 50000) / 1000)
-            features.append(min(user_profile.get('transaction_count', 1), 1000) / 100)
-            features.append(min(user_profile.get('unique_merchants', 1), 100) / 10)
-            features.append(min(user_profile.get('unique_locations', 1), 50) / 10)
-        else:
-            features.extend([transaction['amount'] / 1000, 0.01, 0.1, 0.1])
-
-        # Amount deviation (normalized)
-        if user_profile:
-            avg_amount = user_profile.get('avg_amount', transaction['amount'])
-            if avg_amount > 0:
-                amount_deviation = abs(transaction['amount'] - avg_amount) / avg_amount
-                features.append(min(amount_deviation, 5.0))  # Cap at 5x
-            else:
-                features.append(0.0)
-        else:
-            features.append(0.0)
-
-        return np.array(features)
-
-    def _check_behavioral_patterns(self, transaction: Dict, user_profile: Dict) -> Dict:
-        """Check transaction against user's behavioral patterns - realistic scoring"""
-        score = 0.0
-        reasons = []
-
-        # Amount deviation (more nuanced)
-        avg_amount = user_profile.get('avg_amount', 0)
-        if avg_amount > 0:
-            deviation = abs(transaction['amount'] - avg_amount) / avg_amount
-            # Only flag significant deviations
-            if deviation > 3.0:  # More than 300% deviation
-                score += 20
-                reasons.append(f"Transaction amount (${transaction['amount']:.2f}) is 3x different from user average (${avg_amount:.2f})")
-            elif deviation > 2.0:  # More than 200% deviation
-                score += 12
-                reasons.append(f"Unusually large transaction amount")
-            elif deviation > 1.5:  # More than 150% deviation
-                score += 5
-                # Don't add reason for minor deviations
-
-        # Time pattern (less strict)
-        if transaction.get('timestamp'):
-            if isinstance(transaction['timestamp'], str):
-                dt = datetime.fromisoformat(transaction['timestamp'].replace('Z', '+00:00'))
-            else:
-                dt = transaction['timestamp']
-            
-            typical_hours = user_profile.get('typical_hours', [])
-            if typical_hours and len(typical_hours) > 0:
-                # Only flag if transaction is at very unusual time (outside typical range)
-                hour_range = max(typical_hours) - min(typical_hours)
-                if hour_range > 0:
-                    if dt.hour < min(typical_hours) - 4 or dt.hour > max(typical_hours) + 4:
-                        score += 10
-                        reasons.append(f"Transaction at unusual time ({dt.hour}:00)")
-
-        # Location pattern (more lenient)
-        if transaction.get('latitude') and transaction.get('longitude'):
-            typical_locations = user_profile.get('typical_locations', [])
-            if typical_locations and len(typical_locations) > 0:
-                # Check if location is significantly far (more than 0.5 degrees = ~50km)
-                current_loc = (transaction['latitude'], transaction['longitude'])
-                is_far = True
-                for loc in typical_locations:
-                    if abs(current_loc[0] - loc[0]) < 0.5 and abs(current_loc[1] - loc[1]) < 0.5:
-                        is_far = False
-                        break
-                if is_far:
-                    score += 15
-                    reasons.append("Transaction from unfamiliar location (>50km from typical)")
-
-        # Merchant pattern (very lenient - new merchants are common)
-        typical_merchants = user_profile.get('typical_merchants', [])
-        if typical_merchants and len(typical_merchants) > 10:
-            # Only flag if user has many merchants and this is completely new
-            if transaction['merchant'] not in typical_merchants:
-                score += 2  # Very minor risk
-                # Don't add reason for new merchants (too common)
-
-        return {'score': score, 'reasons': reasons}
-
-    def _rule_based_checks(self, transaction: Dict, user_profile: Optional[Dict]) -> Dict:
-        """Rule-based fraud detection checks - conservative scoring"""
-        score = 0.0
-        reasons = []
-
-        # Large transaction checks (more sensitive for demo)
-        if transaction['amount'] > 15000:  # Very large
-            score += 30
-            reasons.append("Very large transaction amount (>$15,000)")
-        elif transaction['amount'] > 8000:  # Large
-            score += 18
-            reasons.append("Large transaction amount (>$8,000)")
-        elif transaction['amount'] > 5000:  # Medium-large
-            score += 10
-            reasons.append("Above-average transaction amount (>$5,000)")
-
-        # Negative or zero amount (shouldn't happen)
-        if transaction['amount'] <= 0:
-            score += 50
-            reasons.append("Invalid transaction amount")
-
-        # Missing critical information
-        if not transaction.get('merchant'):
-            score += 8
-            reasons.append("Missing merchant information")
-
-        return {'score': score, 'reasons': reasons}
+    def _extract_features(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Extract features for ML models from a columnar batch"""
+        return default_pipeline.transform(columns)
@@ -0,0 +1,371 @@
+"""
+Incremental fraud-ring graph over users and shared entities
+
+Users are linked through the entities their transactions touch: a device id
+when the transaction carries one, and a tight co-occurrence of merchant,
+place and time (the same merchant in the same FRAUD_GRAPH_PLACE_CELL_DEG
+cell, ~100 m, within the same FRAUD_GRAPH_CO_OCCURRENCE_WINDOW-second slot).
+A shared merchant or a coarse location cell alone does not link, since
+ordinary customers share both all the time.
+
+Connected components are kept with a union-find (union by size, path
+halving), so linking a transaction costs a few near-constant finds and
+unions. Each component root carries its user count, how many of those users
+were flagged as fraud, and an exponentially decayed count of users that
+joined it recently (time constant FRAUD_GRAPH_GROWTH_WINDOW). Users should
+only be flagged on evidence other than the ring rules, or the ring's own
+score would raise its density.
+
+Entities shared by more than FRAUD_GRAPH_MAX_ENTITY_USERS users (a busy
+shop at rush hour) stop linking, and a link that would grow a component
+past FRAUD_GRAPH_MAX_COMPONENT_USERS users is skipped, so components stay
+ring-sized instead of chaining ordinary traffic into one giant component.
+
+Union-find cannot delete edges, so expiry is by rebuild: every
+FRAUD_GRAPH_REBUILD_INTERVAL seconds the edges older than FRAUD_GRAPH_WINDOW
+are dropped, the surviving nodes are renumbered and the components are
+recomputed with a vectorized connected-components pass in a worker thread;
+links made meanwhile are replayed before the swap.
+
+Node state lives in typed arrays (a few dozen bytes per node plus its key),
+so millions of nodes fit in memory. State is per process.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.models.features import parse_timestamp
+from app.services.geo_index import cell_id
+
+FRAUD_GRAPH_ENABLED = os.getenv("FRAUD_GRAPH_ENABLED", "true").lower() == "true"
+FRAUD_GRAPH_WINDOW = float(os.getenv("FRAUD_GRAPH_WINDOW", "86400"))
+FRAUD_GRAPH_REBUILD_INTERVAL = float(os.getenv("FRAUD_GRAPH_REBUILD_INTERVAL", "300"))
+FRAUD_GRAPH_CO_OCCURRENCE_WINDOW = float(os.getenv("FRAUD_GRAPH_CO_OCCURRENCE_WINDOW", "60"))
+FRAUD_GRAPH_PLACE_CELL_DEG = float(os.getenv("FRAUD_GRAPH_PLACE_CELL_DEG", "0.001"))
+FRAUD_GRAPH_MAX_ENTITY_USERS = int(os.getenv("FRAUD_GRAPH_MAX_ENTITY_USERS", "25"))
+FRAUD_GRAPH_MAX_COMPONENT_USERS = int(os.getenv("FRAUD_GRAPH_MAX_COMPONENT_USERS", "50"))
+FRAUD_GRAPH_GROWTH_WINDOW = float(os.getenv("FRAUD_GRAPH_GROWTH_WINDOW", "3600"))
+
+# Typed array per node field; component fields are only meaningful at roots
+_NODE_FIELDS = {
+    "parent": "i",
+    "size": "i",         # nodes in the component (union by size)
+    "users": "i",        # user nodes in the component
+    "fraud": "i",        # flagged user nodes in the component
+    "growth": "d",       # decayed count of users that joined recently
+    "growth_at": "d",    # time growth was last updated
+    "is_user": "b",
+    "flagged_at": "d",   # time a user was last flagged as fraud (0 = never)
+    "last_user": "i",    # last user linked to an entity
+    "degree": "i",       # users linked to an entity
+}
+
+_DTYPES = {"i": np.int32, "d": np.float64, "b": np.int8}
+
+
+def _to_numpy(values: array) -> np.ndarray:
+    return np.frombuffer(values, dtype=_DTYPES[values.typecode]).copy()
+
+
+def _to_array(typecode: str, values: np.ndarray) -> array:
+    result = array(typecode)
+    result.frombytes(np.ascontiguousarray(values, dtype=_DTYPES[typecode]).tobytes())
+    return result
+
+
+def entity_keys(transaction: Dict, now: float) -> List[str]:
+    """Keys of the entities a transaction links its user to"""
+    keys = []
+    merchant = transaction.get('merchant')
+    if merchant and transaction.get('latitude') and transaction.get('longitude'):
+        seen_at = parse_timestamp(transaction.get('timestamp'))
+        at = seen_at.timestamp() if seen_at else now
+        cell = cell_id(transaction['latitude'], transaction['longitude'], FRAUD_GRAPH_PLACE_CELL_DEG)
+        keys.append(f"p:{merchant}:{cell}:{int(at // FRAUD_GRAPH_CO_OCCURRENCE_WINDOW)}")
+    if transaction.get('device_id'):
+        keys.append(f"d:{transaction['device_id']}")
+    return keys
+
+
+class FraudGraph:
+    def __init__(
+        self,
+        enabled: bool = FRAUD_GRAPH_ENABLED,
+        window: float = FRAUD_GRAPH_WINDOW,
+        rebuild_interval: float = FRAUD_GRAPH_REBUILD_INTERVAL,
+        max_entity_users: int = FRAUD_GRAPH_MAX_ENTITY_USERS,
+        max_component_users: int = FRAUD_GRAPH_MAX_COMPONENT_USERS,
+        growth_window: float = FRAUD_GRAPH_GROWTH_WINDOW
+    ):
+        self.enabled = enabled
+        self.window = window
+        self.rebuild_interval = rebuild_interval
+        self.max_entity_users = max_entity_users
+        self.max_component_users = max_component_users
+        self.growth_window = growth_window
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._reset()
+        self.hub_links_skipped = 0
+        self.component_links_skipped = 0
+        self.rebuilds = 0
+        self.last_rebuild_seconds = 0.0
+
+    def _reset(self):
+        self._index: Dict[str, int] = {}
+        self._keys: List[str] = []
+        for name, typecode in _NODE_FIELDS.items():
+            setattr(self, f"_{name}", array(typecode))
+        # Edges in insertion (time) order: user node, entity node, time
+        self._edge_user = array("i")
+        self._edge_entity = array("i")
+        self._edge_time = array("d")
+        # Flags set before this time were dropped or recounted by the last rebuild
+        self._counted_since = 0.0
+        self._fraud_log: Optional[List] = None
+
+    # Union-find
+
+    def _node(self, key: str, is_user: bool, now: float) -> int:
+        node = self._index.get(key)
+        if node is not None:
+            return node
+        node = len(self._keys)
+        self._index[key] = node
+        self._keys.append(key)
+        self._parent.append(node)
+        self._size.append(1)
+        self._users.append(1 if is_user else 0)
+        self._fraud.append(0)
+        self._growth.append(0.0)
+        self._growth_at.append(now)
+        self._is_user.append(1 if is_user else 0)
+        self._flagged_at.append(0.0)
+        self._last_user.append(-1)
+        self._degree.append(0)
+        return node
+
+    def _find(self, node: int) -> int:
+        parent = self._parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _decayed_growth(self, root: int, now: float) -> float:
+        elapsed = max(now - self._growth_at[root], 0.0)
+        return self._growth[root] * math.exp(-elapsed / self.growth_window)
+
+    def _union(self, a: int, b: int, now: float) -> int:
+        ra, rb = self._find(a), self._find(b)
+        if ra == rb:
+            return ra
+        if self._size[ra] < self._size[rb]:
+            ra, rb = rb, ra
+        # Users on the smaller side (by users) count as joining the other
+        joined = min(self._users[ra], self._users[rb])
+        self._growth[ra] = self._decayed_growth(ra, now) + self._decayed_growth(rb, now) + joined
+        self._growth_at[ra] = now
+        self._parent[rb] = ra
+        self._size[ra] += self._size[rb]
+        self._users[ra] += self._users[rb]
+        self._fraud[ra] += self._fraud[rb]
+        return ra
+
+    def _link(self, user: int, entity: int, now: float):
+        # Repeat use of an entity by its latest user adds nothing; the edge
+        # is recorded again after a rebuild, which keeps active links alive
+        if self._last_user[entity] == user:
+            return
+        self._last_user[entity] = user
+        user_root, entity_root = self._find(user), self._find(entity)
+        if user_root != entity_root:
+            # Only users new to the entity's component count towards the hub limit
+            self._degree[entity] += 1
+            if self._degree[entity] > self.max_entity_users:
+                self.hub_links_skipped += 1
+                return
+            if self._users[user_root] + self._users[entity_root] > self.max_component_users:
+                self.component_links_skipped += 1
+                return
+        self._edge_user.append(user)
+        self._edge_entity.append(entity)
+        self._edge_time.append(now)
+        self._union(user, entity, now)
+
+    def _features(self, root: int, now: float) -> Dict:
+        users = self._users[root]
+        return {
+            'ring_size': users,
+            'ring_fraud_density': self._fraud[root] / users if users else 0.0,
+            'ring_growth': round(self._decayed_growth(root, now), 3),
+        }
+
+    # Public API
+
+    def link(self, transaction: Dict, now: Optional[float] = None) -> Optional[Dict]:
+        """Link a transaction's user to its entities; returns the component features"""
+        if not self.enabled:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            user = self._node(f"u:{transaction['user_id']}", True, now)
+            for key in entity_keys(transaction, now):
+                self._link(user, self._node(key, False, now), now)
+            return self._features(self._find(user), now)
+
+    def features(self, user_id: str, now: Optional[float] = None) -> Optional[Dict]:
+        """Component features of a user without linking anything"""
+        now = time.time() if now is None else now
+        with self._lock:
+            user = self._index.get(f"u:{user_id}")
+            return self._features(self._find(user), now) if user is not None else None
+
+    def mark_fraud(self, user_id: str, now: Optional[float] = None):
+        """Flag a user as fraudulent (after scoring) for their component's density"""
+        if not self.enabled:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._fraud_log is not None:
+                self._fraud_log.append((user_id, now))
+            self._mark_fraud(user_id, now)
+
+    def _mark_fraud(self, user_id: str, now: float):
+        user = self._node(f"u:{user_id}", True, now)
+        flagged_at = self._flagged_at[user]
+        if not flagged_at or flagged_at < self._counted_since:
+            self._fraud[self._find(user)] += 1
+        self._flagged_at[user] = now
+
+    # Expiry
+
+    def rebuild(self, now: Optional[float] = None):
+        """Drop expired edges, renumber surviving nodes and recompute components"""
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        now = time.time() if now is None else now
+        started = time.perf_counter()
+        cutoff = now - self.window
+
+        with self._lock:
+            n_edges = len(self._edge_time)
+            n_nodes = len(self._keys)
+            edge_user = _to_numpy(self._edge_user)
+            edge_entity = _to_numpy(self._edge_entity)
+            edge_time = _to_numpy(self._edge_time)
+            is_user = _to_numpy(self._is_user).astype(bool)
+            flagged_at = _to_numpy(self._flagged_at)
+            parent = _to_numpy(self._parent)
+            growth = _to_numpy(self._growth)
+            growth_at = _to_numpy(self._growth_at)
+            keys = self._keys[:n_nodes]
+            self._fraud_log = []
+
+        live = np.flatnonzero(edge_time >= cutoff)
+        # Keep the latest edge per (user, entity) pair, in time order
+        pairs = edge_user[live].astype(np.int64) * n_nodes + edge_entity[live]
+        _, latest = np.unique(pairs[::-1], return_index=True)
+        live = np.sort(live[len(live) - 1 - latest])
+        edge_user, edge_entity, edge_time = edge_user[live], edge_entity[live], edge_time[live]
+        flagged = (flagged_at >= cutoff) & is_user
+        keep = np.union1d(np.union1d(edge_user, edge_entity), np.flatnonzero(flagged))
+        remap = np.full(n_nodes, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        new_user, new_entity = remap[edge_user], remap[edge_entity]
+        k = len(keep)
+
+        graph = coo_matrix((np.ones(len(new_user), dtype=np.int8), (new_user, new_entity)), shape=(k, k))
+        n_labels, labels = connected_components(graph, directed=False)
+        _, first = np.unique(labels, return_index=True)
+        roots = first[labels]
+
+        kept_user = is_user[keep]
+        kept_flagged = flagged[keep]
+        per_label = {
+            'size': np.bincount(labels, minlength=n_labels),
+            'users': np.bincount(labels, weights=kept_user, minlength=n_labels),
+            'fraud': np.bincount(labels, weights=kept_flagged, minlength=n_labels),
+        }
+        # Carry each old root's decayed growth to the component holding it
+        label_growth = np.zeros(n_labels)
+        old_roots = keep[parent[keep] == keep]
+        decayed = growth[old_roots] * np.exp(-np.maximum(now - growth_at[old_roots], 0) / self.growth_window)
+        np.add.at(label_growth, labels[remap[old_roots]], decayed)
+
+        columns = {name: np.zeros(k, dtype=np.float64 if code == "d" else np.int64)
+                   for name, code in _NODE_FIELDS.items()}
+        columns['parent'] = roots
+        for name, values in per_label.items():
+            columns[name][first] = values
+        columns['growth'][first] = label_growth
+        columns['growth_at'][:] = now
+        columns['is_user'] = kept_user.astype(np.int64)
+        columns['flagged_at'] = np.where(kept_flagged, flagged_at[keep], 0.0)
+        columns['last_user'][:] = -1
+        columns['degree'] = np.bincount(new_entity, minlength=k)
+        new_keys = [keys[i] for i in keep]
+        new_index = dict(zip(new_keys, range(k)))
+
+        with self._lock:
+            pending_edges = [
+                (self._keys[self._edge_user[i]], self._keys[self._edge_entity[i]], self._edge_time[i])
+                for i in range(n_edges, len(self._edge_time))
+            ]
+            fraud_log, self._fraud_log = self._fraud_log, None
+
+            self._index, self._keys = new_index, new_keys
+            for name, typecode in _NODE_FIELDS.items():
+                setattr(self, f"_{name}", _to_array(typecode, columns[name]))
+            self._edge_user = _to_array("i", new_user)
+            self._edge_entity = _to_array("i", new_entity)
+            self._edge_time = _to_array("d", edge_time)
+            self._counted_since = cutoff
+
+            # Replay what was linked and flagged while the rebuild ran
+            for user_key, entity_key, at in pending_edges:
+                user = self._node(user_key, True, at)
+                self._link(user, self._node(entity_key, False, at), at)
+            for user_id, at in fraud_log:
+                self._mark_fraud(user_id, at)
+
+        self.rebuilds += 1
+        self.last_rebuild_seconds = time.perf_counter() - started
+
+    async def start(self):
+        if self.enabled and self.rebuild_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await run_in_threadpool(self.rebuild)
+            except Exception as e:
+                print(f"Error rebuilding fraud graph: {e}")
+
+    def status(self) -> Dict:
+        return {
+            'nodes': len(self._keys),
+            'edges': len(self._edge_time),
+            'hub_links_skipped': self.hub_links_skipped,
+            'component_links_skipped': self.component_links_skipped,
+            'rebuilds': self.rebuilds,
+            'last_rebuild_seconds': round(self.last_rebuild_seconds, 3),
+        }
+
+
+fraud_graph = FraudGraph()
@@ -0,0 +1,203 @@
+"""
+Grid-cell location model for per-user location familiarity and travel checks
+
+Coordinates are snapped to a fixed lat/long grid and packed into a single
+integer cell id. Each user keeps a cell -> visit count map (O(1) familiarity
+lookup) plus the last seen position and time. Distances to the nearest
+known cell are computed with vectorized haversine over a whole batch.
+"""
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Grid resolution in degrees (0.05 deg is roughly 5.5 km of latitude)
+CELL_SIZE_DEG = float(os.getenv("GEO_CELL_SIZE_DEG", "0.05"))
+
+# Most frequently visited cells kept per user; eviction trims to 90% of this
+MAX_CELLS_PER_USER = int(os.getenv("GEO_MAX_CELLS_PER_USER", "4096"))
+EVICT_TO_CELLS = max(1, int(MAX_CELLS_PER_USER * 0.9))
+
+EARTH_RADIUS_KM = 6371.0088
+
+_LON_BITS = 32
+
+
+def cell_ids(latitudes, longitudes, cell_size: float = CELL_SIZE_DEG) -> np.ndarray:
+    """Pack coordinates into integer grid cell ids"""
+    lat_idx = np.floor((np.asarray(latitudes, dtype=np.float64) + 90.0) / cell_size).astype(np.int64)
+    lon_idx = np.floor((np.asarray(longitudes, dtype=np.float64) + 180.0) / cell_size).astype(np.int64)
+    return (lat_idx << _LON_BITS) | lon_idx
+
+
+def cell_id(latitude: float, longitude: float, cell_size: float = CELL_SIZE_DEG) -> int:
+    return int(cell_ids([latitude], [longitude], cell_size)[0])
+
+
+def cell_centers(ids, cell_size: float = CELL_SIZE_DEG) -> Tuple[np.ndarray, np.ndarray]:
+    """Latitude and longitude arrays of the centers of the given cells"""
+    ids = np.asarray(ids, dtype=np.int64)
+    lat_idx = ids >> _LON_BITS
+    lon_idx = ids & ((1 << _LON_BITS) - 1)
+    return (lat_idx + 0.5) * cell_size - 90.0, (lon_idx + 0.5) * cell_size - 180.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km; broadcasts over array inputs"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class LocationModel:
+    """Per-user cell visit counts plus last seen position
+
+    ``counts`` is kept in least-recently-seen order, so eviction can break
+    ties between equally visited cells by age.
+    """
+
+    __slots__ = ("counts", "last_latitude", "last_longitude", "last_seen")
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.last_latitude: Optional[float] = None
+        self.last_longitude: Optional[float] = None
+        self.last_seen: Optional[float] = None
+
+    def observe(self, latitude: float, longitude: float, seen_at: Optional[float] = None):
+        cell = cell_id(latitude, longitude)
+        self.counts[cell] = self.counts.pop(cell, 0) + 1
+        if len(self.counts) > MAX_CELLS_PER_USER:
+            self._evict(cell)
+        if seen_at is None or self.last_seen is None or seen_at >= self.last_seen:
+            self.last_latitude = latitude
+            self.last_longitude = longitude
+            self.last_seen = seen_at
+
+    def _evict(self, current: int):
+        """Drop the least visited, then least recently seen, cells down to EVICT_TO_CELLS
+
+        ``current``, the cell just observed, is always kept so new places can
+        still be learned at the cap. Trimming below the cap spreads the sort
+        over many observations.
+        """
+        drop = len(self.counts) - EVICT_TO_CELLS
+        # sorted is stable, so equal counts stay in least-recently-seen order
+        candidates = sorted((c for c in self.counts if c != current), key=self.counts.__getitem__)
+        for cell in candidates[:drop]:
+            del self.counts[cell]
+
+    def is_known(self, latitude: float, longitude: float) -> bool:
+        return cell_id(latitude, longitude) in self.counts
+
+    def cell_array(self) -> np.ndarray:
+        return np.fromiter(self.counts.keys(), dtype=np.int64, count=len(self.counts))
+
+    def to_dict(self) -> Dict:
+        """JSON-friendly form stored on the user profile"""
+        return {
+            'cells': list(self.counts.keys()),
+            'counts': list(self.counts.values()),
+            'last_latitude': self.last_latitude,
+            'last_longitude': self.last_longitude,
+            'last_seen': self.last_seen,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "LocationModel":
+        model = cls()
+        if data:
+            model.counts = dict(zip(data.get('cells', []), data.get('counts', [])))
+            model.last_latitude = data.get('last_latitude')
+            model.last_longitude = data.get('last_longitude')
+            model.last_seen = data.get('last_seen')
+        return model
+
+    @classmethod
+    def from_transactions(cls, transactions: Sequence) -> "LocationModel":
+        """Build from objects exposing latitude, longitude and timestamp"""
+        model = cls()
+        for t in sorted(transactions, key=lambda t: (t.timestamp is None, t.timestamp)):
+            if t.latitude and t.longitude:
+                model.observe(t.latitude, t.longitude, t.timestamp.timestamp() if t.timestamp else None)
+        return model
+
+
+def nearest_known_km(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    models: List[Optional[LocationModel]]
+) -> np.ndarray:
+    """Distance from each point to the nearest known cell of its user's model
+
+    Rows whose cell is already known are 0 without any distance math; the
+    remaining rows' candidate cells are flattened into one array so the
+    haversine runs once for the whole batch. NaN where there is no model,
+    no known cells or no coordinates.
+    """
+    n = len(models)
+    result = np.full(n, np.nan)
+    points = cell_ids(np.nan_to_num(latitudes), np.nan_to_num(longitudes))
+
+    rows, segments = [], []
+    for i, model in enumerate(models):
+        if model is None or not model.counts or not latitudes[i] or not longitudes[i]:
+            continue
+        if int(points[i]) in model.counts:
+            result[i] = 0.0
+            continue
+        rows.append(i)
+        segments.append(model.cell_array())
+
+    if not rows:
+        return result
+
+    lengths = np.array([len(s) for s in segments])
+    owners = np.repeat(np.array(rows), lengths)
+    cell_lat, cell_lon = cell_centers(np.concatenate(segments))
+    distances = haversine_km(latitudes[owners], longitudes[owners], cell_lat, cell_lon)
+
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    result[rows] = np.minimum.reduceat(distances, starts)
+    return result
+
+
+def travel_from_last(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    seen_at: np.ndarray,
+    models: List[Optional[LocationModel]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Distance (km) and implied speed (km/h) since each user's last position
+
+    NaN where the last position or either timestamp is unknown. Speeds for
+    non-positive time gaps are reported as infinite when the user moved.
+    """
+    n = len(models)
+    last_lat = np.full(n, np.nan)
+    last_lon = np.full(n, np.nan)
+    last_seen = np.full(n, np.nan)
+    for i, model in enumerate(models):
+        if model is not None and model.last_latitude is not None and model.last_seen is not None:
+            last_lat[i] = model.last_latitude
+            last_lon[i] = model.last_longitude
+            last_seen[i] = model.last_seen
+
+    valid = ~np.isnan(last_lat) & ~np.isnan(seen_at) & (latitudes != 0) & (longitudes != 0)
+    distance = np.full(n, np.nan)
+    speed = np.full(n, np.nan)
+    if not valid.any():
+        return distance, speed
+
+    distance[valid] = haversine_km(latitudes[valid], longitudes[valid], last_lat[valid], last_lon[valid])
+    hours = (seen_at[valid] - last_seen[valid]) / 3600.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed[valid] = np.where(
+            hours > 0,
+            distance[valid] / hours,
+            np.where(distance[valid] > 0, np.inf, 0.0)
+        )
+    return distance, speed
@@ -0,0 +1,219 @@
+"""
+Coalescing profile-update worker
+
+Ingest enqueues a profile update per stored transaction instead of running
+one per request. Pending updates are keyed by user: further transactions
+for a user already waiting only add their location observation, so a burst
+of any size collapses into one recompute. Workers take the oldest
+PROFILE_UPDATE_BATCH_SIZE users at a time, load their recent history with a
+single query on their own session and rebuild the profiles with the
+vectorized builder (both in a worker thread, off the event loop), carry
+forward each stored location model with the new observations and write
+everything back in one pipelined call.
+
+A failed batch goes back to the front of the queue with its location
+observations, which history alone cannot rebuild; after
+PROFILE_UPDATE_MAX_ATTEMPTS failures a user's update is dropped and its
+observations are counted in ``lost_observations``.
+
+At most PROFILE_UPDATE_CONCURRENCY batches run at once. When
+PROFILE_UPDATE_MAX_PENDING users are waiting, updates for new users are
+dropped (their profile catches up on their next transaction); profiles go
+stale under load rather than tasks piling up. ``lag_seconds`` in status()
+is the age of the oldest waiting update.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.database.database import SessionLocal
+from app.services.redis_client import redis_client
+from app.services.user_profile_service import (
+    build_profiles,
+    carry_locations,
+    location_observation,
+    recent_history,
+)
+
+PROFILE_UPDATE_BATCH_SIZE = int(os.getenv("PROFILE_UPDATE_BATCH_SIZE", "200"))
+PROFILE_UPDATE_CONCURRENCY = int(os.getenv("PROFILE_UPDATE_CONCURRENCY", "2"))
+PROFILE_UPDATE_INTERVAL = float(os.getenv("PROFILE_UPDATE_INTERVAL", "0.2"))
+PROFILE_UPDATE_MAX_PENDING = int(os.getenv("PROFILE_UPDATE_MAX_PENDING", "50000"))
+PROFILE_UPDATE_MAX_ATTEMPTS = int(os.getenv("PROFILE_UPDATE_MAX_ATTEMPTS", "3"))
+
+
+class PendingUpdate:
+    __slots__ = ("enqueued_at", "observations", "attempts")
+
+    def __init__(self, enqueued_at: float):
+        self.enqueued_at = enqueued_at
+        self.observations: List[Tuple] = []
+        self.attempts = 0
+
+
+def _build_profiles(user_ids: List[str]) -> Dict[str, Dict]:
+    """Load the users' recent history and rebuild their profiles (blocking)"""
+    db = SessionLocal()
+    try:
+        history = recent_history(db, user_ids)
+    finally:
+        db.close()
+    return build_profiles(history)
+
+
+class ProfileUpdater:
+    def __init__(
+        self,
+        batch_size: int = PROFILE_UPDATE_BATCH_SIZE,
+        concurrency: int = PROFILE_UPDATE_CONCURRENCY,
+        interval: float = PROFILE_UPDATE_INTERVAL,
+        max_pending: int = PROFILE_UPDATE_MAX_PENDING,
+        max_attempts: int = PROFILE_UPDATE_MAX_ATTEMPTS
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        # user_id -> pending update, oldest first
+        self._pending: "OrderedDict[str, PendingUpdate]" = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._in_flight = set()
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.processed = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = 0
+        self.lost_observations = 0
+        self.last_batch_lag = 0.0
+
+    def enqueue(self, user_id: str, transaction: Dict) -> bool:
+        """Schedule a profile update; False if it was dropped"""
+        pending = self._pending.get(user_id)
+        if pending is None:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            pending = self._pending[user_id] = PendingUpdate(time.monotonic())
+            if self._wakeup is not None:
+                self._wakeup.set()
+        else:
+            self.coalesced += 1
+        observation = location_observation(transaction)
+        if observation is not None:
+            pending.observations.append(observation)
+        self.enqueued += 1
+        return True
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(max(self.concurrency, 1))]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        # Finish what was accepted so profiles reflect every stored transaction
+        while self._pending:
+            await self._process(self._take_batch())
+
+    def _take_batch(self) -> Dict[str, PendingUpdate]:
+        """Oldest waiting users, skipping those another worker is still writing"""
+        batch = {}
+        for user_id in self._pending:
+            if len(batch) >= self.batch_size:
+                break
+            if user_id not in self._in_flight:
+                batch[user_id] = self._pending[user_id]
+        for user_id in batch:
+            del self._pending[user_id]
+        return batch
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # Give bursts a moment to coalesce
+            await asyncio.sleep(self.interval)
+            batch = self._take_batch()
+            if batch:
+                await self._process(batch)
+            elif self._pending:
+                # Only users still being written remain; wait for them
+                await asyncio.sleep(self.interval)
+
+    async def _process(self, batch: Dict[str, PendingUpdate]):
+        if not batch:
+            return
+        user_ids = list(batch)
+        self._in_flight.update(user_ids)
+        try:
+            profiles = await run_in_threadpool(_build_profiles, user_ids)
+            existing = await asyncio.gather(*[redis_client.get_user_profile(u) for u in profiles])
+            for (user_id, profile), stored in zip(profiles.items(), existing):
+                carry_locations(profile, stored, batch[user_id].observations)
+            await redis_client.update_user_profiles(profiles)
+        except Exception as e:
+            print(f"Error updating {len(batch)} user profiles: {e}")
+            self._requeue(batch)
+            return
+        finally:
+            self._in_flight.difference_update(user_ids)
+        self.processed += len(batch)
+        self.batches += 1
+        now = time.monotonic()
+        self.last_batch_lag = max(now - pending.enqueued_at for pending in batch.values())
+
+    def _requeue(self, batch: Dict[str, PendingUpdate]):
+        """Put a failed batch back at the front, merging updates queued meanwhile"""
+        for user_id in reversed(list(batch)):
+            failed = batch[user_id]
+            failed.attempts += 1
+            if failed.attempts >= self.max_attempts:
+                self.failed += 1
+                self.lost_observations += len(failed.observations)
+                continue
+            newer = self._pending.pop(user_id, None)
+            if newer is not None:
+                failed.observations.extend(newer.observations)
+            self._pending[user_id] = failed
+            self._pending.move_to_end(user_id, last=False)
+            self.retried += 1
+
+    @property
+    def lag_seconds(self) -> float:
+        if not self._pending:
+            return 0.0
+        oldest = next(iter(self._pending.values()))
+        return time.monotonic() - oldest.enqueued_at
+
+    def status(self) -> Dict:
+        return {
+            'pending_users': len(self._pending),
+            'lag_seconds': round(self.lag_seconds, 3),
+            'last_batch_lag_seconds': round(self.last_batch_lag, 3),
+            'enqueued': self.enqueued,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'processed': self.processed,
+            'batches': self.batches,
+            'retried': self.retried,
+            'failed': self.failed,
+            'lost_observations': self.lost_observations,
+        }
+
+
+profile_updater = ProfileUpdater()
@@ -1,56 +1,99 @@
-import redis.asyncio as redis
-import json
-import os
-from dotenv import load_dotenv
+from typing import Dict, List, Optional
 
-load_dotenv()
+from app.services.store_backends import StoreBackend, create_backend
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+PROFILE_TTL_SECONDS = 86400 * 30  # 30 days
 
 class RedisClient:
-    def __init__(self):
-        self.redis_client = None
+    """Profile, transaction cache and pub/sub operations over a pluggable backend
+
+    The backend is Redis unless STORE_BACKEND=embedded (see store_backends).
+    """
+
+    def __init__(self, backend: Optional[StoreBackend] = None):
+        self.backend = backend
 
     async def connect(self):
-        self.redis_client = await redis.from_url(REDIS_URL, decode_responses=True)
+        if self.backend is None:
+            self.backend = create_backend()
+        await self.backend.connect()
 
     async def disconnect(self):
-        if self.redis_client:
-            await self.redis_client.close()
+        if self.backend:
+            await self.backend.disconnect()
 
     async def get_user_profile(self, user_id: str):
-        """Get user behavior profile from Redis"""
-        profile_key = f"user_profile:{user_id}"
-        profile = await self.redis_client.get(profile_key)
-        if profile:
-            return json.loads(profile)
-        return None
+        """Get user behavior profile"""
+        return await self.backend.get(f"user_profile:{user_id}")
 
     async def update_user_profile(self, user_id: str, profile: dict):
-        """Update user behavior profile in Redis"""
-        profile_key = f"user_profile:{user_id}"
-        await self.redis_client.setex(
-            profile_key,
-            86400 * 30,  # 30 days TTL
-            json.dumps(profile)
+        """Update user behavior profile"""
+        await self.backend.set(f"user_profile:{user_id}", profile, PROFILE_TTL_SECONDS)
+
+    async def update_user_profiles(self, profiles: Dict[str, dict]):
+        """Write many profiles in one pipelined batch"""
+        await self.backend.set_many(
+            [(f"user_profile:{user_id}", profile) for user_id, profile in profiles.items()],
+            PROFILE_TTL_SECONDS
         )
 
-    async def cache_transaction(self, transaction_id: str, data: dict, ttl: int = 3600):
-        """Cache transaction data"""
-        key = f"transaction:{transaction_id}"
-        await self.redis_client.setex(key, ttl, json.dumps(data))
+    async def cache_transaction(self, transaction_id: str, data: dict, ttl: int = 3600, encoded: Optional[bytes] = None):
+        """Cache transaction data (``encoded``: the same data already JSON-encoded)"""
+        if encoded is not None:
+            await self.backend.set_encoded(f"transaction:{transaction_id}", data, encoded, ttl)
+        else:
+            await self.backend.set(f"transaction:{transaction_id}", data, ttl)
 
     async def get_cached_transaction(self, transaction_id: str):
         """Get cached transaction data"""
-        key = f"transaction:{transaction_id}"
-        data = await self.redis_client.get(key)
-        if data:
-            return json.loads(data)
-        return None
+        return await self.backend.get(f"transaction:{transaction_id}")
+
+    async def cache_user_transactions(self, user_id: str, data: dict, ttl: int):
+        """Cache a user's recent transaction history"""
+        await self.backend.set(f"user_transactions:{user_id}", data, ttl)
+
+    async def get_cached_user_transactions(self, user_id: str):
+        """Get a user's cached transaction history"""
+        return await self.backend.get(f"user_transactions:{user_id}")
+
+    async def get_history_generation(self, user_id: str) -> int:
+        """Version of a user's history, bumped on every invalidation"""
+        return int(await self.backend.get(f"user_transactions_gen:{user_id}") or 0)
+
+    async def invalidate_transaction(self, transaction_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Drop a cached transaction and/or a user's cached history"""
+        keys = []
+        if transaction_id:
+            keys.append(f"transaction:{transaction_id}")
+        if user_id:
+            keys.append(f"user_transactions:{user_id}")
+            await self.backend.incr(f"user_transactions_gen:{user_id}")
+        await self.backend.delete(*keys)
+
+    async def get_counter(self, name: str) -> Optional[int]:
+        value = await self.backend.get(f"counter:{name}")
+        return int(value) if value is not None else None
+
+    async def set_counter(self, name: str, value: int):
+        await self.backend.set(f"counter:{name}", value)
+
+    async def incr_counter(self, name: str, amount: int = 1) -> int:
+        return await self.backend.incr(f"counter:{name}", amount)
+
+    async def invalidate_transactions(self, transaction_ids: List[str], user_ids: List[str]):
+        """Drop many cached transactions and user histories in one call"""
+        keys = [f"transaction:{t}" for t in transaction_ids] + [f"user_transactions:{u}" for u in user_ids]
+        if user_ids:
+            await self.backend.incr_many([f"user_transactions_gen:{u}" for u in user_ids])
+        if keys:
+            await self.backend.delete(*keys)
 
     async def publish_alert(self, channel: str, message: dict):
-        """Publish fraud alert to Redis pub/sub"""
-        await self.redis_client.publish(channel, json.dumps(message))
+        """Publish fraud alert to subscribers"""
+        await self.backend.publish(channel, message)
 
-redis_client = RedisClient()
+    async def subscribe(self, channel: str, callback):
+        """Register an async callback for messages on a channel"""
+        await self.backend.subscribe(channel, callback)
 
+redis_client = RedisClient()
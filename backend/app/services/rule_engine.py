@@ -0,0 +1,317 @@
+"""
+Declarative fraud rules compiled to vectorized NumPy predicates
+
+Rules live in a JSON (or YAML, when PyYAML is installed) file and are
+compiled at load time into functions that evaluate a whole columnar batch
+(see app.models.features.build_columns) with boolean masks. The file is
+re-read when it changes on disk.
+
+Rule format:
+    {
+      "id": "amount_large",            unique name, used for hit counters
+      "stage": "rules",                score bucket ("rules" or "behavioral")
+      "group": "large_amount",         optional; first matching rule in a group wins
+      "requires_profile": false,       only fire for users with a profile
+      "when": <condition>,
+      "score": 18,
+      "reason": "Large amount (${amount:.2f})"   optional, formatted with row values
+    }
+
+Conditions are either {"all": [...]}, {"any": [...]}, {"not": <condition>}
+or a comparison {"field": "amount", "op": ">", "value": 8000}. A comparison
+may use "ref" (another column) plus an optional "offset" instead of "value".
+"""
+import json
+import os
+import string
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Mapping, Optional, Set
+
+import numpy as np
+
+from app.models.features import CONTEXT_COLUMNS, GRAPH_COLUMNS, INPUT_COLUMNS
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "..", "rules", "fraud_rules.json")
+RULES_PATH = os.getenv("FRAUD_RULES_PATH", DEFAULT_RULES_PATH)
+
+# Minimum seconds between checks of the rule file's modification time
+RELOAD_CHECK_INTERVAL = float(os.getenv("FRAUD_RULES_RELOAD_INTERVAL", "2"))
+
+STAGES = ("rules", "behavioral")
+
+_OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+Predicate = Callable[[Mapping], np.ndarray]
+
+
+class RuleError(ValueError):
+    """Raised when a rule file cannot be parsed or compiled"""
+
+
+# Columns a rule may reference; anything else would only fail at evaluation
+KNOWN_COLUMNS = frozenset(INPUT_COLUMNS + CONTEXT_COLUMNS)
+
+
+def _check_column(name, context: str):
+    if name not in KNOWN_COLUMNS:
+        raise RuleError(f"Unknown column '{name}' in {context}")
+
+
+def _compile_condition(condition: Dict, used: Optional[Set[str]] = None) -> Predicate:
+    """Compile a condition; column names it reads are added to ``used``"""
+    used = set() if used is None else used
+    if not isinstance(condition, dict):
+        raise RuleError(f"Condition must be an object: {condition!r}")
+    if "all" in condition:
+        parts = [_compile_condition(c, used) for c in condition["all"]]
+        return lambda cols: np.logical_and.reduce([p(cols) for p in parts])
+    if "any" in condition:
+        parts = [_compile_condition(c, used) for c in condition["any"]]
+        return lambda cols: np.logical_or.reduce([p(cols) for p in parts])
+    if "not" in condition:
+        inner = _compile_condition(condition["not"], used)
+        return lambda cols: ~inner(cols)
+
+    column = condition.get("field")
+    op = condition.get("op")
+    if column is None:
+        raise RuleError(f"Condition needs 'field', 'all', 'any' or 'not': {condition}")
+    _check_column(column, "condition")
+    used.add(column)
+
+    if op in ("in", "not_in"):
+        values = list(condition["value"])
+        negate = op == "not_in"
+
+        def membership(cols):
+            mask = np.isin(np.asarray(cols[column]), values)
+            return ~mask if negate else mask
+        return membership
+
+    if op not in _OPERATORS:
+        raise RuleError(f"Unknown operator '{op}' in condition on '{column}'")
+    compare = _OPERATORS[op]
+
+    if "ref" in condition:
+        ref = condition["ref"]
+        _check_column(ref, f"condition on '{column}'")
+        used.add(ref)
+        offset = float(condition.get("offset", 0))
+        return lambda cols: compare(cols[column], np.asarray(cols[ref]) + offset)
+
+    value = condition["value"]
+    return lambda cols: compare(cols[column], value)
+
+
+@dataclass
+class Rule:
+    id: str
+    stage: str
+    predicate: Predicate
+    score: float
+    reason: Optional[str] = None
+    group: Optional[str] = None
+    requires_profile: bool = False
+    reason_fields: List[str] = field(default_factory=list)
+    uses_graph: bool = False
+
+
+@dataclass
+class RuleEvaluation:
+    """Per-stage score arrays and per-row reason lists for a batch
+
+    ``graph_scores`` is the part of ``scores`` that came from rules reading
+    the fraud-ring columns.
+    """
+    scores: Dict[str, np.ndarray]
+    reasons: Dict[str, List[List[str]]]
+    graph_scores: Dict[str, np.ndarray]
+
+
+class RuleSet:
+    """A compiled, immutable set of rules"""
+
+    def __init__(self, definition: Dict):
+        if not isinstance(definition, dict) or not isinstance(definition.get("rules", []), list):
+            raise RuleError("Rule file must be an object with a 'rules' list")
+        self.version = definition.get("version")
+        self.rules = [self._compile_rule(r) for r in definition.get("rules", [])]
+        ids = [r.id for r in self.rules]
+        if len(ids) != len(set(ids)):
+            raise RuleError("Rule ids must be unique")
+
+    @staticmethod
+    def _compile_rule(definition: Dict) -> Rule:
+        if not isinstance(definition, dict):
+            raise RuleError(f"Rule must be an object: {definition!r}")
+        try:
+            stage = definition.get("stage", "rules")
+            if stage not in STAGES:
+                raise RuleError(f"Unknown stage '{stage}'")
+            reason = definition.get("reason")
+            reason_fields = [
+                name for _, name, _, _ in string.Formatter().parse(reason or "") if name
+            ]
+            for name in reason_fields:
+                _check_column(name, "reason")
+            if reason:
+                # Catches format specs that cannot apply to a numeric column
+                reason.format(**{name: 0.0 for name in reason_fields})
+            used: Set[str] = set()
+            predicate = _compile_condition(definition["when"], used)
+            return Rule(
+                id=definition["id"],
+                stage=stage,
+                predicate=predicate,
+                score=float(definition["score"]),
+                reason=reason,
+                group=definition.get("group"),
+                requires_profile=bool(definition.get("requires_profile", False)),
+                reason_fields=reason_fields,
+                uses_graph=bool(used & set(GRAPH_COLUMNS)),
+            )
+        except RuleError:
+            raise
+        except KeyError as e:
+            raise RuleError(f"Rule {definition.get('id', '?')} is missing {e}")
+        except (TypeError, ValueError, IndexError) as e:
+            raise RuleError(f"Rule {definition.get('id', '?')} is invalid: {e}")
+
+    def evaluate(self, columns: Mapping, hits: Optional[Dict[str, int]] = None) -> RuleEvaluation:
+        n = len(columns["amount"])
+        scores = {stage: np.zeros(n) for stage in STAGES}
+        graph_scores = {stage: np.zeros(n) for stage in STAGES}
+        reasons = {stage: [[] for _ in range(n)] for stage in STAGES}
+        group_matched: Dict[str, np.ndarray] = {}
+        has_profile = np.asarray(columns["has_profile"], dtype=bool)
+
+        # NaN comparisons warn on some NumPy versions; they are expected here
+        with np.errstate(invalid="ignore"):
+            for rule in self.rules:
+                mask = np.asarray(rule.predicate(columns), dtype=bool)
+                if rule.requires_profile:
+                    mask &= has_profile
+                if rule.group is not None:
+                    taken = group_matched.setdefault(rule.group, np.zeros(n, dtype=bool))
+                    mask &= ~taken
+                    taken |= mask
+
+                hit_rows = np.flatnonzero(mask)
+                if hits is not None:
+                    hits[rule.id] = hits.get(rule.id, 0) + len(hit_rows)
+                if not len(hit_rows):
+                    continue
+
+                scores[rule.stage] += mask * rule.score
+                if rule.uses_graph:
+                    graph_scores[rule.stage] += mask * rule.score
+                if rule.reason:
+                    stage_reasons = reasons[rule.stage]
+                    for i in hit_rows:
+                        values = {name: columns[name][i] for name in rule.reason_fields}
+                        stage_reasons[i].append(rule.reason.format(**values))
+
+        return RuleEvaluation(scores=scores, reasons=reasons, graph_scores=graph_scores)
+
+
+def load_rule_definition(path: str) -> Dict:
+    with open(path) as f:
+        if path.endswith((".yml", ".yaml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuleError("PyYAML is required for YAML rule files")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+class RuleEngine:
+    """Hot-reloading rule evaluator with per-rule hit counters and timings"""
+
+    def __init__(self, path: str = RULES_PATH, reload_interval: float = RELOAD_CHECK_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        self.rule_set = RuleSet({"rules": []})
+        self.reset_metrics()
+        self.reload()
+
+    def reset_metrics(self):
+        self.hits: Dict[str, int] = {}
+        self.evaluations = 0
+        self.rows_evaluated = 0
+        self.total_eval_seconds = 0.0
+        self.last_eval_seconds = 0.0
+        self.reloads = 0
+        self.last_reload_error: Optional[str] = None
+
+    def reload(self) -> bool:
+        """Load the rule file; keeps the current rules if the new file is invalid"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            rule_set = RuleSet(load_rule_definition(self.path))
+        except Exception as e:
+            # Any bad file (I/O, syntax, structure) keeps the previous rules
+            self.last_reload_error = str(e)
+            print(f"Warning: could not load fraud rules from {self.path}: {e}")
+            return False
+
+        with self._lock:
+            self.rule_set = rule_set
+            self._mtime = mtime
+            self.reloads += 1
+            self.last_reload_error = None
+        print(f"Loaded {len(rule_set.rules)} fraud rules (version {rule_set.version})")
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def evaluate(self, columns: Mapping) -> RuleEvaluation:
+        self._maybe_reload()
+        started = time.perf_counter()
+        result = self.rule_set.evaluate(columns, self.hits)
+        elapsed = time.perf_counter() - started
+
+        self.evaluations += 1
+        self.rows_evaluated += len(columns["amount"])
+        self.total_eval_seconds += elapsed
+        self.last_eval_seconds = elapsed
+        return result
+
+    def metrics(self) -> Dict:
+        return {
+            "path": os.path.abspath(self.path),
+            "version": self.rule_set.version,
+            "rule_count": len(self.rule_set.rules),
+            "reloads": self.reloads,
+            "last_reload_error": self.last_reload_error,
+            "evaluations": self.evaluations,
+            "rows_evaluated": self.rows_evaluated,
+            "total_eval_ms": round(self.total_eval_seconds * 1000, 3),
+            "last_eval_ms": round(self.last_eval_seconds * 1000, 3),
+            "avg_eval_us_per_row": round(
+                self.total_eval_seconds * 1e6 / self.rows_evaluated, 3
+            ) if self.rows_evaluated else 0.0,
+            "rule_hits": {rule.id: self.hits.get(rule.id, 0) for rule in self.rule_set.rules},
+        }
@@ -0,0 +1,142 @@
+"""
+Cost-aware early-exit scoring cascade
+
+Scoring runs in stages of increasing cost: the rule engine and profile
+checks, then Isolation Forest, then XGBoost. A model stage runs for a row
+when the row's running risk score is inside the stage's uncertainty band,
+or, when a latency deadline is configured, while the time since the
+request arrived plus the stage's estimated cost over the whole batch still
+fits in it.
+
+Skipping is not free of error: Isolation Forest can add 20-40 points, so a
+row below its band can still cross the 50/70 thresholds when the stage
+runs. The bands trade that for CPU; scripts/benchmark_cascade.py reports
+how often band-only scoring agrees with the full pipeline on is_fraud, the
+alert threshold and alert_type, and how a deadline changes that.
+"""
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RULES_STAGE = "rules"
+
+
+@dataclass
+class StageConfig:
+    name: str
+    band_low: float
+    band_high: float
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _default_stages() -> List[StageConfig]:
+    return [
+        StageConfig(
+            "isolation_forest",
+            _env_float("CASCADE_IF_BAND_LOW", 20),
+            _env_float("CASCADE_IF_BAND_HIGH", 73),
+        ),
+        StageConfig(
+            "xgboost",
+            _env_float("CASCADE_XGB_BAND_LOW", 40),
+            _env_float("CASCADE_XGB_BAND_HIGH", 73),
+        ),
+    ]
+
+
+@dataclass
+class CascadeConfig:
+    """Stage order, uncertainty bands and the per-request latency deadline
+
+    ``deadline_ms`` of 0 (the default) gives no spare budget, so only
+    in-band rows run. With a budget, a stage runs for every row while it has
+    room. Setting ``enabled`` to False runs every stage for every row (the
+    full pipeline).
+    """
+    stages: List[StageConfig] = field(default_factory=_default_stages)
+    deadline_ms: float = field(default_factory=lambda: _env_float("CASCADE_DEADLINE_MS", 0))
+    enabled: bool = field(default_factory=lambda: os.getenv("CASCADE_ENABLED", "true").lower() == "true")
+
+
+class StageCostTracker:
+    """Exponentially weighted estimate of each stage's cost"""
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.per_call: Dict[str, float] = {}
+        self.per_row: Dict[str, float] = {}
+
+    def estimate(self, stage: str, rows: int) -> float:
+        return self.per_call.get(stage, 0.0) + self.per_row.get(stage, 0.0) * rows
+
+    def record(self, stage: str, rows: int, seconds: float):
+        # Split the observation evenly between fixed and per-row cost
+        per_call = seconds / 2
+        per_row = seconds / 2 / max(rows, 1)
+        if stage not in self.per_call:
+            self.per_call[stage] = per_call
+            self.per_row[stage] = per_row
+            return
+        self.per_call[stage] += self.alpha * (per_call - self.per_call[stage])
+        self.per_row[stage] += self.alpha * (per_row - self.per_row[stage])
+
+
+class ScoringCascade:
+    """Decides which rows each stage runs on and keeps stage metrics"""
+
+    def __init__(self, config: Optional[CascadeConfig] = None):
+        self.config = config or CascadeConfig()
+        self.costs = StageCostTracker()
+        self.stage_rows: Dict[str, int] = {}
+        self.stage_skips: Dict[str, int] = {}
+        self.deadline_skips: Dict[str, int] = {}
+
+    def select(self, stage: StageConfig, risk_scores: np.ndarray, started: float,
+               deadline_ms: Optional[float] = None) -> np.ndarray:
+        """Boolean mask of rows the stage should run on: in band, or all while the deadline has room
+
+        ``started`` is the perf_counter time the deadline is measured from.
+        """
+        n = len(risk_scores)
+        if not self.config.enabled:
+            mask = np.ones(n, dtype=bool)
+        else:
+            mask = (risk_scores >= stage.band_low) & (risk_scores < stage.band_high)
+
+        deadline_ms = self.config.deadline_ms if deadline_ms is None else deadline_ms
+        rows = int(mask.sum())
+        if rows < n and deadline_ms:
+            elapsed = time.perf_counter() - started
+            if elapsed + self.costs.estimate(stage.name, n) <= deadline_ms / 1000:
+                mask[:] = True
+                rows = n
+            else:
+                # Out-of-band rows that would have run with more budget
+                self.deadline_skips[stage.name] = self.deadline_skips.get(stage.name, 0) + n - rows
+
+        self.stage_rows[stage.name] = self.stage_rows.get(stage.name, 0) + rows
+        self.stage_skips[stage.name] = self.stage_skips.get(stage.name, 0) + n - rows
+        return mask
+
+    def metrics(self) -> Dict:
+        return {
+            "enabled": self.config.enabled,
+            "deadline_ms": self.config.deadline_ms,
+            "stages": {
+                stage.name: {
+                    "band": [stage.band_low, stage.band_high],
+                    "rows_run": self.stage_rows.get(stage.name, 0),
+                    "rows_skipped": self.stage_skips.get(stage.name, 0),
+                    "deadline_skips": self.deadline_skips.get(stage.name, 0),
+                    "est_call_ms": round(self.costs.per_call.get(stage.name, 0.0) * 1000, 3),
+                    "est_row_us": round(self.costs.per_row.get(stage.name, 0.0) * 1e6, 3),
+                }
+                for stage in self.config.stages
+            },
+        }
@@ -0,0 +1,384 @@
+"""
+Storage backends behind RedisClient
+
+RedisClient keeps key naming; a backend stores JSON-compatible values with
+optional TTLs and provides pub/sub. Two backends are available, selected with
+STORE_BACKEND:
+
+    redis     the shared Redis server at REDIS_URL (default)
+    embedded  an in-process hash for single-node deployments, snapshotted to
+              a file at EMBEDDED_SNAPSHOT_PATH every EMBEDDED_SNAPSHOT_INTERVAL
+              seconds. On startup the snapshot is memory-mapped and only its
+              record headers are scanned; values are decoded on first access.
+
+Values returned by the embedded backend are shared objects and must not be
+mutated by callers.
+"""
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+STORE_BACKEND = os.getenv("STORE_BACKEND", "redis")
+EMBEDDED_SNAPSHOT_PATH = os.getenv("EMBEDDED_SNAPSHOT_PATH", "data/profile_store.snapshot")
+EMBEDDED_SNAPSHOT_INTERVAL = float(os.getenv("EMBEDDED_SNAPSHOT_INTERVAL", "30"))
+
+Subscriber = Callable[[Any], Awaitable[None]]
+
+
+class StoreBackend:
+    """Interface shared by all backends"""
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        raise NotImplementedError
+
+    async def get_many(self, keys: List[str]) -> List[Any]:
+        """Values of many keys, None where missing"""
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, items: List[Tuple[str, Any]], ttl: Optional[int] = None):
+        for key, value in items:
+            await self.set(key, value, ttl)
+
+    async def set_encoded(self, key: str, value: Any, encoded: bytes, ttl: Optional[int] = None):
+        """Store ``value`` whose JSON encoding the caller already has"""
+        await self.set(key, value, ttl)
+
+    async def delete(self, *keys: str):
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        """Atomically add to an integer counter (created at 0) and return it"""
+        raise NotImplementedError
+
+    async def incr_many(self, keys: List[str]):
+        """Add one to each counter"""
+        for key in keys:
+            await self.incr(key)
+
+    async def publish(self, channel: str, message: Any):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str, callback: Subscriber):
+        raise NotImplementedError
+
+
+class RedisBackend(StoreBackend):
+    def __init__(self, url: str = REDIS_URL):
+        self.url = url
+        self.redis_client = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+
+    async def connect(self):
+        self.redis_client = await redis.from_url(self.url, decode_responses=True)
+
+    async def disconnect(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self.redis_client:
+            await self.redis_client.close()
+
+    async def get(self, key: str) -> Any:
+        data = await self.redis_client.get(key)
+        if data:
+            return json.loads(data)
+        return None
+
+    async def get_many(self, keys: List[str]) -> List[Any]:
+        """Read many keys with one MGET"""
+        if not keys:
+            return []
+        return [json.loads(data) if data else None for data in await self.redis_client.mget(keys)]
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        if ttl:
+            await self.redis_client.setex(key, ttl, json.dumps(value))
+        else:
+            await self.redis_client.set(key, json.dumps(value))
+
+    async def set_encoded(self, key: str, value: Any, encoded: bytes, ttl: Optional[int] = None):
+        if ttl:
+            await self.redis_client.setex(key, ttl, encoded)
+        else:
+            await self.redis_client.set(key, encoded)
+
+    async def set_many(self, items: List[Tuple[str, Any]], ttl: Optional[int] = None):
+        """Write many keys in one pipelined round trip"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, value in items:
+            if ttl:
+                pipe.setex(key, ttl, json.dumps(value))
+            else:
+                pipe.set(key, json.dumps(value))
+        await pipe.execute()
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.redis_client.delete(*keys)
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        return await self.redis_client.incrby(key, amount)
+
+    async def incr_many(self, keys: List[str]):
+        """Increment many counters in one pipelined round trip"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.incr(key)
+        await pipe.execute()
+
+    async def publish(self, channel: str, message: Any):
+        await self.redis_client.publish(channel, json.dumps(message))
+
+    async def subscribe(self, channel: str, callback: Subscriber):
+        if self._pubsub is None:
+            self._pubsub = self.redis_client.pubsub()
+        self._subscribers.setdefault(channel, []).append(callback)
+        await self._pubsub.subscribe(channel)
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        async for message in self._pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            payload = json.loads(message["data"])
+            for callback in self._subscribers.get(message["channel"], []):
+                await callback(payload)
+
+
+# Snapshot layout: MAGIC, record count (u64), then per record a header of
+# key length (u16), value length (u32) and expiry (f64, 0 = none), followed
+# by the UTF-8 key and the JSON value
+SNAPSHOT_MAGIC = b"FDSNAP01"
+_COUNT = struct.Struct("<Q")
+_RECORD = struct.Struct("<HId")
+
+
+class EmbeddedBackend(StoreBackend):
+    def __init__(self, snapshot_path: Optional[str] = EMBEDDED_SNAPSHOT_PATH,
+                 snapshot_interval: float = EMBEDDED_SNAPSHOT_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._data: Dict[str, Any] = {}
+        # Keys whose value still lives, undecoded, in the mapped snapshot
+        self._lazy: Dict[str, Tuple[int, int]] = {}
+        self._expires: Dict[str, float] = {}
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    async def connect(self):
+        if self.snapshot_path:
+            self.load_snapshot()
+            if self.snapshot_interval > 0:
+                self._task = asyncio.create_task(self._snapshot_loop())
+
+    async def disconnect(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.snapshot_path:
+            await asyncio.to_thread(self.write_snapshot, self._snapshot_items())
+        self._close_map()
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open_map(self) -> bool:
+        """Map the snapshot file in place of the current mapping
+
+        Returns False, keeping the current mapping, when the file is missing,
+        empty or unrecognized.
+        """
+        if not os.path.exists(self.snapshot_path) or os.path.getsize(self.snapshot_path) == 0:
+            return False
+        file = open(self.snapshot_path, "rb")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            print(f"Warning: ignoring unrecognized snapshot {self.snapshot_path}")
+            mapped.close()
+            file.close()
+            return False
+        self._close_map()
+        self._file, self._map = file, mapped
+        return True
+
+    def load_snapshot(self):
+        """Map the snapshot file and index its records without decoding values"""
+        self._close_map()
+        self._lazy = {}
+        if not self._open_map():
+            return
+
+        pos = len(SNAPSHOT_MAGIC)
+        (count,) = _COUNT.unpack_from(self._map, pos)
+        pos += _COUNT.size
+        now = time.time()
+        for _ in range(count):
+            key_len, value_len, expires = _RECORD.unpack_from(self._map, pos)
+            pos += _RECORD.size
+            key = self._map[pos:pos + key_len].decode()
+            pos += key_len
+            if not expires or expires > now:
+                self._lazy[key] = (pos, value_len)
+                if expires:
+                    self._expires[key] = expires
+            pos += value_len
+
+    def _snapshot_items(self) -> List[Tuple[str, Optional[Any], Optional[bytes], float]]:
+        """Point-in-time copy of live entries; lazy entries keep their raw bytes"""
+        now = time.time()
+        items = []
+        for key, value in list(self._data.items()):
+            expires = self._expires.get(key, 0.0)
+            if not expires or expires > now:
+                items.append((key, value, None, expires))
+        for key, (offset, length) in list(self._lazy.items()):
+            expires = self._expires.get(key, 0.0)
+            if not expires or expires > now:
+                items.append((key, None, self._map[offset:offset + length], expires))
+        return items
+
+    def write_snapshot(
+        self, items: List[Tuple[str, Optional[Any], Optional[bytes], float]]
+    ) -> Dict[str, Tuple[int, int]]:
+        """Write ``items`` to the snapshot file; returns each key's value offset and length"""
+        offsets = {}
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_COUNT.pack(len(items)))
+            pos = len(SNAPSHOT_MAGIC) + _COUNT.size
+            for key, value, raw, expires in items:
+                key_bytes = key.encode()
+                value_bytes = raw if raw is not None else json.dumps(value).encode()
+                f.write(_RECORD.pack(len(key_bytes), len(value_bytes), expires))
+                f.write(key_bytes)
+                f.write(value_bytes)
+                pos += _RECORD.size + len(key_bytes)
+                offsets[key] = (pos, len(value_bytes))
+                pos += len(value_bytes)
+        os.replace(tmp_path, self.snapshot_path)
+        return offsets
+
+    async def snapshot(self):
+        items = self._snapshot_items()
+        self._dirty = False
+        try:
+            offsets = await asyncio.to_thread(self.write_snapshot, items)
+        except Exception:
+            self._dirty = True
+            raise
+        # The new file is not re-indexed: keys set or deleted while it was
+        # written are already right in _data/_lazy, and re-reading the file
+        # would bring deleted keys back. Keys still lazy were not touched
+        # since the copy, so they are in the new file too; point them at it.
+        lazy = {key: offsets[key] for key in self._lazy if key in offsets}
+        if self._open_map():
+            self._lazy = lazy
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if not self._dirty:
+                continue
+            try:
+                await self.snapshot()
+            except Exception as e:
+                print(f"Error writing store snapshot: {e}")
+
+    def _materialize(self, key: str):
+        offset, length = self._lazy.pop(key)
+        self._data[key] = json.loads(self._map[offset:offset + length])
+
+    def _expired(self, key: str) -> bool:
+        expires = self._expires.get(key)
+        if expires and expires <= time.time():
+            self._data.pop(key, None)
+            self._lazy.pop(key, None)
+            del self._expires[key]
+            return True
+        return False
+
+    def get_local(self, key: str) -> Any:
+        """Synchronous lookup for in-process callers"""
+        if key in self._expires and self._expired(key):
+            return None
+        value = self._data.get(key)
+        if value is None and key in self._lazy:
+            self._materialize(key)
+            value = self._data[key]
+        return value
+
+    async def get(self, key: str) -> Any:
+        return self.get_local(key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        self._data[key] = value
+        self._lazy.pop(key, None)
+        if ttl:
+            self._expires[key] = time.time() + ttl
+        else:
+            self._expires.pop(key, None)
+        self._dirty = True
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+            self._lazy.pop(key, None)
+            self._expires.pop(key, None)
+        self._dirty = True
+
+    async def incr(self, key: str, amount: int = 1) -> int:
+        value = (self.get_local(key) or 0) + amount
+        self._data[key] = value
+        self._lazy.pop(key, None)
+        self._dirty = True
+        return value
+
+    async def publish(self, channel: str, message: Any):
+        for callback in self._subscribers.get(channel, []):
+            await callback(message)
+
+    async def subscribe(self, channel: str, callback: Subscriber):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+
+def create_backend(name: str = STORE_BACKEND) -> StoreBackend:
+    if name == "redis":
+        return RedisBackend()
+    if name == "embedded":
+        return EmbeddedBackend()
+    raise ValueError(f"Unknown STORE_BACKEND '{name}' (expected 'redis' or 'embedded')")
@@ -0,0 +1,300 @@
+"""
+Approximate streaming analytics over ingested transactions
+
+Ingest feeds every stored transaction into per-bucket sketches (minute
+buckets for the last hour, hour buckets for the last day), overall and per
+category: HyperLogLog for distinct users and merchants, DDSketch for risk
+score and amount quantiles.
+
+Each worker keeps its own sketches in memory and every SKETCH_FLUSH_INTERVAL
+seconds writes the buckets that changed to the shared store, one key per
+worker and bucket (expiring with the bucket), and registers itself under
+``sketch_workers`` for as long as its buckets live. The same loop reads back
+every registered worker's buckets with one MGET, merges them in the thread
+pool and caches the summary, so /api/transactions/stats serves the windows
+in constant time; they lag ingest by at most one flush interval.
+"""
+import asyncio
+import os
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.redis_client import redis_client
+from app.services.sketches import DDSketch, HyperLogLog, hash64
+
+SKETCH_FLUSH_INTERVAL = float(os.getenv("SKETCH_FLUSH_INTERVAL", "5"))
+SKETCH_MAX_CATEGORIES = int(os.getenv("SKETCH_MAX_CATEGORIES", "50"))
+
+# granularity -> (bucket seconds, buckets kept)
+GRANULARITIES = {"minute": (60, 60), "hour": (3600, 24)}
+
+# window -> (granularity, buckets merged, counting the current one)
+WINDOWS = {"5m": ("minute", 5), "1h": ("minute", 60), "24h": ("hour", 24)}
+
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+ALL_CATEGORIES = "*"
+OTHER_CATEGORY = "other"
+
+WORKERS_KEY = "sketch_workers"
+
+
+class TrafficSketch:
+    """Sketches for one bucket and category"""
+
+    __slots__ = ("count", "users", "merchants", "risk", "amount")
+
+    def __init__(self):
+        self.count = 0
+        self.users = HyperLogLog()
+        self.merchants = HyperLogLog()
+        self.risk = DDSketch()
+        self.amount = DDSketch()
+
+    def observe(self, user_hash: int, merchant_hash: int, amount: float, risk_score: float):
+        self.count += 1
+        self.users.add_hash(user_hash)
+        self.merchants.add_hash(merchant_hash)
+        self.risk.add(risk_score)
+        self.amount.add(amount)
+
+    def merge(self, other: "TrafficSketch"):
+        self.count += other.count
+        self.users.merge(other.users)
+        self.merchants.merge(other.merchants)
+        self.risk.merge(other.risk)
+        self.amount.merge(other.amount)
+
+    def copy(self) -> "TrafficSketch":
+        sketch = TrafficSketch()
+        sketch.merge(self)
+        return sketch
+
+    def summary(self) -> Dict:
+        return {
+            'transactions': self.count,
+            'active_users': self.users.estimate(),
+            'active_merchants': self.merchants.estimate(),
+            'risk_score': _quantiles(self.risk),
+            'amount': _quantiles(self.amount),
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'users': self.users.encode(),
+            'merchants': self.merchants.encode(),
+            'risk': self.risk.to_dict(),
+            'amount': self.amount.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TrafficSketch":
+        sketch = cls()
+        sketch.count = data['count']
+        sketch.users = HyperLogLog.decode(data['users'])
+        sketch.merchants = HyperLogLog.decode(data['merchants'])
+        sketch.risk = DDSketch.from_dict(data['risk'])
+        sketch.amount = DDSketch.from_dict(data['amount'])
+        return sketch
+
+
+def _quantiles(sketch: DDSketch) -> Dict:
+    return {
+        name: round(value, 2) if value is not None else None
+        for name, value in zip(QUANTILES, sketch.quantiles(QUANTILES.values()))
+    }
+
+
+def _bucket_key(worker_id: str, granularity: str, bucket: int) -> str:
+    return f"sketch:{worker_id}:{granularity}:{bucket}"
+
+
+def _merge_windows(loaded: Dict[str, List[List[Dict]]]) -> Dict:
+    """Window summaries from each granularity's per-worker buckets, newest first
+
+    A bucket is a category -> TrafficSketch dict, or the stored form of one.
+    """
+    decoded = {
+        granularity: [
+            [
+                {name: s if isinstance(s, TrafficSketch) else TrafficSketch.from_dict(s)
+                 for name, s in (sketches or {}).items()}
+                for sketches in worker_buckets
+            ]
+            for worker_buckets in workers
+        ]
+        for granularity, workers in loaded.items()
+    }
+    summary = {}
+    for window, (granularity, count) in WINDOWS.items():
+        merged: Dict[str, TrafficSketch] = {}
+        for worker_buckets in decoded[granularity]:
+            for sketches in worker_buckets[:count]:
+                for name, sketch in sketches.items():
+                    merged.setdefault(name, TrafficSketch()).merge(sketch)
+        overall = merged.pop(ALL_CATEGORIES, TrafficSketch()).summary()
+        overall['by_category'] = {name: sketch.summary() for name, sketch in sorted(merged.items())}
+        summary[window] = overall
+    return summary
+
+
+class StreamAnalytics:
+    def __init__(self, flush_interval: float = SKETCH_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        # (granularity, bucket start) -> category -> sketch
+        self._buckets: Dict[Tuple[str, int], Dict[str, TrafficSketch]] = {}
+        self._dirty = set()
+        self._categories = set()
+        self._summary: Dict = {}
+        self._task: Optional[asyncio.Task] = None
+        self.observed = 0
+        self.errors = 0
+
+    def observe(self, user_id: str, merchant: str, category: str, amount: float, risk_score: float,
+                now: Optional[float] = None):
+        """Add one stored transaction to the current buckets"""
+        now = time.time() if now is None else now
+        if category not in self._categories:
+            if len(self._categories) >= SKETCH_MAX_CATEGORIES:
+                category = OTHER_CATEGORY
+            else:
+                self._categories.add(category)
+        user_hash, merchant_hash = hash64(user_id), hash64(merchant)
+
+        for granularity, (seconds, _) in GRANULARITIES.items():
+            bucket = (granularity, int(now // seconds) * seconds)
+            sketches = self._buckets.setdefault(bucket, {})
+            for name in (ALL_CATEGORIES, category):
+                sketch = sketches.get(name)
+                if sketch is None:
+                    sketch = sketches[name] = TrafficSketch()
+                sketch.observe(user_hash, merchant_hash, amount, risk_score)
+            self._dirty.add(bucket)
+        self.observed += 1
+
+    async def start(self):
+        await self.refresh()
+        if self.flush_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            await self.refresh()
+
+    def _expire(self, now: float):
+        for bucket in list(self._buckets):
+            seconds, kept = GRANULARITIES[bucket[0]]
+            if bucket[1] <= now - seconds * kept:
+                del self._buckets[bucket]
+                self._dirty.discard(bucket)
+
+    async def flush(self):
+        """Write changed buckets to the store and renew this worker's registration"""
+        now = time.time()
+        self._expire(now)
+        dirty, self._dirty = self._dirty, set()
+        try:
+            for granularity, (seconds, kept) in GRANULARITIES.items():
+                items = [
+                    (_bucket_key(self.worker_id, granularity, start),
+                     {name: sketch.to_dict() for name, sketch in self._buckets[(granularity, start)].items()})
+                    for g, start in dirty if g == granularity
+                ]
+                if items:
+                    await redis_client.backend.set_many(items, seconds * kept)
+
+            # A worker's buckets count until its last one expires, so a
+            # registration outlives the process. Read-modify-write: one lost
+            # to a concurrent writer is restored on that worker's next flush
+            retention = max(seconds * kept for seconds, kept in GRANULARITIES.values())
+            workers = await redis_client.backend.get(WORKERS_KEY) or {}
+            workers = {w: expires for w, expires in workers.items() if expires > now}
+            workers[self.worker_id] = now + retention
+            await redis_client.backend.set(WORKERS_KEY, workers, retention)
+        except Exception as e:
+            self._dirty |= dirty
+            self.errors += 1
+            print(f"Error flushing stream sketches: {e}")
+
+    def _own_buckets(self, granularity: str, starts: List[int]) -> List[Dict]:
+        """This worker's buckets, safe to merge off the event loop"""
+        buckets = []
+        for start in starts:
+            sketches = self._buckets.get((granularity, start), {})
+            # Only the current bucket still takes observations
+            if start == starts[0]:
+                buckets.append({name: sketch.copy() for name, sketch in sketches.items()})
+            else:
+                buckets.append(dict(sketches))
+        return buckets
+
+    async def refresh(self, now: Optional[float] = None):
+        """Merge every live worker's buckets into the cached window summary"""
+        now = time.time() if now is None else now
+        try:
+            workers = await redis_client.backend.get(WORKERS_KEY) or {}
+        except Exception as e:
+            self.errors += 1
+            print(f"Error reading stream sketch workers: {e}")
+            workers = {}
+        others = [w for w, expires in workers.items() if expires > now and w != self.worker_id]
+
+        # Bucket starts per granularity, newest first, enough for its longest window
+        starts = {}
+        for granularity, count in WINDOWS.values():
+            seconds = GRANULARITIES[granularity][0]
+            current = int(now // seconds) * seconds
+            if count > len(starts.get(granularity, [])):
+                starts[granularity] = [current - i * seconds for i in range(count)]
+
+        keys = [
+            _bucket_key(worker_id, granularity, start)
+            for granularity, bucket_starts in starts.items()
+            for worker_id in others
+            for start in bucket_starts
+        ]
+        try:
+            stored = await redis_client.backend.get_many(keys)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error reading stream sketches: {e}")
+            stored = [None] * len(keys)
+
+        loaded = {}
+        position = 0
+        for granularity, bucket_starts in starts.items():
+            loaded[granularity] = [self._own_buckets(granularity, bucket_starts)]
+            for _ in others:
+                loaded[granularity].append(stored[position:position + len(bucket_starts)])
+                position += len(bucket_starts)
+
+        self._summary = await run_in_threadpool(_merge_windows, loaded)
+        return self._summary
+
+    def summary(self) -> Dict:
+        """Cached window summary from the last refresh"""
+        return self._summary
+
+    def status(self) -> Dict:
+        return {
+            'observed': self.observed,
+            'buckets': len(self._buckets),
+            'pending_flush': len(self._dirty),
+            'errors': self.errors,
+        }
+
+
+stream_analytics = StreamAnalytics()
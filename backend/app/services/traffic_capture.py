@@ -0,0 +1,130 @@
+"""
+Capture of live API traffic for replay
+
+When TRAFFIC_CAPTURE_PATH is set, every request under TRAFFIC_CAPTURE_PREFIX
+is appended to that JSONL file with its arrival time, method, path, query
+string, body, response status, response body and latency. The file feeds
+scripts/replay_traffic.py, which replays it against another build and
+compares latencies and scores.
+
+Implemented as plain ASGI middleware so request and response bodies can be
+observed without buffering the response for the client. Lines are written
+through a buffered file and flushed every TRAFFIC_CAPTURE_FLUSH_LINES
+records and on shutdown.
+"""
+import json
+import os
+import time
+from typing import Dict, Optional
+
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH")
+TRAFFIC_CAPTURE_PREFIX = os.getenv("TRAFFIC_CAPTURE_PREFIX", "/api/")
+TRAFFIC_CAPTURE_FLUSH_LINES = int(os.getenv("TRAFFIC_CAPTURE_FLUSH_LINES", "100"))
+
+# Larger response bodies are recorded as truncated
+MAX_CAPTURED_RESPONSE = 256 * 1024
+
+
+class TrafficRecorder:
+    def __init__(self, path: Optional[str] = TRAFFIC_CAPTURE_PATH, flush_lines: int = TRAFFIC_CAPTURE_FLUSH_LINES):
+        self.path = path
+        self.flush_lines = flush_lines
+        self._file = None
+        self._unflushed = 0
+        self.recorded = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(self, entry: Dict):
+        try:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self.recorded += 1
+            self._unflushed += 1
+            if self._unflushed >= self.flush_lines:
+                self.flush()
+        except Exception as e:
+            self.errors += 1
+            print(f"Error capturing traffic: {e}")
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            self._unflushed = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def status(self) -> Dict:
+        return {'enabled': self.enabled, 'recorded': self.recorded, 'errors': self.errors}
+
+
+def _decode(body: bytes):
+    """JSON bodies are stored parsed, anything else as text"""
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body.decode("utf-8", errors="replace")
+
+
+class TrafficCaptureMiddleware:
+    def __init__(self, app, recorder: TrafficRecorder, prefix: str = TRAFFIC_CAPTURE_PREFIX):
+        self.app = app
+        self.recorder = recorder
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.recorder.enabled or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.time()
+        started = time.perf_counter()
+        request_body = []
+        response = {'status': None, 'body': [], 'size': 0}
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                request_body.append(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response['status'] = message["status"]
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                if response['size'] < MAX_CAPTURED_RESPONSE:
+                    response['body'].append(body)
+                response['size'] += len(body)
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            response_body = b"".join(response['body'])
+            truncated = response['size'] > len(response_body)
+            self.recorder.record({
+                'ts': arrived,
+                'method': scope["method"],
+                'path': scope["path"],
+                'query': scope.get("query_string", b"").decode("latin-1"),
+                'body': _decode(b"".join(request_body)),
+                'status': response['status'],
+                'latency_ms': round((time.perf_counter() - started) * 1000, 3),
+                'response': None if truncated else _decode(response_body),
+            })
+
+
+traffic_recorder = TrafficRecorder()
@@ -0,0 +1,124 @@
+"""
+Read-through cache of TransactionResponse payloads
+
+Entries (stored through redis_client):
+    transaction:{transaction_id}     full response dict, or a short-lived
+                                     negative entry for unknown ids
+    user_transactions:{user_id}      the user's newest HISTORY_CACHE_SIZE
+                                     responses, newest first, tagged with
+                                     the history generation it was read at
+    user_transactions_gen:{user_id}  history generation, bumped whenever
+                                     the user's history is invalidated
+
+Ingest writes the new response and drops the user's history entry; alert
+reviews drop both entries for the reviewed transaction. A history read
+takes the generation before querying the database, so a list cached after
+a concurrent invalidation carries an old generation and is never served.
+Cache failures are logged and fall back to the database.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+from app.services.redis_client import redis_client
+
+TRANSACTION_CACHE_TTL = int(os.getenv("TRANSACTION_CACHE_TTL", "3600"))
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", "10"))
+HISTORY_CACHE_TTL = int(os.getenv("HISTORY_CACHE_TTL", "300"))
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "500"))
+
+_MISSING = {"missing": True}
+
+
+class TransactionCache:
+    def __init__(self):
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def _call(self, operation, *args):
+        try:
+            return await operation(*args)
+        except Exception as e:
+            self.errors += 1
+            print(f"Transaction cache error: {e}")
+            return None
+
+    async def get(self, transaction_id: str) -> Tuple[bool, Optional[Dict]]:
+        """(hit, response); a hit with a None response means the id is known missing"""
+        value = await self._call(redis_client.get_cached_transaction, transaction_id)
+        if value is None:
+            self.misses += 1
+            return False, None
+        if value == _MISSING:
+            self.negative_hits += 1
+            return True, None
+        self.hits += 1
+        return True, value
+
+    async def store(self, response: Dict, encoded: Optional[bytes] = None):
+        await self._call(
+            redis_client.cache_transaction, response['transaction_id'], response, TRANSACTION_CACHE_TTL, encoded
+        )
+
+    async def store_missing(self, transaction_id: str):
+        await self._call(redis_client.cache_transaction, transaction_id, _MISSING, NEGATIVE_CACHE_TTL)
+
+    def history_cacheable(self, skip: int, limit: int) -> bool:
+        return skip + limit <= HISTORY_CACHE_SIZE
+
+    async def history_generation(self, user_id: str) -> Optional[int]:
+        """Current history generation; take it before reading the database"""
+        return await self._call(redis_client.get_history_generation, user_id)
+
+    async def get_history(self, user_id: str, skip: int, limit: int) -> Optional[List[Dict]]:
+        """Slice of the cached history, or None when it must come from the database"""
+        entry = await self._call(redis_client.get_cached_user_transactions, user_id)
+        if entry is not None and entry.get('generation') != await self.history_generation(user_id):
+            entry = None
+        if entry is None or (not entry['complete'] and skip + limit > len(entry['items'])):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['items'][skip:skip + limit]
+
+    async def store_history(self, user_id: str, items: List[Dict], generation: Optional[int]):
+        """Cache up to HISTORY_CACHE_SIZE newest responses for a user
+
+        ``generation`` is the history_generation taken before the database
+        read; nothing is stored when it is unknown or already outdated.
+        """
+        if generation is None or generation != await self.history_generation(user_id):
+            return
+        entry = {
+            'complete': len(items) < HISTORY_CACHE_SIZE,
+            'items': items[:HISTORY_CACHE_SIZE],
+            'generation': generation,
+        }
+        await self._call(redis_client.cache_user_transactions, user_id, entry, HISTORY_CACHE_TTL)
+
+    async def record_transaction(self, response: Dict, encoded: Optional[bytes] = None):
+        """Cache a newly ingested transaction and drop its user's stale history
+
+        ``encoded`` is the response already serialized as JSON, stored as-is
+        by backends that keep values serialized.
+        """
+        await self.store(response, encoded)
+        await self.invalidate(user_id=response['user_id'])
+
+    async def invalidate(self, transaction_id: Optional[str] = None, user_id: Optional[str] = None):
+        await self._call(redis_client.invalidate_transaction, transaction_id, user_id)
+
+    async def invalidate_many(self, transaction_ids: List[str], user_ids: List[str]):
+        await self._call(redis_client.invalidate_transactions, transaction_ids, user_ids)
+
+    def status(self) -> Dict:
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'errors': self.errors,
+        }
+
+
+transaction_cache = TransactionCache()
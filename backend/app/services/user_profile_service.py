@@ -1,29 +1,40 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, union_all
 from datetime import datetime
-from typing import Dict
-
-from app.database.models import Transaction
-from app.services.redis_client import redis_client
-
-async def update_user_profile(user_id: str, transaction: Dict, db: Session):
-    """Update user behavior profile based on new transaction"""
-    
-    # Get all user transactions
-    transactions = db.query(Transaction).filter(
-        Transaction.user_id == user_id
-    ).order_by(Transaction.timestamp.desc()).limit(100).all()
-    
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+
+from app.database.partitions import hot_tables
+from app.models.features import parse_timestamp
+from app.services.geo_index import LocationModel, cell_ids
+
+# Number of most recent transactions a profile is built from
+PROFILE_HISTORY_SIZE = 100
+
+# Number of recent transaction times kept for velocity rules
+VELOCITY_HISTORY_SIZE = 20
+
+def build_profile(user_id: str, transactions: Sequence, now: Optional[datetime] = None) -> Optional[Dict]:
+    """Build a behavior profile from a user's most recent transactions
+
+    ``transactions`` may be ORM objects or result rows; anything exposing
+    ``amount``, ``merchant``, ``category``, ``latitude``, ``longitude`` and ``timestamp``.
+    """
     if not transactions:
-        return
-    
+        return None
+
     # Calculate profile statistics
     amounts = [t.amount for t in transactions]
     merchants = [t.merchant for t in transactions]
-    locations = [(t.latitude, t.longitude) for t in transactions if t.latitude and t.longitude]
+    categories = [t.category for t in transactions]
+    locations = LocationModel.from_transactions(transactions)
     hours = [t.timestamp.hour for t in transactions if t.timestamp]
-    
-    profile = {
+    times = sorted(t.timestamp for t in transactions if t.timestamp)
+
+    return {
         'user_id': user_id,
         'transaction_count': len(transactions),
         'avg_amount': sum(amounts) / len(amounts) if amounts else 0,
@@ -31,14 +42,139 @@ async def update_user_profile(user_id: str, transaction: Dict, db: Session):
         'min_amount': min(amounts) if amounts else 0,
         'unique_merchants': len(set(merchants)),
         'typical_merchants': list(set(merchants))[:10],  # Top 10 merchants
-        'unique_locations': list(set(locations))[:5],  # Top 5 locations (convert tuples to lists for JSON)
+        'typical_categories': list(set(categories)),
+        'unique_locations': len(locations.counts),
+        'locations': locations.to_dict(),
         'typical_hours': list(set(hours)) if hours else [],
-        'last_updated': datetime.now().isoformat()
+        'last_transaction_at': times[-1].isoformat() if times else None,
+        'recent_transaction_times': [t.timestamp() for t in times[-VELOCITY_HISTORY_SIZE:]],
+        'last_updated': (now or datetime.now()).isoformat()
     }
-    
-    # Convert location tuples to lists for JSON serialization
-    profile['typical_locations'] = [list(loc) for loc in profile['typical_locations']]
-    
-    # Update in Redis
-    await redis_client.update_user_profile(user_id, profile)
 
+def _epoch_seconds(timestamps: pd.Series) -> pd.Series:
+    """Epoch seconds matching datetime.timestamp() (naive values are local time)"""
+    if timestamps.dt.tz is None:
+        localized = timestamps.dt.tz_localize(tzlocal(), ambiguous="NaT", nonexistent="NaT")
+    else:
+        localized = timestamps
+    seconds = (localized - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+    # DST edge cases fall back to the scalar conversion
+    unresolved = seconds.isna() & timestamps.notna()
+    if unresolved.any():
+        seconds[unresolved] = [t.to_pydatetime().timestamp() for t in timestamps[unresolved]]
+    return seconds
+
+def build_profiles(frame: pd.DataFrame, now: Optional[datetime] = None) -> Dict[str, Dict]:
+    """Vectorized build_profile for many users at once
+
+    ``frame`` holds each user's most recent transactions with columns
+    user_id, amount, merchant, category, latitude, longitude and timestamp.
+    Returns profiles keyed by user_id, in the same form as build_profile.
+    """
+    if frame.empty:
+        return {}
+
+    frame = frame.assign(timestamp=pd.to_datetime(frame['timestamp']))
+    frame = frame.sort_values(['user_id', 'timestamp'], kind='stable', na_position='last')
+    frame = frame.reset_index(drop=True)
+    frame = frame.assign(epoch=_epoch_seconds(frame['timestamp']))
+    by_user = frame.groupby('user_id', sort=False)
+
+    amounts = by_user['amount'].agg(['count', 'mean', 'max', 'min'])
+    merchants = frame.drop_duplicates(['user_id', 'merchant']).groupby('user_id', sort=False)['merchant'].agg(list)
+    categories = frame.drop_duplicates(['user_id', 'category']).groupby('user_id', sort=False)['category'].agg(list)
+
+    timed = frame[frame['timestamp'].notna()]
+    timed = timed.assign(hour=timed['timestamp'].dt.hour)
+    hours = timed.drop_duplicates(['user_id', 'hour']).groupby('user_id', sort=False)['hour'].agg(list)
+    recent = timed.groupby('user_id', sort=False).tail(VELOCITY_HISTORY_SIZE)
+    recent = recent.groupby('user_id', sort=False)['epoch'].agg(list)
+    last_at = timed.groupby('user_id', sort=False)['timestamp'].last()
+
+    # Location cells in first-visit order, as LocationModel.observe builds them
+    located = frame[(frame['latitude'].fillna(0) != 0) & (frame['longitude'].fillna(0) != 0)]
+    located = located.assign(cell=cell_ids(located['latitude'].to_numpy(), located['longitude'].to_numpy()))
+    cells, counts = {}, {}
+    for (user_id, cell), count in located.groupby(['user_id', 'cell'], sort=False).size().items():
+        cells.setdefault(user_id, []).append(int(cell))
+        counts.setdefault(user_id, []).append(int(count))
+    last_position = located.groupby('user_id', sort=False).tail(1).set_index('user_id')
+
+    merchants, categories, hours = merchants.to_dict(), categories.to_dict(), hours.to_dict()
+    recent, last_at = recent.to_dict(), last_at.to_dict()
+    updated = (now or datetime.now()).isoformat()
+
+    profiles = {}
+    for user_id, count, mean, maximum, minimum in amounts.itertuples():
+        locations = {'cells': cells.get(user_id, []), 'counts': counts.get(user_id, []),
+                     'last_latitude': None, 'last_longitude': None, 'last_seen': None}
+        if user_id in last_position.index:
+            position = last_position.loc[user_id]
+            locations['last_latitude'] = float(position['latitude'])
+            locations['last_longitude'] = float(position['longitude'])
+            locations['last_seen'] = None if np.isnan(position['epoch']) else float(position['epoch'])
+        user_merchants = merchants[user_id]
+        last_seen = last_at.get(user_id)
+        profiles[user_id] = {
+            'user_id': user_id,
+            'transaction_count': int(count),
+            'avg_amount': float(mean),
+            'max_amount': float(maximum),
+            'min_amount': float(minimum),
+            'unique_merchants': len(user_merchants),
+            'typical_merchants': user_merchants[:10],
+            'typical_categories': categories[user_id],
+            'unique_locations': len(locations['cells']),
+            'locations': locations,
+            'typical_hours': [int(h) for h in hours.get(user_id, [])],
+            'last_transaction_at': last_seen.to_pydatetime().isoformat() if last_seen is not None else None,
+            'recent_transaction_times': [float(t) for t in recent.get(user_id, [])],
+            'last_updated': updated
+        }
+    return profiles
+
+def recent_history(db, user_ids: List[str]) -> pd.DataFrame:
+    """Each user's PROFILE_HISTORY_SIZE most recent transactions
+
+    ``db`` is a Session or Connection; the frame is ready for build_profiles.
+    Every hot transactions table is read, so recent months that were rolled
+    into partitions still count.
+    """
+    connection = db.connection() if isinstance(db, Session) else db
+    selects = [
+        select(t.c.user_id, t.c.amount, t.c.merchant, t.c.category, t.c.latitude, t.c.longitude, t.c.timestamp)
+        .where(t.c.user_id.in_(user_ids))
+        for t in hot_tables(connection, "transactions")
+    ]
+    transactions = selects[0].subquery() if len(selects) == 1 else union_all(*selects).subquery()
+    ranked = select(
+        transactions,
+        func.row_number().over(
+            partition_by=transactions.c.user_id,
+            order_by=transactions.c.timestamp.desc()
+        ).label('rn')
+    ).subquery()
+    stmt = select(*[c for c in ranked.c if c.name != 'rn']).where(ranked.c.rn <= PROFILE_HISTORY_SIZE)
+    result = db.execute(stmt)
+    return pd.DataFrame(result.all(), columns=list(result.keys()))
+
+def location_observation(transaction: Dict) -> Optional[Tuple[float, float, Optional[float]]]:
+    """(latitude, longitude, epoch seconds) of a transaction dict, if it has a position"""
+    if not (transaction.get('latitude') and transaction.get('longitude')):
+        return None
+    seen_at = parse_timestamp(transaction.get('timestamp'))
+    return transaction['latitude'], transaction['longitude'], seen_at.timestamp() if seen_at else None
+
+def carry_locations(profile: Dict, existing: Optional[Dict], observations: Sequence[Tuple]):
+    """Carry the existing location model forward and add only the new observations
+
+    The location model outlives the recent-history window, so a rebuilt
+    profile keeps the stored cell counts rather than the history's.
+    """
+    if not existing or not existing.get('locations'):
+        return
+    locations = LocationModel.from_dict(existing['locations'])
+    for latitude, longitude, seen_at in observations:
+        locations.observe(latitude, longitude, seen_at)
+    profile['locations'] = locations.to_dict()
+    profile['unique_locations'] = len(locations.counts)
@@ -27,6 +27,19 @@ class ConnectionManager:
         for conn in disconnected:
             self.active_connections.remove(conn)
 
+    async def broadcast_encoded(self, message: bytes):
+        """Broadcast an already JSON-encoded message, encoded once for all clients"""
+        text = message.decode()
+        disconnected = []
+        for connection in self.active_connections:
+            try:
+                await connection.send_text(text)
+            except Exception:
+                disconnected.append(connection)
+
+        for conn in disconnected:
+            self.active_connections.remove(conn)
+
 # Create singleton instance for import
 manager = ConnectionManager()
 
@@ -0,0 +1,131 @@
+"""
+Write-behind queue for deferred fraud alert inserts and broadcasts
+
+Used by ingest when it is degraded: alerts are queued instead of written on
+the request path, then inserted in batches with a single commit and
+broadcast by a background task.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+
+from app.database.database import SessionLocal
+from app.database.models import FraudAlert
+from app.services.alert_counters import alert_counters
+from app.services.websocket_manager import manager
+
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.5"))
+WRITE_BEHIND_MAX_SIZE = int(os.getenv("WRITE_BEHIND_MAX_SIZE", "10000"))
+
+
+def insert_alerts(alerts: List[Dict]):
+    """Insert alert rows in one statement and one commit"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(FraudAlert), alerts)
+        db.commit()
+    finally:
+        db.close()
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        max_size: int = WRITE_BEHIND_MAX_SIZE
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self.flushed = 0
+        self.failed = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let the worker drain the queue and finish its batch, then wait for it
+
+        The worker is signalled rather than cancelled: a cancelled worker
+        would drop the batch it had already taken off the queue.
+        """
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    def enqueue_alert(self, alert: Dict, message: Optional[Dict] = None) -> bool:
+        """Queue an alert row (and its broadcast); False if the queue is full or stopped"""
+        if self._queue is None or self._task is None:
+            return False
+        try:
+            self._queue.put_nowait((alert, message))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def _take_batch(self, limit: Optional[int] = None) -> List[Tuple[Dict, Optional[Dict]]]:
+        limit = self.batch_size if limit is None else limit
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        try:
+            while True:
+                if self._queue.empty():
+                    if self._stopping.is_set():
+                        return
+                    getter = asyncio.ensure_future(self._queue.get())
+                    await asyncio.wait({getter, stopping}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    first = getter.result()
+                else:
+                    first = self._queue.get_nowait()
+                # Wait for the batch to fill, unless shutting down
+                if not self._stopping.is_set():
+                    await asyncio.wait({stopping}, timeout=self.flush_interval)
+                batch = [first] + self._take_batch(self.batch_size - 1)
+                await self._flush(batch)
+        finally:
+            stopping.cancel()
+
+    async def _flush(self, batch: List[Tuple[Dict, Optional[Dict]]]):
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(insert_alerts, [alert for alert, _ in batch])
+            self.flushed += len(batch)
+            await alert_counters.add_pending(len(batch))
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Error flushing {len(batch)} deferred alerts: {e}")
+            return
+
+        for _, message in batch:
+            if message is not None:
+                await manager.broadcast(message)
+
+    def status(self) -> Dict:
+        return {"depth": self.depth, "flushed": self.flushed, "failed": self.failed}
+
+
+write_behind_queue = WriteBehindQueue()
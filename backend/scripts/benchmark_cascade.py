@@ -0,0 +1,92 @@
+"""
+Benchmark the early-exit scoring cascade against the full pipeline
+
+Scores the synthetic training dataset with every stage forced on, with the
+cascade's uncertainty bands alone, and with the bands plus a latency
+deadline (stages also run out of band while it has room; here it counts
+from the start of scoring, whereas the API counts from request arrival),
+and reports CPU time per transaction and how often each agrees with the
+full pipeline on the final decision. Every run reseeds ``random`` at the
+start of each batch, so batches draw the same demo base risk across runs
+(the same per transaction only with the default batch size of 1).
+
+Usage (from backend/, after training the models):
+  python scripts/benchmark_cascade.py [n_samples] [batch_size] [deadline_ms]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.models.train_models import generate_synthetic_transactions, to_transaction_records  # noqa: E402
+from app.services.fraud_detector import FraudDetector  # noqa: E402
+from app.services.scoring_cascade import CascadeConfig, ScoringCascade  # noqa: E402
+
+
+def run(detector, transactions, profiles, batch_size):
+    results = []
+    cpu_started = time.process_time()
+    for start in range(0, len(transactions), batch_size):
+        random.seed(start)
+        results.extend(detector.score_batch(
+            transactions[start:start + batch_size],
+            profiles[start:start + batch_size]
+        ))
+    cpu = time.process_time() - cpu_started
+    return results, cpu
+
+
+def agreement(full, cascade, key):
+    same = sum(1 for a, b in zip(full, cascade) if key(a) == key(b))
+    return same / len(full) * 100
+
+
+def main(n_samples=5000, batch_size=1, deadline_ms=20):
+    df = generate_synthetic_transactions(n_samples=n_samples)
+    transactions, profiles = to_transaction_records(df)
+
+    full_detector = FraudDetector()
+    full_detector.cascade = ScoringCascade(CascadeConfig(enabled=False))
+    cascade_detector = FraudDetector()
+    cascade_detector.cascade = ScoringCascade(CascadeConfig(enabled=True, deadline_ms=0))
+    deadline_detector = FraudDetector()
+    deadline_detector.cascade = ScoringCascade(CascadeConfig(enabled=True, deadline_ms=deadline_ms))
+
+    # Warm up every code path before timing
+    for detector in (full_detector, cascade_detector, deadline_detector):
+        run(detector, transactions[:50], profiles[:50], batch_size)
+
+    full, full_cpu = run(full_detector, transactions, profiles, batch_size)
+    cascade, cascade_cpu = run(cascade_detector, transactions, profiles, batch_size)
+    with_deadline, deadline_cpu = run(deadline_detector, transactions, profiles, batch_size)
+
+    n = len(transactions)
+    print(f"{n} transactions, batch size {batch_size}")
+    print(f"  full pipeline:  {full_cpu / n * 1e6:8.1f} us CPU/txn")
+    print(f"  cascade:        {cascade_cpu / n * 1e6:8.1f} us CPU/txn "
+          f"({(1 - cascade_cpu / full_cpu) * 100:.1f}% less)")
+    print(f"  with {deadline_detector.cascade.config.deadline_ms:g} ms deadline: "
+          f"{deadline_cpu / n * 1e6:8.1f} us CPU/txn ({(1 - deadline_cpu / full_cpu) * 100:.1f}% less)")
+
+    for stage in cascade_detector.cascade.config.stages:
+        ran = sum(1 for r in cascade if stage.name in r['stages_run'])
+        print(f"  {stage.name:<18}ran for {ran / n * 100:5.1f}% of transactions")
+
+    print("Decision agreement with full pipeline (bands only / with deadline):")
+    for label, key in (
+        ("is_fraud", lambda r: r['is_fraud']),
+        ("alert (>= 50)", lambda r: r['risk_score'] >= 50),
+        ("alert_type", lambda r: r['alert_type']),
+    ):
+        print(f"  {label + ':':<16} {agreement(full, cascade, key):6.2f}% / "
+              f"{agreement(full, with_deadline, key):6.2f}%")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 20,
+    )
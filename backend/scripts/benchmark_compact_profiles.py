@@ -0,0 +1,177 @@
+"""
+Compare the compact profile store with JSON/dict profiles
+
+For N synthetic users, reports resident memory per user and per-transaction
+lookup cost (profile fetch plus columnar batch build) for:
+  - json:    profiles kept as JSON strings, as Redis returns them
+  - dict:    profiles kept as parsed Python dicts
+  - compact: CompactProfileStore records
+Each form is built in its own forked process so RSS deltas don't overlap.
+Also checks that the compact store yields the same batch columns.
+
+Usage (from backend/):
+  python scripts/benchmark_compact_profiles.py [n_users] [batch_size]
+"""
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.models.features import build_columns  # noqa: E402
+from app.services.compact_profile import PROFILE_DTYPE, STATS_BYTES, CompactProfileStore  # noqa: E402
+from app.services.geo_index import LocationModel  # noqa: E402
+
+MERCHANTS = [f"merchant_{i}" for i in range(500)]
+CATEGORIES = ['Retail', 'Food & Dining', 'Gas', 'Groceries', 'Electronics',
+              'Entertainment', 'Travel', 'Utilities', 'Healthcare', 'Other']
+NOW = datetime(2024, 6, 1, 12)
+
+
+def synthetic_profile(user_id: str, rng: random.Random) -> dict:
+    amount = rng.lognormvariate(3.5, 1.0)
+    last_seen = NOW - timedelta(minutes=rng.randint(1, 600))
+    locations = LocationModel()
+    for _ in range(rng.randint(1, 3)):
+        locations.observe(40.7 + rng.uniform(-0.3, 0.3), -74.0 + rng.uniform(-0.3, 0.3), last_seen.timestamp())
+    return {
+        'user_id': user_id,
+        'transaction_count': rng.randint(5, 100),
+        'avg_amount': amount,
+        'max_amount': amount * 3,
+        'min_amount': amount / 3,
+        'unique_merchants': rng.randint(3, 20),
+        'typical_merchants': rng.sample(MERCHANTS, rng.randint(3, 10)),
+        'typical_categories': rng.sample(CATEGORIES, rng.randint(1, 4)),
+        'unique_locations': len(locations.counts),
+        'locations': locations.to_dict(),
+        'typical_hours': sorted(rng.sample(range(8, 22), rng.randint(2, 8))),
+        'last_transaction_at': last_seen.isoformat(),
+        'recent_transaction_times': sorted(
+            (last_seen - timedelta(minutes=rng.randint(0, 300))).timestamp() for _ in range(rng.randint(1, 20))
+        ),
+        'last_updated': NOW.isoformat(),
+    }
+
+
+def synthetic_transactions(n_users: int, count: int, rng: random.Random) -> list:
+    return [
+        {
+            'user_id': f"user_{rng.randrange(n_users)}",
+            'transaction_id': f"txn_{i}",
+            'amount': rng.lognormvariate(3.5, 1.2),
+            'merchant': rng.choice(MERCHANTS),
+            'category': rng.choice(CATEGORIES),
+            'latitude': 40.7 + rng.uniform(-1, 1),
+            'longitude': -74.0 + rng.uniform(-1, 1),
+            'timestamp': (NOW + timedelta(minutes=rng.randint(0, 60))).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def build_form(form: str, n_users: int):
+    rng = random.Random(42)
+    if form == "compact":
+        store = CompactProfileStore(capacity=n_users)
+        for i in range(n_users):
+            user_id = f"user_{i}"
+            store.put(user_id, synthetic_profile(user_id, rng))
+        return store
+    profiles = {}
+    for i in range(n_users):
+        user_id = f"user_{i}"
+        profile = synthetic_profile(user_id, rng)
+        profiles[user_id] = json.dumps(profile) if form == "json" else profile
+    return profiles
+
+
+def lookup_columns(form: str, data, transactions: list):
+    if form == "compact":
+        return data.build_columns(transactions)
+    if form == "json":
+        profiles = [data.get(t['user_id']) for t in transactions]
+        return build_columns(transactions, [json.loads(p) if p else None for p in profiles])
+    return build_columns(transactions, [data.get(t['user_id']) for t in transactions])
+
+
+def measure(form: str, n_users: int, batch_size: int, queue):
+    before = rss_bytes()
+    data = build_form(form, n_users)
+    rss_per_user = (rss_bytes() - before) / n_users
+
+    transactions = synthetic_transactions(n_users, 20000, random.Random(7))
+    batches = [transactions[i:i + batch_size] for i in range(0, len(transactions), batch_size)]
+    lookup_columns(form, data, batches[0])
+    started = time.perf_counter()
+    for batch in batches:
+        lookup_columns(form, data, batch)
+    per_txn = (time.perf_counter() - started) / len(transactions)
+
+    single_user = transactions[0]['user_id']
+    started = time.perf_counter()
+    for _ in range(10000):
+        if form == "compact":
+            data.has_merchant(single_user, 'merchant_1')
+        elif form == "json":
+            'merchant_1' in json.loads(data[single_user])['typical_merchants']
+        else:
+            'merchant_1' in data[single_user]['typical_merchants']
+    membership = (time.perf_counter() - started) / 10000
+
+    queue.put((form, rss_per_user, per_txn, membership))
+
+
+def check_parity(n_users: int = 2000):
+    rng = random.Random(42)
+    store = CompactProfileStore()
+    profiles = {}
+    for i in range(n_users):
+        user_id = f"user_{i}"
+        profiles[user_id] = synthetic_profile(user_id, rng)
+        store.put(user_id, profiles[user_id])
+
+    transactions = synthetic_transactions(n_users * 2, 5000, random.Random(7))
+    expected = build_columns(transactions, [profiles.get(t['user_id']) for t in transactions])
+    actual = store.build_columns(transactions)
+    for name, values in expected.items():
+        # float32 amounts and whole-second velocity timestamps
+        np.testing.assert_allclose(
+            np.asarray(actual[name], dtype=np.float64), np.asarray(values, dtype=np.float64),
+            rtol=1e-5, atol=1e-3, equal_nan=True, err_msg=name
+        )
+    print(f"Column parity OK over {len(transactions)} transactions")
+
+
+def main(n_users=200000, batch_size=256):
+    check_parity()
+    print(f"Record size: {PROFILE_DTYPE.itemsize} bytes ({STATS_BYTES} bytes of numeric stats)")
+    print(f"{n_users} users, lookup batch size {batch_size}")
+
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    for form in ("json", "dict", "compact"):
+        process = ctx.Process(target=measure, args=(form, n_users, batch_size, queue))
+        process.start()
+        form, rss_per_user, per_txn, membership = queue.get()
+        process.join()
+        print(f"  {form:<8} RSS {rss_per_user:8.0f} B/user   batch build {per_txn * 1e6:6.2f} us/txn   "
+              f"merchant lookup {membership * 1e6:6.2f} us")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 256,
+    )
@@ -0,0 +1,150 @@
+"""
+Benchmark the ingest persistence and response path
+
+Compares, per ingested transaction with an alert:
+  - orm:  session add + commit + refresh (an extra SELECT), TransactionResponse
+          validation for the cache payload and again for the HTTP response,
+          stdlib json for the response, the cache and each WebSocket client
+  - fast: INSERT ... RETURNING, the payload built once from the returned row
+          and encoded once with orjson for the response and the cache, and
+          the alert encoded once for all clients
+Reports SQL statements per request, time for the database step, time for
+the serialization step and the combined per-request cost, and checks that
+both paths produce the same response.
+
+Runs against DATABASE_URL (a temporary SQLite file by default).
+
+Usage (from backend/):
+  python scripts/benchmark_ingest_response.py [requests] [websocket_clients]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+_db_path = os.path.join(tempfile.mkdtemp(), "benchmark_ingest.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_path}")
+
+from app.api.transactions import _json_ready, _to_response  # noqa: E402
+from app.database.database import Base, SessionLocal, engine  # noqa: E402
+from app.database.models import FraudAlert, Transaction  # noqa: E402
+from app.database.queries import insert_transaction  # noqa: E402
+from app.models.schemas import TransactionResponse  # noqa: E402
+
+
+def transaction_values(prefix: str, i: int) -> dict:
+    return {
+        "user_id": f"user_{i % 100}",
+        "transaction_id": f"{prefix}_{i}",
+        "amount": 100.0 + i,
+        "merchant": "Amazon",
+        "category": "Retail",
+        "location": None,
+        "latitude": 40.7128,
+        "longitude": -74.006,
+        "timestamp": datetime(2024, 6, 1, 12, 0, i % 60),
+        "is_fraud": True,
+        "risk_score": 82.5,
+        "fraud_reason": "Very large transaction amount; ML model indicates high fraud probability",
+    }
+
+
+def alert_row(values: dict) -> dict:
+    return {
+        "transaction_id": values["transaction_id"],
+        "user_id": values["user_id"],
+        "risk_score": values["risk_score"],
+        "alert_type": "critical",
+        "description": values["fraud_reason"],
+        "status": "pending",
+    }
+
+
+def alert_message(values: dict) -> dict:
+    return {"type": "fraud_alert", "data": {**alert_row(values), "timestamp": datetime.now().isoformat()}}
+
+
+def orm_store(db, values: dict):
+    transaction = Transaction(**values)
+    db.add(transaction)
+    db.add(FraudAlert(**alert_row(values)))
+    db.commit()
+    db.refresh(transaction)
+    return transaction
+
+
+def orm_serialize(transaction, values: dict, clients: int) -> bytes:
+    json.dumps(_to_response(transaction))
+    body = json.dumps(jsonable_encoder(TransactionResponse.model_validate(transaction))).encode()
+    message = alert_message(values)
+    for _ in range(clients):
+        json.dumps(message)
+    return body
+
+
+def fast_store(db, values: dict):
+    return insert_transaction(db, values, alert_row(values))
+
+
+def fast_serialize(row: dict, values: dict, clients: int) -> bytes:
+    body = orjson.dumps(_json_ready(row))
+    orjson.dumps(alert_message(values)).decode()
+    return body
+
+
+def run(name: str, store, serialize, n: int, clients: int):
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    db = SessionLocal()
+    event.listen(engine, "before_cursor_execute", count)
+    db_time = serialize_time = 0.0
+    bodies = []
+    try:
+        for i in range(n):
+            values = transaction_values(name, i)
+            started = time.perf_counter()
+            stored = store(db, values)
+            middle = time.perf_counter()
+            bodies.append(serialize(stored, values, clients))
+            serialize_time += time.perf_counter() - middle
+            db_time += middle - started
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+        db.close()
+    print(f"  {name:<5} {len(statements) / n:4.1f} statements/req   db {db_time / n * 1e6:7.1f} us   "
+          f"serialize {serialize_time / n * 1e6:6.1f} us   total {(db_time + serialize_time) / n * 1e6:7.1f} us")
+    return bodies
+
+
+def main(n=2000, clients=10):
+    Base.metadata.create_all(bind=engine)
+    print(f"{n} requests, {clients} WebSocket clients, {engine.dialect.name}")
+    orm_bodies = run("orm", orm_store, orm_serialize, n, clients)
+    fast_bodies = run("fast", fast_store, fast_serialize, n, clients)
+
+    for old, new in zip(orm_bodies, fast_bodies):
+        old, new = json.loads(old), json.loads(new)
+        for payload in (old, new):
+            payload.pop("id")
+            payload.pop("created_at")
+            payload["transaction_id"] = payload["transaction_id"].split("_", 1)[1]
+        assert old == new, (old, new)
+    print("  responses match")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+    )
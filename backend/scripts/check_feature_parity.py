@@ -0,0 +1,36 @@
+"""
+Check that training, single-transaction serving and batch serving produce
+identical feature matrices from the shared feature pipeline.
+
+Usage (from backend/):
+  python scripts/check_feature_parity.py [n_samples]
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.models.features import build_columns, default_pipeline  # noqa: E402
+from app.models.train_models import generate_synthetic_transactions, to_transaction_records  # noqa: E402
+
+
+def main(n_samples=2000):
+    df = generate_synthetic_transactions(n_samples=n_samples)
+    training = default_pipeline.transform(df)
+
+    transactions, profiles = to_transaction_records(df)
+    batch = default_pipeline.transform(build_columns(transactions, profiles))
+    single = np.vstack([
+        default_pipeline.transform_one(t, p) for t, p in zip(transactions, profiles)
+    ])
+
+    assert training.shape == batch.shape == single.shape, "Feature shapes differ"
+    np.testing.assert_allclose(training, batch, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(batch, single, rtol=0, atol=0)
+    print(f"Feature parity OK: {training.shape[0]} rows x {training.shape[1]} features")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,135 @@
+"""
+Check and benchmark the fraud-ring graph
+
+Links synthetic transactions (background users plus a few rings sharing a
+device), compares the incremental components with a from-scratch
+connected-components pass over the same edges, checks that a rebuild
+expires old edges without changing live components, and reports the
+per-transaction link cost, rebuild time and memory per node (keys,
+index and node arrays).
+
+It also replays a day of demo-like traffic (the 10 NYC users and 15
+merchants of demo_data_generator.py, one transaction every 2 s, 3% of
+users flagged on other evidence) and reports the component sizes and how
+often the ring rules would fire, which should be almost never.
+
+Usage (from backend/):
+  python scripts/check_fraud_graph.py [transactions]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.fraud_graph import _NODE_FIELDS, FraudGraph  # noqa: E402
+from app.services.rule_engine import RuleEngine  # noqa: E402
+
+
+def reference_users(graph: FraudGraph) -> dict:
+    """User count of every user's component, recomputed from the stored edges"""
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(graph._keys)
+    edges = (np.frombuffer(graph._edge_user, dtype=np.int32), np.frombuffer(graph._edge_entity, dtype=np.int32))
+    _, labels = connected_components(coo_matrix((np.ones(len(edges[0])), edges), shape=(n, n)), directed=False)
+    is_user = np.frombuffer(graph._is_user, dtype=np.int8).astype(bool)
+    users = np.bincount(labels, weights=is_user)
+    return {key: int(users[labels[i]]) for i, key in enumerate(graph._keys) if key.startswith("u:")}
+
+
+def incremental_users(graph: FraudGraph) -> dict:
+    return {key: graph._users[graph._find(i)] for i, key in enumerate(graph._keys) if key.startswith("u:")}
+
+
+def transactions(n: int, start: float, rng):
+    for i in range(n):
+        at = start + i * 0.01
+        if i % 100 == 0:
+            ring = (i // 100) % 20
+            yield {'user_id': f"ring{ring}_{i % 7}", 'merchant': f"shop_{ring}", 'amount': 900.0,
+                   'device_id': f"dev_{ring}", 'latitude': None, 'longitude': None}, at
+        else:
+            yield {'user_id': f"user_{rng.integers(n // 5)}", 'merchant': f"m_{rng.integers(5000)}",
+                   'amount': 20.0, 'latitude': float(rng.uniform(25, 49)),
+                   'longitude': float(rng.uniform(-124, -67))}, at
+
+
+def demo_traffic(n: int, start: float, rng):
+    """Transactions shaped like scripts/demo_data_generator.py"""
+    for i in range(n):
+        spread = 1.0 if rng.random() < 0.1 else 0.1
+        yield {'user_id': f"user_{rng.integers(1, 11)}", 'merchant': f"merchant_{rng.integers(15)}",
+               'amount': 50.0, 'latitude': 40.7128 + rng.uniform(-spread, spread),
+               'longitude': -74.0060 + rng.uniform(-spread, spread)}, start + i * 2.0
+
+
+def check_demo_traffic(rng):
+    """Ring features and ring rule hit rates on a day of ordinary traffic"""
+    graph = FraudGraph(enabled=True, rebuild_interval=0)
+    ring_rules = [rule for rule in RuleEngine().rule_set.rules if rule.uses_graph]
+    n = 43200
+    start = 1_700_000_000.0
+    rows = {name: [] for name in ('ring_size', 'ring_fraud_density', 'ring_growth')}
+    for transaction, at in demo_traffic(n, start, rng):
+        features = graph.link(transaction, now=at)
+        for name, values in rows.items():
+            values.append(features[name])
+        if rng.random() < 0.03:
+            graph.mark_fraud(transaction['user_id'], now=at)
+
+    columns = {name: np.asarray(values, dtype=np.float64) for name, values in rows.items()}
+    sizes = columns['ring_size']
+    print(f"Demo traffic, {n} transactions over a day: largest component {sizes.max():.0f} users, "
+          f"{np.mean(sizes >= 2) * 100:.2f}% of rows in a component of 2+, "
+          f"{np.mean(columns['ring_fraud_density'] > 0) * 100:.2f}% with fraud density > 0")
+    worst = 0.0
+    for rule in ring_rules:
+        with np.errstate(invalid="ignore"):
+            rate = float(np.mean(rule.predicate(columns))) * 100
+        worst = max(worst, rate)
+        print(f"  {rule.id}: fires on {rate:.2f}% of rows")
+    assert worst < 1.0, "ring rules fire on ordinary traffic"
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = np.random.default_rng(1)
+    graph = FraudGraph(enabled=True, window=n * 0.01 / 2, rebuild_interval=0)
+    start = 1_700_000_000.0
+
+    started = time.perf_counter()
+    for transaction, at in transactions(n, start, rng):
+        features = graph.link(transaction, now=at)
+        if transaction['user_id'].startswith("ring") and features['ring_size'] >= 3:
+            graph.mark_fraud(transaction['user_id'], now=at)
+    elapsed = time.perf_counter() - started
+    nodes = len(graph._keys)
+    memory = (sys.getsizeof(graph._index) + sys.getsizeof(graph._keys)
+              + sum(sys.getsizeof(key) for key in graph._keys)
+              + sum(sys.getsizeof(getattr(graph, f"_{name}")) for name in _NODE_FIELDS))
+    print(f"Linked {n} transactions: {elapsed / n * 1e6:.1f} us each, {nodes} nodes, "
+          f"{len(graph._edge_time)} edges, {memory / nodes:.0f} bytes per node")
+
+    assert incremental_users(graph) == reference_users(graph)
+    ring = graph.features("ring3_0", now=start + n * 0.01)
+    print(f"  ring component: {ring}")
+    assert ring['ring_size'] >= 7 and ring['ring_fraud_density'] > 0.5
+
+    started = time.perf_counter()
+    graph.rebuild(now=start + n * 0.01)
+    print(f"  rebuild: {time.perf_counter() - started:.2f}s, {len(graph._keys)} nodes and "
+          f"{len(graph._edge_time)} edges kept")
+    assert min(graph._edge_time) >= start + n * 0.01 / 2
+    assert incremental_users(graph) == reference_users(graph)
+    after = graph.features("ring3_0", now=start + n * 0.01)
+    assert after['ring_size'] >= 7 and after['ring_fraud_density'] > 0.5
+    check_demo_traffic(rng)
+    print("  OK")
+
+
+if __name__ == "__main__":
+    main()
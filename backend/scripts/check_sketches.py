@@ -0,0 +1,99 @@
+"""
+Check the streaming sketches against exact answers
+
+Compares HyperLogLog distinct counts and DDSketch quantiles with exact
+values on synthetic data, checks that sketches built on separate shards and
+merged match a single sketch, and that two workers sharing an embedded store
+see each other's buckets. Also reports the per-transaction observe cost.
+
+Usage (from backend/):
+  python scripts/check_sketches.py [transactions]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.redis_client import RedisClient  # noqa: E402
+from app.services import stream_analytics as analytics  # noqa: E402
+from app.services.sketches import DDSKETCH_RELATIVE_ACCURACY, DDSketch, HyperLogLog  # noqa: E402
+from app.services.store_backends import EmbeddedBackend  # noqa: E402
+
+
+def check_hll(n: int):
+    sketch, shards = HyperLogLog(), [HyperLogLog() for _ in range(4)]
+    for i in range(n):
+        sketch.add(f"user_{i}")
+        shards[i % 4].add(f"user_{i}")
+    merged = HyperLogLog()
+    for shard in shards:
+        merged.merge(shard)
+    assert merged.registers == sketch.registers
+    error = abs(sketch.estimate() - n) / n
+    print(f"  HyperLogLog: {n} distinct -> {sketch.estimate()} ({error:.2%} error)")
+    assert error < 0.05
+    assert HyperLogLog.decode(sketch.encode()).registers == sketch.registers
+
+
+def check_ddsketch(n: int):
+    rng = np.random.default_rng(7)
+    values = rng.lognormal(4, 1.5, n)
+    sketch, shards = DDSketch(), [DDSketch() for _ in range(4)]
+    for i, value in enumerate(values):
+        sketch.add(value)
+        shards[i % 4].add(value)
+    merged = DDSketch()
+    for shard in shards:
+        merged.merge(shard)
+    assert merged.bins == sketch.bins
+    for q in (0.5, 0.95, 0.99):
+        exact = np.quantile(values, q, method="lower")
+        estimate = sketch.quantile(q)
+        error = abs(estimate - exact) / exact
+        print(f"  DDSketch p{int(q * 100)}: exact {exact:.2f}, estimate {estimate:.2f} ({error:.2%} error)")
+        assert error <= DDSKETCH_RELATIVE_ACCURACY * 1.01
+    assert DDSketch.from_dict(sketch.to_dict()).bins == sketch.bins
+
+
+async def check_workers(n: int):
+    client = RedisClient(EmbeddedBackend(snapshot_path=None))
+    analytics.redis_client = client
+    workers = [analytics.StreamAnalytics(), analytics.StreamAnalytics()]
+    workers[1].worker_id += "-b"
+
+    now = time.time()
+    started = time.perf_counter()
+    for i in range(n):
+        workers[i % 2].observe(f"user_{i % 1000}", f"merchant_{i % 50}", f"cat_{i % 5}", 10.0 + i % 500, i % 100, now)
+    elapsed = time.perf_counter() - started
+    print(f"  observe: {elapsed / n * 1e6:.1f} us per transaction")
+
+    for worker in workers:
+        await worker.flush()
+    summaries = [await worker.refresh(now) for worker in workers]
+    assert summaries[0] == summaries[1]
+    window = summaries[0]["5m"]
+    assert window["transactions"] == n
+    assert abs(window["active_users"] - 1000) / 1000 < 0.05
+    assert abs(window["active_merchants"] - 50) <= 2
+    assert set(window["by_category"]) == {f"cat_{i}" for i in range(5)}
+    print(f"  two workers merged: {window['transactions']} transactions, "
+          f"{window['active_users']} users, risk p95 {window['risk_score']['p95']}")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("Sketch accuracy")
+    check_hll(n)
+    check_ddsketch(n)
+    print("Cross-worker merge")
+    asyncio.run(check_workers(n))
+    print("  OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Run the same store conformance checks against each backend
+
+Exercises RedisClient's profile, transaction cache and pub/sub operations,
+TTL expiry, and (for the embedded backend) snapshot round trips. The Redis
+backend is checked only when REDIS_URL is reachable. Also reports embedded
+lookup latency.
+
+Usage (from backend/):
+  python scripts/check_store_backends.py [embedded|redis ...]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.redis_client import RedisClient  # noqa: E402
+from app.services.store_backends import EmbeddedBackend, RedisBackend  # noqa: E402
+
+PROFILE = {
+    'user_id': 'user_1',
+    'transaction_count': 3,
+    'avg_amount': 42.5,
+    'typical_merchants': ['a', 'b'],
+    'locations': {'cells': [1, 2], 'counts': [3, 1], 'last_latitude': 40.7,
+                  'last_longitude': -74.0, 'last_seen': 1700000000.0},
+}
+
+
+async def check_client(client: RedisClient):
+    await client.update_user_profile('user_1', PROFILE)
+    assert await client.get_user_profile('user_1') == PROFILE
+    assert await client.get_user_profile('missing') is None
+
+    await client.cache_transaction('txn_1', {'amount': 10.0}, ttl=1)
+    assert await client.get_cached_transaction('txn_1') == {'amount': 10.0}
+    await asyncio.sleep(1.1)
+    assert await client.get_cached_transaction('txn_1') is None
+
+    await client.cache_transaction('txn_2', {'amount': 5.0}, ttl=60, encoded=b'{"amount":5.0}')
+    assert await client.get_cached_transaction('txn_2') == {'amount': 5.0}
+
+    await client.backend.set_many([(f"k{i}", {'i': i}) for i in range(10)], ttl=60)
+    assert await client.backend.get('k7') == {'i': 7}
+    await client.backend.delete('k7')
+    assert await client.backend.get('k7') is None
+
+    await client.set_counter('pending_alerts', 3)
+    assert await client.incr_counter('pending_alerts', 2) == 5
+    assert await client.incr_counter('pending_alerts', -1) == 4
+    assert await client.get_counter('pending_alerts') == 4
+
+    received = []
+
+    async def on_message(message):
+        received.append(message)
+
+    await client.subscribe('fraud_alerts', on_message)
+    await asyncio.sleep(0.1)
+    await client.publish_alert('fraud_alerts', {'alert_id': 1})
+    for _ in range(20):
+        if received:
+            break
+        await asyncio.sleep(0.05)
+    assert received == [{'alert_id': 1}], received
+
+
+async def check_embedded():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'store.snapshot')
+        client = RedisClient(EmbeddedBackend(path, snapshot_interval=0))
+        await client.connect()
+        await check_client(client)
+        await client.cache_transaction('short', {'x': 1}, ttl=1)
+        for i in range(100000):
+            await client.update_user_profile(f"bulk_{i}", {'user_id': f"bulk_{i}", 'avg_amount': i})
+        await client.backend.snapshot()
+        assert await client.get_user_profile('bulk_5') == {'user_id': 'bulk_5', 'avg_amount': 5}
+        await client.disconnect()
+
+        await asyncio.sleep(1.1)
+        started = time.perf_counter()
+        restored = RedisClient(EmbeddedBackend(path, snapshot_interval=0))
+        await restored.connect()
+        print(f"  startup from snapshot ({os.path.getsize(path)} bytes): "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms")
+        assert await restored.get_user_profile('user_1') == PROFILE
+        assert await restored.get_user_profile('bulk_99999') == {'user_id': 'bulk_99999', 'avg_amount': 99999}
+        assert await restored.get_cached_transaction('short') is None
+
+        # A key deleted while a snapshot is written stays deleted, and
+        # undecoded entries stay undecoded in the new file
+        backend = restored.backend
+        lazy_before = len(backend._lazy)
+        writing = asyncio.create_task(backend.snapshot())
+        await asyncio.sleep(0)
+        await backend.delete('user_profile:bulk_7')
+        await writing
+        assert await restored.get_user_profile('bulk_7') is None
+        assert len(backend._lazy) >= lazy_before - 10, (lazy_before, len(backend._lazy))
+        assert await restored.get_user_profile('bulk_99998') == {'user_id': 'bulk_99998', 'avg_amount': 99998}
+        await backend.snapshot()
+        backend.load_snapshot()
+        assert await restored.get_user_profile('bulk_7') is None
+
+        backend.get_local('user_profile:bulk_1')
+        n = 1000000
+        started = time.perf_counter()
+        for _ in range(n):
+            backend.get_local('user_profile:bulk_1')
+        print(f"  local profile lookup: {(time.perf_counter() - started) / n * 1e9:.0f} ns")
+        await restored.disconnect()
+
+
+async def check_redis():
+    client = RedisClient(RedisBackend())
+    try:
+        await client.connect()
+        await client.backend.redis_client.ping()
+    except Exception as e:
+        print(f"  skipped: Redis not reachable ({e})")
+        return False
+    await check_client(client)
+    await client.backend.delete('user_profile:user_1', 'counter:pending_alerts', *[f"k{i}" for i in range(10)])
+    await client.disconnect()
+    return True
+
+
+async def main(backends):
+    for name in backends:
+        print(f"{name}:")
+        if name == 'embedded':
+            await check_embedded()
+        elif not await check_redis():
+            continue
+        print("  OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:] or ['embedded', 'redis']))
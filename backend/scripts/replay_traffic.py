@@ -0,0 +1,199 @@
+"""
+Replay captured API traffic against a running build
+
+Reads a capture written with TRAFFIC_CAPTURE_PATH set (see
+app/services/traffic_capture.py) and sends the same requests to --target,
+either at the original pacing (--speed 1), N times faster (--speed N) or as
+fast as --concurrency allows (--speed 0). Reports latency percentiles and
+errors per endpoint, and for every scored transaction compares risk_score
+and is_fraud with the captured response, or with a previous replay's
+results when --baseline is given.
+
+For comparable scores, replay into a fresh database (transaction ids must
+not already exist) and run both builds with SCORING_MODE=seeded, the
+same SCORING_SEED and CASCADE_DEADLINE_MS left at 0 (with a latency budget, which
+model stages run depends on timing). Scores still depend on per-user state (profiles,
+velocity, fraud-ring graph), so compare runs replayed the same way:
+--concurrency 1 keeps the captured order, higher concurrency can reorder
+requests for a user and shift their scores. Transactions captured without a
+timestamp are stamped by the server at arrival, so velocity features can
+also shift when replaying at a different speed.
+
+Usage (from backend/):
+  python scripts/replay_traffic.py capture.jsonl --target http://localhost:8000 \\
+      [--speed 1] [--concurrency 32] [--output results.jsonl] [--baseline previous.jsonl]
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import aiohttp
+import numpy as np
+
+# Score differences above this are listed individually
+SCORE_TOLERANCE = 0.01
+
+
+def load_capture(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def scored(record: Dict) -> Optional[Dict]:
+    """transaction_id, risk_score and is_fraud of a transaction response"""
+    response = record.get('response')
+    if not isinstance(response, dict) or 'risk_score' not in response or 'transaction_id' not in response:
+        return None
+    return {
+        'transaction_id': response['transaction_id'],
+        'risk_score': response['risk_score'],
+        'is_fraud': response.get('is_fraud'),
+    }
+
+
+async def send(session: aiohttp.ClientSession, target: str, record: Dict) -> Dict:
+    url = target.rstrip("/") + record['path']
+    if record.get('query'):
+        url += "?" + record['query']
+    body = record.get('body')
+    kwargs = {}
+    if isinstance(body, (dict, list)):
+        kwargs['json'] = body
+    elif body is not None:
+        kwargs['data'] = body.encode("utf-8")
+
+    result = {'method': record['method'], 'path': record['path'], 'status': None, 'error': None}
+    started = time.perf_counter()
+    try:
+        async with session.request(record['method'], url, **kwargs) as response:
+            result['status'] = response.status
+            text = await response.text()
+    except Exception as e:
+        result['error'] = str(e)
+        text = None
+    result['latency_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    if text:
+        try:
+            result['response'] = json.loads(text)
+        except ValueError:
+            result['response'] = None
+    score = scored(result)
+    result.pop('response', None)
+    if score is not None:
+        result.update(score)
+    return result
+
+
+async def replay(records: List[Dict], target: str, speed: float, concurrency: int) -> List[Dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+    first = records[0]['ts']
+    started = time.perf_counter()
+
+    async def run(record: Dict):
+        if speed > 0:
+            delay = (record['ts'] - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        async with semaphore:
+            return await send(session, target, record)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*[run(record) for record in records])
+
+
+def failed(result: Dict) -> bool:
+    return result['error'] is not None or result['status'] is None or result['status'] >= 400
+
+
+def endpoint(method: str, path: str) -> str:
+    """Per-id paths such as /api/transactions/txn_1 are reported together"""
+    parts = path.split("/")
+    if len(parts) > 3 and any(ch.isdigit() for ch in parts[-1]):
+        parts[-1] = "{id}"
+    return f"{method} {'/'.join(parts)}"
+
+
+def report_latency(results: List[Dict], elapsed: float):
+    by_endpoint = defaultdict(list)
+    for result in results:
+        by_endpoint[endpoint(result['method'], result['path'])].append(result)
+
+    errors = sum(1 for result in results if failed(result))
+    print(f"Replayed {len(results)} requests in {elapsed:.1f}s "
+          f"({len(results) / elapsed:.0f} req/s), {errors} errors")
+    print(f"  {'endpoint':<40} {'count':>7} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for key, rows in sorted(by_endpoint.items()):
+        latencies = np.array([row['latency_ms'] for row in rows])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"  {key:<40} {len(rows):>7} {sum(1 for row in rows if failed(row)):>7} "
+              f"{p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {latencies.max():>8.1f}")
+
+
+def report_scores(results: List[Dict], reference: Dict[str, Dict], label: str):
+    current = {result['transaction_id']: result for result in results if 'transaction_id' in result}
+    common = [tid for tid in current if tid in reference]
+    if not common:
+        print(f"No scored transactions to compare with the {label}")
+        return
+    diffs = np.array([abs(current[tid]['risk_score'] - reference[tid]['risk_score']) for tid in common])
+    flips = [tid for tid in common if current[tid]['is_fraud'] != reference[tid]['is_fraud']]
+    changed = [tid for tid, diff in zip(common, diffs) if diff > SCORE_TOLERANCE]
+    print(f"Scores vs {label}: {len(common)} transactions compared, "
+          f"{len(current) - len(common)} missing from the {label}")
+    print(f"  risk_score abs diff: mean {diffs.mean():.3f}, max {diffs.max():.3f}, "
+          f"{len(changed)} above {SCORE_TOLERANCE}")
+    print(f"  is_fraud flips: {len(flips)}")
+    for tid in changed[:10]:
+        print(f"    {tid}: {reference[tid]['risk_score']} -> {current[tid]['risk_score']} "
+              f"(is_fraud {reference[tid]['is_fraud']} -> {current[tid]['is_fraud']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured API traffic")
+    parser.add_argument("capture", help="JSONL file written by the capture middleware")
+    parser.add_argument("--target", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 = original pacing, N = N times faster, 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", help="write per-request results to this JSONL file")
+    parser.add_argument("--baseline", help="results of a previous replay to compare scores with")
+    args = parser.parse_args()
+
+    records = load_capture(args.capture)
+    if not records:
+        print("Capture is empty")
+        return
+
+    started = time.perf_counter()
+    results = asyncio.run(replay(records, args.target, args.speed, args.concurrency))
+    report_latency(results, time.perf_counter() - started)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = [json.loads(line) for line in f if line.strip()]
+        reference = {row['transaction_id']: row for row in baseline if 'transaction_id' in row}
+        report_scores(results, reference, "baseline")
+    else:
+        reference = {}
+        for record in records:
+            score = scored(record)
+            if score is not None:
+                reference[score['transaction_id']] = score
+        report_scores(results, reference, "capture")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()